@@ -1,10 +1,19 @@
+from collections import OrderedDict, deque
 from datetime import datetime, timedelta
+import hashlib
+import re
 import sqlite3
+import threading
 import qrcode
 from PIL import Image
 import cv2
 import numpy as np
 
+DB = "fittings.db"
+
+# Rows scored and written per transaction by the risk recompute
+RECOMPUTE_CHUNK_SIZE = 5000
+
 # === Risk keywords ===
 RISK_KEYWORDS = {
     "leak": "High",
@@ -20,32 +29,86 @@ RISK_KEYWORDS = {
     "perfect fittings": "Low"
 }
 
+# Words that make a note High risk on their own
+BAD_WORDS = ["bad", "worse", "poor", "bad fit", "bad fittings"]
+
+_SEVERITY = {"Low": 0, "Medium": 1, "High": 2}
+
+# Distinct notes texts whose risk level is memoized
+NOTES_CACHE_SIZE = 4096
+
+def _compile_notes_pattern():
+    """
+    Compile BAD_WORDS and RISK_KEYWORDS into one regex. Each keyword is a
+    substring match (as with `word in text`); the lookahead makes every
+    position of the text a match candidate so overlapping keywords are all
+    seen, and alternatives are ordered so the most severe one is reported at
+    each position.
+    """
+    levels = {word: "High" for word in BAD_WORDS}
+    for word, risk in RISK_KEYWORDS.items():
+        levels.setdefault(word, risk)
+    groups = []
+    for risk in sorted(_SEVERITY, key=_SEVERITY.get, reverse=True):
+        words = sorted((w for w, r in levels.items() if r == risk), key=len, reverse=True)
+        if words:
+            groups.append(f"(?P<{risk}>{'|'.join(re.escape(w) for w in words)})")
+    return re.compile(f"(?=(?:{'|'.join(groups)}))")
+
+_NOTES_PATTERN = _compile_notes_pattern()
+_notes_cache = OrderedDict()
+_notes_cache_lock = threading.Lock()
+
+def _classify_notes(text):
+    level = None
+    for match in _NOTES_PATTERN.finditer(text.lower()):
+        if level is None or _SEVERITY[match.lastgroup] > _SEVERITY[level]:
+            level = match.lastgroup
+            if level == "High":
+                break
+    return level or "Low"
+
 def notes_risk_level(notes):
+    """Risk level implied by free-text notes; the most severe keyword found wins."""
     if not notes:
         return "Low"
-    text = notes.lower()
-    if any(word in text for word in ["bad", "worse", "poor", "bad fit", "bad fittings"]):
-        return "High"
-    for word, risk in RISK_KEYWORDS.items():
-        if word in text:
-            return risk
-    return "Low"
+    key = hashlib.blake2b(notes.encode("utf-8"), digest_size=16).digest()
+    with _notes_cache_lock:
+        level = _notes_cache.get(key)
+        if level is not None:
+            _notes_cache.move_to_end(key)
+            return level
+    level = _classify_notes(notes)
+    with _notes_cache_lock:
+        _notes_cache[key] = level
+        if len(_notes_cache) > NOTES_CACHE_SIZE:
+            _notes_cache.popitem(last=False)
+    return level
 
-def get_failure_count(uid):
+def notes_risk_levels(notes_list):
+    """notes_risk_level for a list of notes, classifying each distinct text once."""
+    levels = {notes: notes_risk_level(notes) for notes in set(notes_list)}
+    return [levels[notes] for notes in notes_list]
+
+def get_failure_count(uid, db_path=DB):
     """Get failure_count directly from fittings table"""
-    conn = sqlite3.connect("fittings.db")
+    conn = sqlite3.connect(db_path)
     c = conn.cursor()
     c.execute("SELECT failure_count FROM fittings WHERE uid=?", (uid,))
     result = c.fetchone()
     conn.close()
     return result[0] if result else 0
 
-def get_vendor_risk(vendor_id):
-    conn = sqlite3.connect("fittings.db")
+def get_vendor_risk(vendor_id, db_path=DB):
+    """Vendor risk tier from the trigger-maintained vendor_stats table."""
+    conn = sqlite3.connect(db_path)
     c = conn.cursor()
-    c.execute("SELECT SUM(failure_count) FROM fittings WHERE vendor_id=?", (vendor_id,))
-    total_failures = c.fetchone()[0] or 0
+    c.execute("SELECT tier FROM vendor_stats WHERE vendor_id=?", (vendor_id,))
+    result = c.fetchone()
     conn.close()
+    return result[0] if result else "Low"
+
+def vendor_risk_from_failures(total_failures):
     if total_failures >= 10:
         return "High"
     elif total_failures >= 5:
@@ -146,43 +209,589 @@ def calculate_dates(manufactor_date, supply_date, warranty_end_str, risk):
     return inspection_date.isoformat(), repair_date.isoformat()
 
 
-def update_all_risks():
-    conn = sqlite3.connect("fittings.db")
+# === Batch (vectorized) risk scoring ===
+# Risk tiers as integer codes; RISK_UNKNOWN is what get_risk_level reports as "Unknown"
+RISK_LEVELS = ("Low", "Medium", "High")
+RISK_CODES = {level: code for code, level in enumerate(RISK_LEVELS)}
+RISK_UNKNOWN = -1
+
+# Day-ordinal sentinels (real dates are date.toordinal() >= 1)
+DATE_MISSING = 0
+DATE_INVALID = -1
+
+_EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+
+def date_ordinals(values):
+    """
+    Convert "%Y-%m-%d" strings to an int64 array of day ordinals. Empty values
+    map to DATE_MISSING and unparseable ones to DATE_INVALID. Each distinct
+    string is parsed once.
+    """
+    cache = {}
+    out = np.empty(len(values), dtype=np.int64)
+    for i, value in enumerate(values):
+        ordinal = cache.get(value)
+        if ordinal is None:
+            if not value:
+                ordinal = DATE_MISSING
+            else:
+                try:
+                    ordinal = datetime.strptime(value, "%Y-%m-%d").toordinal()
+                except Exception:
+                    ordinal = DATE_INVALID
+            cache[value] = ordinal
+        out[i] = ordinal
+    return out
+
+def ordinals_to_iso(ordinals):
+    """Inverse of date_ordinals: ISO date strings, None where the ordinal is a sentinel."""
+    ordinals = np.asarray(ordinals, dtype=np.int64)
+    iso = (ordinals - _EPOCH_ORDINAL).astype("datetime64[D]").astype(str)
+    return [s if o > 0 else None for s, o in zip(iso.tolist(), ordinals.tolist())]
+
+def notes_risk_codes(notes_list):
+    """notes_risk_levels as an int8 array of risk codes."""
+    return np.array([RISK_CODES[level] for level in notes_risk_levels(notes_list)], dtype=np.int8)
+
+def score_risk_batch(warranty_end, failure_count, notes_risk, manufactor_date, supply_date, today=None):
+    """
+    Vectorized get_risk_level + calculate_dates over columnar inputs.
+
+    warranty_end, manufactor_date and supply_date are day-ordinal arrays (see
+    date_ordinals), failure_count is an integer array with -1 for NULL and
+    notes_risk holds risk codes (see notes_risk_codes). today is a day ordinal
+    and defaults to the current date.
+
+    Returns (risk, risk_flag, inspection_date, repair_date) arrays. risk holds
+    codes into RISK_LEVELS or RISK_UNKNOWN; the dates are day ordinals and are
+    DATE_MISSING for unknown rows, for which calculate_dates has no answer.
+    Results match the row-by-row functions exactly.
+    """
+    warranty_end = np.asarray(warranty_end, dtype=np.int64)
+    failure_count = np.asarray(failure_count, dtype=np.int64)
+    notes_risk = np.asarray(notes_risk, dtype=np.int8)
+    manufactor_date = np.asarray(manufactor_date, dtype=np.int64)
+    supply_date = np.asarray(supply_date, dtype=np.int64)
+    if today is None:
+        today = datetime.today().toordinal()
+
+    has_warranty = warranty_end > 0
+    has_supply = supply_date > 0
+
+    # --- Risk tier ---
+    days_remaining = warranty_end - today
+    warranty_risk = np.where(days_remaining <= 29, 2, np.where(days_remaining <= 120, 1, 0))
+    failure_risk = np.where(failure_count >= 3, 2, np.where(failure_count == 2, 1, 0))
+    risk = np.maximum(np.maximum(warranty_risk, failure_risk), notes_risk).astype(np.int8)
+    # get_risk_level fails (-> "Unknown") without a parseable warranty_end or with a NULL failure_count
+    known = has_warranty & (failure_count >= 0)
+    risk[~known] = RISK_UNKNOWN
+    risk_flag = (risk == 2).astype(np.int8)
+
+    # --- Inspection date: manufactor_date, else supply_date, else today ---
+    base_date = np.where(manufactor_date != DATE_MISSING,
+                         np.where(manufactor_date > 0, manufactor_date, today),
+                         np.where(has_supply, supply_date, today))
+    interval = np.array([180, 90, 30], dtype=np.int64)
+    inspection_date = base_date + interval[np.clip(risk, 0, 2)]
+    inspection_date = np.where(has_supply & (inspection_date <= supply_date), supply_date + 1, inspection_date)
+
+    # --- Repair date ---
+    low_repair = np.where(has_warranty, warranty_end, today + 365)
+    repair_date = np.where(risk == 2, today + 60, np.where(risk == 1, today + 120, low_repair))
+
+    # --- Clamp to warranty end ---
+    inspection_date = np.where(has_warranty, np.minimum(inspection_date, warranty_end), inspection_date)
+    repair_date = np.where(has_warranty, np.minimum(repair_date, warranty_end), repair_date)
+
+    inspection_date[~known] = DATE_MISSING
+    repair_date[~known] = DATE_MISSING
+    return risk, risk_flag, inspection_date, repair_date
+
+
+# === Risk recompute ===
+# Columns used to track which fittings need rescoring. risk_dirty is set by a
+# trigger whenever a risk input changes; risk_review_date is the next day on
+# which the warranty part of get_risk_level moves to a higher tier.
+RISK_TRACKING_COLUMNS = {
+    "risk_dirty": "INTEGER DEFAULT 1",
+    "risk_review_date": "TEXT"
+}
+
+# Integer day-number shadows of the TEXT date columns, as generated columns so
+# SQLite keeps them in sync on every write. Values follow date_ordinals:
+# date.toordinal() for anything strptime("%Y-%m-%d") accepts (including
+# unpadded "2024-3-5"), DATE_MISSING for NULL/"" and DATE_INVALID otherwise.
+DAY_COLUMNS = {
+    "supply_date": "supply_day",
+    "warranty_end": "warranty_end_day",
+    "manufactor_date": "manufactor_day",
+    "inspection_date": "inspection_day",
+    "repair_date": "repair_day"
+}
+# Day columns used for range scheduling queries
+INDEXED_DAY_COLUMNS = ("warranty_end_day", "inspection_day", "repair_day")
+
+# Next inspection: the scheduled inspection, else the repair date plus a
+# risk-dependent interval, else DATE_MISSING ("Not scheduled")
+NEXT_INSPECTION_SQL = (
+    "CASE WHEN inspection_day > 0 THEN inspection_day "
+    "WHEN repair_day > 0 THEN repair_day + CASE risk WHEN 'High' THEN 90 WHEN 'Medium' THEN 180 ELSE 365 END "
+    f"ELSE {DATE_MISSING} END"
+)
+
+def _day_number_sql(col):
+    # Mirrors strptime's %Y-%m-%d fields: four digits (not year 0), a month of
+    # 1[0-2]|0[1-9]|[1-9] and a day of 3[01]|[12]\d|0[1-9]|[1-9]| [1-9], with
+    # nothing after it. The parts are re-padded to ISO and round-tripped through
+    # julianday to reject days like 2024-02-30. julianday('0001-01-01') is
+    # 1721425.5, date.toordinal() of that day is 1.
+    rest = f"substr({col}, 6)"
+    month = f"substr({rest}, 1, instr({rest}, '-') - 1)"
+    day = f"substr({rest}, instr({rest}, '-') + 1)"
+    iso = f"(substr({col}, 1, 5) || printf('%02d-%02d', CAST({month} AS INTEGER), CAST({day} AS INTEGER)))"
+    month_ok = " OR ".join(f"{month} GLOB '{p}'" for p in ("1[0-2]", "0[1-9]", "[1-9]"))
+    day_ok = " OR ".join(f"{day} GLOB '{p}'" for p in ("3[01]", "[12][0-9]", "0[1-9]", "[1-9]", " [1-9]"))
+    return (f"CASE WHEN {col} IS NULL OR {col} = '' THEN {DATE_MISSING} "
+            f"WHEN substr({col}, 1, 5) GLOB '[0-9][0-9][0-9][0-9]-' AND substr({col}, 1, 4) <> '0000' "
+            f"AND ({month_ok}) AND ({day_ok}) AND date(julianday({iso})) IS {iso} "
+            f"THEN CAST(julianday({iso}) - 1721424.5 AS INTEGER) "
+            f"ELSE {DATE_INVALID} END")
+
+# SQL twin of vendor_risk_from_failures
+_VENDOR_TIER_SQL = "CASE WHEN failure_sum >= 10 THEN 'High' WHEN failure_sum >= 5 THEN 'Medium' ELSE 'Low' END"
+
+# Adds one fitting row (NEW or OLD) into vendor_stats with the given sign
+_VENDOR_STATS_APPLY = """
+    INSERT OR IGNORE INTO vendor_stats (vendor_id) SELECT {row}.vendor_id WHERE {row}.vendor_id IS NOT NULL;
+    UPDATE vendor_stats
+    SET failure_sum = failure_sum {sign} COALESCE({row}.failure_count, 0),
+        high_risk_count = high_risk_count {sign} (COALESCE({row}.risk_flag, 0) = 1),
+        fitting_count = fitting_count {sign} 1
+    WHERE vendor_id = {row}.vendor_id;
+"""
+
+def _drop_stale_day_columns(conn, existing_cols):
+    """
+    Drop day columns generated by an older _day_number_sql (and everything
+    built on them) so ensure_risk_schema re-adds them, and mark every row for
+    rescoring. Returns True if anything was dropped.
+    """
     c = conn.cursor()
-    c.execute("SELECT uid, warranty_end, notes, vendor_id, manufactor_date, supply_date FROM fittings")
-    rows = c.fetchall()
-
-    for uid, warranty_end, notes, vendor_id, manufactor_date, supply_date in rows:
-        failure_count = get_failure_count(uid)
-        payload = {
-            "uid": uid,
-            "warranty_end": warranty_end,
-            "notes": notes,
-            "failure_count": failure_count
-        }
-        risk = get_risk_level(payload)
-        risk_flag = 1 if risk == "High" else 0
+    c.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='fittings'")
+    table_sql = c.fetchone()[0]
+    stale = [day_col for date_col, day_col in DAY_COLUMNS.items()
+             if day_col in existing_cols and _day_number_sql(date_col) not in table_sql]
+    if not stale:
+        return False
+    c.execute("DROP VIEW IF EXISTS fittings_live")
+    for index in ("due", "vendor_due", "risk_due") + INDEXED_DAY_COLUMNS:
+        c.execute(f"DROP INDEX IF EXISTS idx_fittings_{index}")
+    if "next_inspection_day" in existing_cols:
+        c.execute("ALTER TABLE fittings DROP COLUMN next_inspection_day")
+    for day_col in DAY_COLUMNS.values():
+        if day_col in existing_cols:
+            c.execute(f"ALTER TABLE fittings DROP COLUMN {day_col}")
+    c.execute("UPDATE fittings SET risk_dirty = 1")
+    print(f"[DB] Rebuilding day columns with the current date parser: {', '.join(stale)}")
+    return True
+
+def ensure_risk_schema(conn):
+    """
+    Add the day-number and dirty-tracking columns, indexes and triggers used
+    by the risk recompute, the trigger-maintained vendor_stats table and the
+    fittings_live view that reads vendor risk from it.
+    """
+    c = conn.cursor()
+    c.execute("PRAGMA table_xinfo(fittings)")
+    existing_cols = {row[1] for row in c.fetchall()}
+    for col, coltype in RISK_TRACKING_COLUMNS.items():
+        if col not in existing_cols:
+            c.execute(f"ALTER TABLE fittings ADD COLUMN {col} {coltype}")
+            print(f"[DB] Added missing column: {col}")
+    if _drop_stale_day_columns(conn, existing_cols):
+        existing_cols -= set(DAY_COLUMNS.values()) | {"next_inspection_day"}
+    for date_col, day_col in DAY_COLUMNS.items():
+        if day_col not in existing_cols:
+            c.execute(f"ALTER TABLE fittings ADD COLUMN {day_col} INTEGER "
+                      f"GENERATED ALWAYS AS ({_day_number_sql(date_col)}) VIRTUAL")
+            print(f"[DB] Added missing column: {day_col}")
+    for day_col in INDEXED_DAY_COLUMNS:
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_fittings_{day_col} ON fittings({day_col})")
+
+    # Due queue: next_inspection_day plus (optional filter, day, uid) indexes for keyset paging
+    if "next_inspection_day" not in existing_cols:
+        c.execute(f"ALTER TABLE fittings ADD COLUMN next_inspection_day INTEGER "
+                  f"GENERATED ALWAYS AS ({NEXT_INSPECTION_SQL}) VIRTUAL")
+        print("[DB] Added missing column: next_inspection_day")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_fittings_due ON fittings(next_inspection_day, uid)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_fittings_vendor_due ON fittings(vendor_id, next_inspection_day, uid)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_fittings_risk_due ON fittings(risk, next_inspection_day, uid)")
+
+    c.execute("CREATE INDEX IF NOT EXISTS idx_fittings_risk_dirty ON fittings(risk_dirty) WHERE risk_dirty = 1")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_fittings_risk_review ON fittings(risk_review_date)")
 
-        inspection_date, repair_date = calculate_dates(manufactor_date, supply_date, warranty_end, risk)
+    c.execute("DROP TRIGGER IF EXISTS fittings_mark_risk_dirty")
+    c.execute("""
+        CREATE TRIGGER fittings_mark_risk_dirty
+        AFTER UPDATE OF notes, failure_count, warranty_end, manufactor_date, supply_date ON fittings
+        WHEN NEW.risk_dirty = 0
+        BEGIN
+            UPDATE fittings SET risk_dirty = 1 WHERE uid = NEW.uid;
+        END
+    """)
 
-        # --- Update row ---
-        c.execute("""
-            UPDATE fittings
-            SET risk=?, risk_flag=?, failure_count=?, inspection_date=?, repair_date=?
-            WHERE uid=?
-        """, (risk, risk_flag, failure_count, inspection_date, repair_date, uid))
+    # --- Vendor aggregates, maintained by triggers on every fittings write ---
+    c.execute("DROP TRIGGER IF EXISTS fittings_log_failures_insert")
+    c.execute("DROP TRIGGER IF EXISTS fittings_log_failures_update")
+    c.execute("DROP TRIGGER IF EXISTS fittings_log_failures_delete")
+    c.execute("DROP TABLE IF EXISTS vendor_failure_log")
 
-        # --- Update vendor risk ---
-        vendor_risk = get_vendor_risk(vendor_id)
-        c.execute("UPDATE fittings SET vendor_risk=? WHERE vendor_id=?", (vendor_risk, vendor_id))
+    c.execute("PRAGMA table_xinfo(vendor_stats)")
+    if "tier" not in {row[1] for row in c.fetchall()}:
+        c.execute("DROP TABLE IF EXISTS vendor_stats")
+        c.execute(f"""
+            CREATE TABLE vendor_stats (
+                vendor_id TEXT PRIMARY KEY,
+                failure_sum INTEGER NOT NULL DEFAULT 0,
+                high_risk_count INTEGER NOT NULL DEFAULT 0,
+                fitting_count INTEGER NOT NULL DEFAULT 0,
+                tier TEXT GENERATED ALWAYS AS ({_VENDOR_TIER_SQL}) VIRTUAL
+            )
+        """)
+        _rebuild_vendor_stats(conn)
 
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS fittings_vendor_stats_insert
+        AFTER INSERT ON fittings
+        BEGIN
+            {_VENDOR_STATS_APPLY.format(row="NEW", sign="+")}
+        END
+    """)
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS fittings_vendor_stats_update
+        AFTER UPDATE OF failure_count, risk_flag, vendor_id ON fittings
+        WHEN OLD.failure_count IS NOT NEW.failure_count
+          OR OLD.risk_flag IS NOT NEW.risk_flag
+          OR OLD.vendor_id IS NOT NEW.vendor_id
+        BEGIN
+            {_VENDOR_STATS_APPLY.format(row="OLD", sign="-")}
+            {_VENDOR_STATS_APPLY.format(row="NEW", sign="+")}
+        END
+    """)
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS fittings_vendor_stats_delete
+        AFTER DELETE ON fittings
+        BEGIN
+            {_VENDOR_STATS_APPLY.format(row="OLD", sign="-")}
+        END
+    """)
+    conn.commit()
+    refresh_fittings_view(conn)
+
+def refresh_fittings_view(conn):
+    """
+    (Re)create fittings_live: every fittings column, with vendor_risk read
+    from vendor_stats instead of the value stored when the row was written.
+    Call again after adding columns to fittings.
+    """
+    c = conn.cursor()
+    # table_xinfo so the generated day columns are included
+    c.execute("PRAGMA table_xinfo(fittings)")
+    columns = [
+        "COALESCE(vs.tier, f.vendor_risk) AS vendor_risk" if row[1] == "vendor_risk" else f"f.{row[1]}"
+        for row in c.fetchall()
+    ]
+    view_sql = (f"CREATE VIEW fittings_live AS SELECT {', '.join(columns)} "
+                "FROM fittings f LEFT JOIN vendor_stats vs ON vs.vendor_id = f.vendor_id")
+    c.execute("SELECT sql FROM sqlite_master WHERE type='view' AND name='fittings_live'")
+    current = c.fetchone()
+    if current and current[0] == view_sql:
+        return
+    c.execute("DROP VIEW IF EXISTS fittings_live")
+    c.execute(view_sql)
     conn.commit()
+
+def _rebuild_vendor_stats(conn):
+    conn.execute("DELETE FROM vendor_stats")
+    conn.execute("""
+        INSERT INTO vendor_stats (vendor_id, failure_sum, high_risk_count, fitting_count)
+        SELECT vendor_id, COALESCE(SUM(failure_count), 0),
+               SUM(COALESCE(risk_flag, 0) = 1), COUNT(*)
+        FROM fittings WHERE vendor_id IS NOT NULL GROUP BY vendor_id
+    """)
+
+def risk_review_ordinals(warranty_end, today=None):
+    """
+    Next day ordinal on which the warranty tier of get_risk_level changes
+    (Low -> Medium at 120 days remaining, Medium -> High at 29), or
+    DATE_MISSING where it never will.
+    """
+    warranty_end = np.asarray(warranty_end, dtype=np.int64)
+    if today is None:
+        today = datetime.today().toordinal()
+    to_medium = warranty_end - 120
+    to_high = warranty_end - 29
+    review = np.where(to_medium > today, to_medium, np.where(to_high > today, to_high, DATE_MISSING))
+    return np.where(warranty_end > 0, review, DATE_MISSING)
+
+_RECOMPUTE_COLUMNS = "uid, warranty_end_day, notes, failure_count, manufactor_day, supply_day"
+
+def _rescore_rows(conn, rows):
+    """Score fetched rows in one batch and write the results back, clearing their dirty flag."""
+    if not rows:
+        return 0
+    uids, warranty_ord, notes, failure_count, manufactor_ord, supply_ord = zip(*rows)
+    today = datetime.today().toordinal()
+    risk, risk_flag, inspection_ord, repair_ord = score_risk_batch(
+        warranty_ord,
+        [-1 if n is None else n for n in failure_count],
+        notes_risk_codes(notes),
+        manufactor_ord,
+        supply_ord,
+        today=today
+    )
+
+    # "Unknown" rows have no dates (None) and keep the stored ones
+    updates = zip(
+        [RISK_LEVELS[code] if code >= 0 else "Unknown" for code in risk.tolist()],
+        risk_flag.tolist(),
+        ordinals_to_iso(inspection_ord),
+        ordinals_to_iso(repair_ord),
+        ordinals_to_iso(risk_review_ordinals(warranty_ord, today)),
+        uids
+    )
+    conn.executemany("""
+        UPDATE fittings
+        SET risk=?, risk_flag=?,
+            inspection_date=COALESCE(?, inspection_date), repair_date=COALESCE(?, repair_date),
+            risk_dirty=0, risk_review_date=?
+        WHERE uid=?
+    """, updates)
+    return len(uids)
+
+def update_all_risks(db_path=DB, chunk_size=RECOMPUTE_CHUNK_SIZE):
+    """
+    Recompute risk and inspection/repair dates for every fitting, and rebuild
+    vendor_stats from scratch. The table is walked once in uid order,
+    chunk_size rows per transaction, so the write lock is released between
+    chunks.
+    """
+    conn = sqlite3.connect(db_path)
+    ensure_risk_schema(conn)
+
+    conn.execute("BEGIN IMMEDIATE")
+    _rebuild_vendor_stats(conn)
+    conn.commit()
+
+    last_uid = ""
+    while True:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(f"SELECT {_RECOMPUTE_COLUMNS} FROM fittings WHERE uid > ? ORDER BY uid LIMIT ?",
+                            (last_uid, chunk_size)).fetchall()
+        _rescore_rows(conn, rows)
+        conn.commit()
+        if len(rows) < chunk_size:
+            break
+        last_uid = rows[-1][0]
+
     conn.close()
 
+def update_dirty_risks(db_path=DB, chunk_size=RECOMPUTE_CHUNK_SIZE):
+    """
+    Incremental counterpart of update_all_risks. Only rescores fittings whose
+    risk inputs changed since their last scoring (risk_dirty) or whose
+    warranty tier boundary has been reached (risk_review_date); vendor_stats
+    is kept current by triggers. Repair dates anchored on "today" are
+    therefore refreshed when a row is rescored, not every pass.
+    Returns the number of fittings rescored.
+    """
+    conn = sqlite3.connect(db_path)
+    today = datetime.today().date().isoformat()
+
+    touched = 0
+    for where, params in (("risk_dirty = 1", ()), ("risk_review_date <= ?", (today,))):
+        while True:
+            # Select and write in one transaction so concurrent edits are not
+            # lost when the dirty flag is cleared.
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(f"SELECT {_RECOMPUTE_COLUMNS} FROM fittings WHERE {where} LIMIT ?",
+                                params + (chunk_size,)).fetchall()
+            touched += _rescore_rows(conn, rows)
+            conn.commit()
+            if len(rows) < chunk_size:
+                break
+
+    conn.close()
+    return touched
+
+# === Risk scheduler ===
+class RiskScheduler:
+    """
+    Runs update_dirty_risks only when there is work: at local midnight of
+    the earliest risk_review_date (the next warranty tier change), right
+    away while dirty rows exist, or when notify() is called after a write.
+    max_sleep bounds the wait so writers that bypass notify() are still
+    picked up. Each wake-up and the number of rows it rescored is recorded.
+    """
+    def __init__(self, db_path=DB, max_sleep=86400, history=50):
+        self.db_path = db_path
+        self.max_sleep = max_sleep
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=history)
+        self._wakeups = 0
+        self._rows_touched = 0
+        self._next_wake = None
+
+    def notify(self):
+        """Ask for a pass now, e.g. after risk inputs were changed."""
+        self._wakeup.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def next_wake(self):
+        """When the next pass is due: now if rows are dirty, else midnight of the earliest review date."""
+        conn = sqlite3.connect(self.db_path)
+        c = conn.cursor()
+        c.execute("SELECT 1 FROM fittings WHERE risk_dirty = 1 LIMIT 1")
+        dirty = c.fetchone() is not None
+        c.execute("SELECT MIN(risk_review_date) FROM fittings")
+        review_date = c.fetchone()[0]
+        conn.close()
+        if dirty:
+            return datetime.now()
+        if review_date is None:
+            return None
+        return datetime.strptime(review_date, "%Y-%m-%d")
+
+    def run_once(self):
+        started = datetime.now()
+        touched = update_dirty_risks(self.db_path)
+        with self._lock:
+            self._wakeups += 1
+            self._rows_touched += touched
+            self._recent.append({
+                "at": started.isoformat(timespec="seconds"),
+                "rows_touched": touched,
+                "seconds": round((datetime.now() - started).total_seconds(), 3)
+            })
+        print(f"[Risk Scheduler] Rescored {touched} fittings")
+        return touched
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                wake_at = self.next_wake()
+            except Exception as e:
+                print("[Risk Scheduler] Exception:", e)
+                wake_at = None
+            with self._lock:
+                self._next_wake = wake_at
+            timeout = self.max_sleep
+            if wake_at is not None:
+                timeout = min(max((wake_at - datetime.now()).total_seconds(), 0), self.max_sleep)
+            if timeout > 0:
+                self._wakeup.wait(timeout)
+            self._wakeup.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.run_once()
+            except Exception as e:
+                print("[Risk Scheduler] Exception:", e)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "wakeups": self._wakeups,
+                "rows_touched": self._rows_touched,
+                "next_wake": self._next_wake.isoformat(timespec="seconds") if self._next_wake else None,
+                "recent": list(self._recent)
+            }
+
+# === Inspection due queue ===
+DUE_COLUMNS = ("uid", "item_type", "vendor", "vendor_id", "lot", "risk",
+               "inspection_date", "repair_date", "next_inspection_day")
+
+def _due_rows(conn, within_days, vendor_id, risk, limit, after):
+    """
+    One keyset page of fittings whose next inspection is on or before
+    today + within_days (overdue ones included), ordered by
+    (next_inspection_day, uid) and starting after the `after` key.
+    """
+    where = ["next_inspection_day BETWEEN 1 AND ?"]
+    params = [datetime.today().toordinal() + within_days]
+    if vendor_id is not None:
+        where.append("vendor_id = ?")
+        params.append(str(vendor_id))
+    if risk is not None:
+        where.append("risk = ?")
+        params.append(risk)
+    if after is not None:
+        where.append("(next_inspection_day, uid) > (?, ?)")
+        params.extend(after)
+    c = conn.execute(f"""
+        SELECT {', '.join(DUE_COLUMNS)} FROM fittings
+        WHERE {' AND '.join(where)}
+        ORDER BY next_inspection_day, uid LIMIT ?
+    """, params + [limit])
+    rows = []
+    for values in c.fetchall():
+        row = dict(zip(DUE_COLUMNS, values))
+        row["next_inspection"] = datetime.fromordinal(row["next_inspection_day"]).date().isoformat()
+        rows.append(row)
+    return rows
+
+def encode_due_cursor(row):
+    return f"{row['next_inspection_day']}:{row['uid']}"
+
+def decode_due_cursor(cursor):
+    """Inverse of encode_due_cursor; raises ValueError for a malformed cursor."""
+    day, sep, uid = cursor.partition(":")
+    if not sep:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return int(day), uid
+
+def get_due_page(within_days, vendor_id=None, risk=None, limit=100, cursor=None, db_path=DB):
+    """
+    Inspections due within within_days days, earliest first, one page at a
+    time. Returns (rows, next_cursor); next_cursor is None on the last page.
+    Every page is a range scan on one of the *_due indexes.
+    """
+    after = decode_due_cursor(cursor) if cursor else None
+    conn = sqlite3.connect(db_path)
+    rows = _due_rows(conn, within_days, vendor_id, risk, limit, after)
+    conn.close()
+    next_cursor = encode_due_cursor(rows[-1]) if len(rows) == limit else None
+    return rows, next_cursor
+
+def iter_due_inspections(within_days, vendor_id=None, risk=None, page_size=1000, db_path=DB):
+    """
+    Stream every due inspection (same order and filters as get_due_page)
+    without loading the whole queue, e.g. for batch work-order generation.
+    """
+    conn = sqlite3.connect(db_path)
+    try:
+        after = None
+        while True:
+            rows = _due_rows(conn, within_days, vendor_id, risk, page_size, after)
+            yield from rows
+            if len(rows) < page_size:
+                break
+            after = (rows[-1]["next_inspection_day"], rows[-1]["uid"])
+    finally:
+        conn.close()
+
 # === QR Anomaly Detector ===
 class QRAnomalyDetector:
     def __init__(self, error_correction_level='H'):
         self.detector = cv2.QRCodeDetector()
+        # The ArUco-based detector reads dense or stylized codes the classic one misses
+        self.fallback_detector = cv2.QRCodeDetectorAruco() if hasattr(cv2, "QRCodeDetectorAruco") else None
         self.level_map = {
             'L': qrcode.constants.ERROR_CORRECT_L,
             'M': qrcode.constants.ERROR_CORRECT_M,
@@ -201,7 +810,32 @@ class QRAnomalyDetector:
         return status, img
 
     def _check_anomaly(self, cv_img, original_data):
-        decoded_text, points, _ = self.detector.detectAndDecode(cv_img)
+        decoded_text = self.decode(cv_img)
         if not decoded_text:
             return "anomaly detected"
         return "valid" if decoded_text == original_data else "anomaly detected"
+
+    def decode(self, cv_img):
+        """Decoded QR text, or "" when no code can be read."""
+        decoded_text, points, _ = self.detector.detectAndDecode(cv_img)
+        if not decoded_text and self.fallback_detector is not None:
+            decoded_text, points, _ = self.fallback_detector.detectAndDecode(cv_img)
+        return decoded_text
+
+    def check_image(self, image_path, expected_data):
+        """
+        Decode a stored QR image and compare it with expected_data.
+        Returns (status, decoded_text); status is "valid", "mismatch",
+        "unreadable" or "missing". Not thread-safe: use one detector per thread.
+        """
+        cv_img = cv2.imread(image_path)
+        if cv_img is None:
+            return "missing", None
+        return self.check_array(cv_img, expected_data)
+
+    def check_array(self, cv_img, expected_data):
+        """check_image for an image already in memory: ("valid" | "mismatch" | "unreadable", decoded_text)."""
+        decoded_text = self.decode(cv_img)
+        if not decoded_text:
+            return "unreadable", None
+        return ("valid" if decoded_text == expected_data else "mismatch"), decoded_text
@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, send_file, session
+from flask import Flask, render_template, request, redirect, url_for, jsonify, send_file, session, Response, stream_with_context
 import secrets
 from flask import session
 import sqlite3
@@ -8,10 +8,7 @@ import webbrowser
 import time
 import socket
 import json
-from datetime import datetime, timedelta
-import io
-import base64
-import qrcode
+from datetime import date, datetime, timedelta
 import requests
 import qrcode_artistic
 import hashlib
@@ -23,27 +20,27 @@ except Exception:
     qr_art = None
     HAS_AI_QR = False
 
-# OpenCV / numpy / PIL
-import cv2
-import numpy as np
-from PIL import Image, ImageDraw, ImageFont
 import asyncio
-import websockets
 import secrets
 
 # External modules (assumed available)
 from udm import push_to_udm
 from tms import push_to_tms
-from ai_module import get_risk_level, update_all_risks, QRAnomalyDetector
+from qr_module import (qr_dir, QR_MODES, generate_qr_content, generate_reference_qr_content, fitting_qr_content,
+                       resolve_qr_mode, verify_reference_tag, generate_vendor_qr_content, qr_png_etag, qr_png_bytes, qr_png_cache_stats,
+                       save_qr_image, save_vendor_qr_image, qr_artifact_cache)
+from gcode_module import (GCODE_METHODS, iter_cached_fitting_gcode, iter_vendor_gcode, vendor_gcode_key,
+                          gcode_cache, tee_gcode_file)
+from bulk_module import load_bulk_items, iter_bulk_generate, verify_qr_images
+import bulk_module
+from sim_module import compare_methods, fitting_content
+from esp32_module import send_gcode_websocket
+from ai_module import get_risk_level, get_vendor_risk, ensure_risk_schema, get_due_page, RiskScheduler, QRAnomalyDetector
 
 app = Flask(__name__)
 app.secret_key = secrets.token_hex(16)  # Generates a 32-character random hex string
 DB = 'fittings.db'
 
-# QR code directory
-qr_dir = os.path.join("static", "qrcodes")
-os.makedirs(qr_dir, exist_ok=True)
-
 # ESP32 endpoint (update if you want)
 ESP32_IP = "192.168.29.109"
 ESP32_WS = f"ws://{ESP32_IP}:81"
@@ -51,12 +48,6 @@ ESP32_WS = f"ws://{ESP32_IP}:81"
 # QR Anomaly Detector instance
 qr_detector = QRAnomalyDetector()
 
-# === Configuration: enable/disable AI-stylized QR ===
-USE_AI_QR = True
-
-# Path for a logo/background to embed into QR (user insisted logo is mandatory)
-AI_QR_EMBED_IMAGE = "D:\\CityGrid\\my-project\\qr demo\\static\\image\\rail.png"
-
 # === Database Connection Helper ===
 def get_db_connection():
     conn = sqlite3.connect(DB)
@@ -88,6 +79,11 @@ def init_vendor_db():
             failure_count INTEGER DEFAULT 0
         )
     ''')
+    c.execute("PRAGMA table_info(vendors)")
+    if "qr_mode" not in {row[1] for row in c.fetchall()}:
+        # Default QR mode for this vendor's fittings ('full' or 'ref')
+        c.execute("ALTER TABLE vendors ADD COLUMN qr_mode TEXT DEFAULT 'full'")
+        print("[DB] Added missing vendor column: qr_mode")
     conn.commit()
     conn.close()
 
@@ -129,7 +125,8 @@ def ensure_table_columns():
         "vendor_email":"TEXT",
         "manufactor_number": "TEXT",
         "vendor_risk": "TEXT",
-        "vendor_id": "TEXT"
+        "vendor_id": "TEXT",
+        "qr_mode": "TEXT"
     }
 
     for col, coltype in wanted.items():
@@ -140,12 +137,20 @@ def ensure_table_columns():
             except Exception as e:
                 print(f"[DB] Failed adding column {col}: {e}")
 
+    # Vendor dashboard and details pages list fittings by vendor_id
+    c.execute("CREATE INDEX IF NOT EXISTS idx_fittings_vendor_id ON fittings(vendor_id)")
+
     conn.commit()
+    # Dirty-tracking columns, vendor_stats triggers and the fittings_live view
+    ensure_risk_schema(conn)
     conn.close()
 
 # Run schema check at startup
 ensure_table_columns()
 
+# Rescores fittings when a warranty tier boundary is reached or inputs change
+risk_scheduler = RiskScheduler(DB)
+
 def get_vendor_db_connection():
     conn = sqlite3.connect(VENDOR_DB)
     conn.row_factory = sqlite3.Row   # 🔑 this is the fix
@@ -207,508 +212,70 @@ def calculate_dates(manufactor_date, supply_date, warranty_end_str, risk):
 
     return inspection_date.isoformat(), repair_date.isoformat()
 
-def compute_next_inspection(inspection_date_str, repair_date_str, risk):
-    today = datetime.today().date()
-    if inspection_date_str:
-        try:
-            dt = datetime.strptime(inspection_date_str, "%Y-%m-%d").date()
-            return dt.isoformat()
-        except Exception:
-            pass
-
-    if repair_date_str:
-        try:
-            rd = datetime.strptime(repair_date_str, "%Y-%m-%d").date()
-            if risk == "High":
-                delta = timedelta(days=90)
-            elif risk == "Medium":
-                delta = timedelta(days=180)
-            else:
-                delta = timedelta(days=365)
-            next_dt = rd + delta
-            return next_dt.isoformat()
-        except Exception:
-            pass
-
+def compute_next_inspection(next_inspection_day):
+    """Display value for the stored next_inspection_day column."""
+    if next_inspection_day and next_inspection_day > 0:
+        return date.fromordinal(next_inspection_day).isoformat()
     return "Not scheduled"
 
-# === Vendor Risk Calculation Helper ===
-def calculate_vendor_risk(vendor):
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT COUNT(*) FROM fittings WHERE vendor=? AND risk_flag=1", (vendor,))
-    failures = c.fetchone()[0]
-    conn.close()
-    if failures >= 5:
-        return "High"
-    elif failures >= 2:
-        return "Medium"
-    else:
-        return "Low"
-
-# === QR Content Generation ===
-def generate_qr_content(uid, item_type, vendor, lot, supply_date, warranty_end, manufactor_date, manufactor_number, notes, risk, vendor_risk,vendor_email=""):
-    qr_payload = {
-        "uid": uid,
-        "item_type": item_type,
-        "vendor": vendor,
-        "lot": lot,
-        "supply_date": supply_date,
-        "warranty_end": warranty_end,
-        "manufactor_date": manufactor_date,
-        "manufactor_number": manufactor_number,
-        "vendor_email": vendor_email,
-        "notes": notes,
-        "risk": risk,
-        "vendor_risk": vendor_risk,
-        
-    }
-    return json.dumps(qr_payload)
-
-# === helper to generate base64 inline QR for templates ===
-def generate_qr_image_base64(qr_content):
-    qr = qrcode.QRCode(box_size=8, border=2)
-    qr.add_data(qr_content)
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white").convert("RGB")
-    buf = io.BytesIO()
-    img.save(buf, format="PNG")
-    buf.seek(0)
-    b64 = base64.b64encode(buf.read()).decode('ascii')
-    return b64
-
-# === Create anime-themed QR code with logo ===
-def create_anime_qr_with_logo(qr_content, logo_path=None):
-    """Create an anime-themed QR code with optional logo"""
-    try:
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_H,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(qr_content)
-        qr.make(fit=True)
-
-        img = qr.make_image(fill_color="black", back_color="white").convert('RGB')
-
-        # Apply anime-style effects if requested
-        img = apply_anime_effects(img)
-
-        # Add logo (logo is mandatory per your instruction)
-        if logo_path:
-            if os.path.exists(logo_path):
-                img = add_logo_to_qr(img, logo_path)
-            else:
-                print(f"[Logo] Logo file not found at {logo_path} (logo is required). Proceeding without visual logo overlay.")
-        return img
-    except Exception as e:
-        print(f"Anime QR creation failed: {e}")
-        return qrcode.make(qr_content).convert('RGB')
-
-def apply_anime_effects(img):
-    """Apply anime-style visual effects to the QR code"""
-    try:
-        img_array = np.array(img)
-        h, w = img_array.shape[:2]
-        for i in range(h):
-            for j in range(w):
-                if img_array[i, j, 0] < 128:  # Dark pixels
-                    if (i + j) % 4 == 0:
-                        img_array[i, j] = [50, 100, 200]
-                    elif (i + j) % 4 == 1:
-                        img_array[i, j] = [200, 100, 150]
-                else:
-                    img_array[i, j] = [245, 230, 240]
-        img = Image.fromarray(img_array.astype('uint8'))
-        draw = ImageDraw.Draw(img)
-        width, height = img.size
-        border_color = (255, 150, 200)
-        draw.rectangle([0, 0, width-1, height-1], outline=border_color, width=3)
-        corner_size = 15
-        for x, y in [(0, 0), (width-corner_size, 0), (0, height-corner_size), (width-corner_size, height-corner_size)]:
-            draw.ellipse([x, y, x+corner_size, y+corner_size], fill=border_color)
-        return img
-    except Exception as e:
-        print(f"Anime effects failed: {e}")
-        return img
-
-def add_logo_to_qr(qr_img, logo_path):
-    """Add logo to the center of QR code"""
-    try:
-        logo = Image.open(logo_path)
-        base_width = min(qr_img.size[0] // 5, qr_img.size[1] // 5)
-        wpercent = (base_width / float(logo.size[0]))
-        hsize = int((float(logo.size[1]) * float(wpercent)))
-        logo = logo.resize((base_width, hsize), Image.LANCZOS)
-
-        pos = ((qr_img.size[0] - logo.size[0]) // 2,
-               (qr_img.size[1] - logo.size[1]) // 2)
-
-        if logo.mode != 'RGBA':
-            logo = logo.convert('RGBA')
-
-        white_bg = Image.new('RGBA', logo.size, (255, 255, 255, 255))
-        white_bg.paste(logo, (0, 0), logo if logo.mode == 'RGBA' else None)
-
-        # Ensure QR image is RGBA to preserve transparency if merging
-        if qr_img.mode != 'RGBA':
-            qr_img = qr_img.convert('RGBA')
-        qr_img.paste(white_bg, pos, white_bg)
-        return qr_img.convert('RGB')
-    except Exception as e:
-        print(f"Logo addition failed: {e}")
-        return qr_img
-
-# === Centralized QR image saver (creates display + engrave) ===
-def save_qr_image(uid, qr_content):
+# === Cached QR image responses ===
+def qr_png_response(qr_content, private=False):
     """
-    Saves two QR images:
-    - <uid>_display.png (pink background + logo) for UI
-    - <uid>_engrave.png (white background + logo, 1-bit B/W) for laser engraving
-    Returns (display_path, engrave_path)
+    PNG response for an inline QR with a strong ETag from the payload hash.
+    Browsers revalidate every time; a matching If-None-Match gets a 304
+    without any image work, anything else comes from the in-memory PNG LRU.
     """
-    qr_path_display = os.path.join(qr_dir, f"{uid}_display.png")
-    qr_path_engrave = os.path.join(qr_dir, f"{uid}_engrave.png")
-
-    # Generate base QR
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_H,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(qr_content)
-    qr.make(fit=True)
-
-    # 1) Display QR (pink background)
-    try:
-        if USE_AI_QR:
-            # attempt an "artistic/anime" style first
-            img_disp = create_anime_qr_with_logo(qr_content, AI_QR_EMBED_IMAGE)
-        else:
-            img_disp = qr.make_image(fill_color="black", back_color="pink").convert("RGB")
-            if AI_QR_EMBED_IMAGE and os.path.exists(AI_QR_EMBED_IMAGE):
-                img_disp = add_logo_to_qr(img_disp, AI_QR_EMBED_IMAGE)
-        img_disp.save(qr_path_display)
-        print(f"[QR] Display QR saved at {qr_path_display}")
-    except Exception as e:
-        print(f"[save_qr_image] display generation failed: {e}")
-        img_disp = qr.make_image(fill_color="black", back_color="pink").convert("RGB")
-        if AI_QR_EMBED_IMAGE and os.path.exists(AI_QR_EMBED_IMAGE):
-            img_disp = add_logo_to_qr(img_disp, AI_QR_EMBED_IMAGE)
-        img_disp.save(qr_path_display)
-
-    # 2) Engrave QR (strict black/white, with logo area white to keep scannable)
-    try:
-        img_eng = qr.make_image(fill_color="black", back_color="white").convert("RGB")
-        # Add logo (mandatory) on engrave image as well
-        if AI_QR_EMBED_IMAGE and os.path.exists(AI_QR_EMBED_IMAGE):
-            img_eng = add_logo_to_qr(img_eng, AI_QR_EMBED_IMAGE)
-        # Force strict B/W (1-bit) - helps reduce g-code size and ensures engraving clarity
-        img_eng = img_eng.convert("L").point(lambda p: 0 if p < 128 else 255, "1")
-        img_eng.save(qr_path_engrave)
-        print(f"[QR] Engrave QR saved at {qr_path_engrave}")
-    except Exception as e:
-        print(f"[save_qr_image] engrave generation failed: {e}")
-        img_eng = qr.make_image(fill_color="black", back_color="white").convert("L").point(lambda p: 0 if p < 128 else 255, "1")
-        img_eng.save(qr_path_engrave)
-
-    return qr_path_display, qr_path_engrave
-
-def generate_vendor_qr_content(vendor_data):
-    """Generate QR content for vendor details"""
-    qr_payload = {
-        "vendor_id": vendor_data['id'],
-        "company_name": vendor_data['company_name'],
-        "contact_person": vendor_data['contact_person'],
-        "email": vendor_data['email'],
-        "phone": vendor_data.get('phone', ''),
-        "address": vendor_data.get('address', ''),
-        "registration_date": vendor_data.get('registration_date', ''),
-        "vendor_risk": vendor_data.get('vendor_risk', 'Low')
-    }
-    return json.dumps(qr_payload)
-
-def save_vendor_qr_image(vendor_id, qr_content):
-    """Save vendor QR image for engraving"""
-    vendor_qr_dir = os.path.join("static", "vendor_qrcodes")
-    os.makedirs(vendor_qr_dir, exist_ok=True)
-    
-    qr_path_engrave = os.path.join(vendor_qr_dir, f"vendor_{vendor_id}_engrave.png")
-    
-    # Generate QR code (simple black/white for engraving)
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_H,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(qr_content)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white").convert("RGB")
-    
-    # Convert to 1-bit B/W for engraving
-    img = img.convert("L").point(lambda p: 0 if p < 128 else 255, "1")
-    img.save(qr_path_engrave)
-    
-    return qr_path_engrave
-
-# === QR -> G-code functions ===
-def qr_to_gcode_final(image_path, laser_power=255, travel_speed=5000, engrave_speed=1500, target_size_mm=25.0):
-    """
-    Vector-like approach: contour-following. Good for fewer G-lines but may produce complex paths.
-    """
-    img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-    if img is None:
-        return "G21\nG90\nM5\nG0 X0 Y0\n;(Error: Failed to load image)"
-    height, width = img.shape
-    scale_factor = target_size_mm / max(width, height)
-    _, thresh = cv2.threshold(img, 127, 255, cv2.THRESH_BINARY_INV)
-    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    min_contour_area = 5
-    significant_contours = [cnt for cnt in contours if cv2.contourArea(cnt) > min_contour_area]
-    gcode_lines = ["G21", "G90", f"G0 F{travel_speed}", f"G1 F{engrave_speed}", "M3 S0", "G0 X0 Y0"]
-    for contour in significant_contours:
-        epsilon = 0.002 * cv2.arcLength(contour, True)
-        approx = cv2.approxPolyDP(contour, epsilon, True)
-        if len(approx) < 2:
-            continue
-        first_point = approx[0][0]
-        x_start = round(first_point[0] * scale_factor, 3)
-        y_start = round(first_point[1] * scale_factor, 3)
-        gcode_lines.append(f"G0 X{x_start} Y{y_start}")
-        gcode_lines.append(f"M3 S{laser_power}")
-        for point in approx[1:]:
-            x = round(point[0][0] * scale_factor, 3)
-            y = round(point[0][1] * scale_factor, 3)
-            gcode_lines.append(f"G1 X{x} Y{y}")
-        gcode_lines.append(f"G1 X{x_start} Y{y_start}")
-        gcode_lines.append("M3 S0")
-    gcode_lines.append("G0 X0 Y0")
-    gcode_lines.append("M5")
-    return "\n".join(gcode_lines)
-
-def qr_to_gcode_raster(img_path, laser_power=255, travel_speed=5000,
-                       engrave_speed=1500, target_size_mm=20.0):
-    """
-    Raster engraving: line-by-line (zig-zag) scan producing many lines but simpler control.
-    Produces denser G-code appropriate for raster engravers.
-    """
-    img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
-    if img is None:
-        raise ValueError(f"Cannot load image: {img_path}")
-
-    # Binarize (black=0, white=255)
-    _, bw = cv2.threshold(img, 127, 255, cv2.THRESH_BINARY)
-
-    h, w = bw.shape
-    px_per_mm = w / target_size_mm
-    if px_per_mm == 0:
-        raise ValueError("Invalid scale: px_per_mm == 0")
-    mm_per_px = 1.0 / px_per_mm
-
-    gcode = []
-    gcode.append("G21 ; mm mode")
-    gcode.append("G90 ; absolute positioning")
-    gcode.append("M5  ; laser off")
-    gcode.append(f"G0 F{travel_speed}")
-
-    # iterate rows, zigzag pattern
-    for row in range(h):
-        y_mm = round(row * mm_per_px, 3)
-        # choose forward/backwards scanning
-        if row % 2 == 0:
-            col_iter = range(w)
-        else:
-            col_iter = range(w-1, -1, -1)
-
-        laser_on = False
-        for col in col_iter:
-            pixel = bw[row, col]
-            x_mm = round(col * mm_per_px, 3)
-            if pixel == 0:  # black pixel to engrave
-                if not laser_on:
-                    gcode.append(f"G0 X{x_mm} Y{y_mm} F{travel_speed}")
-                    gcode.append(f"M3 S{laser_power}")
-                    laser_on = True
-                gcode.append(f"G1 X{x_mm} Y{y_mm} F{engrave_speed}")
-            else:
-                if laser_on:
-                    gcode.append("M5")
-                    laser_on = False
-
-        if laser_on:
-            gcode.append("M5")
-            laser_on = False
-
-    gcode.append("M5 ; ensure laser off")
-    gcode.append("G0 X0 Y0 ; go home")
-    return "\n".join(gcode)
-
-def qr_to_gcode_fallback(image_path, laser_power=255, scale=1.0):
-    # Simple horizontal-run fallback scanning
-    img = Image.open(image_path).convert("L")
-    width, height = img.size
-    pixels = img.load()
-    gcode_lines = ["G21 ; Set units to mm", "G90 ; Absolute positioning", "M3 S0 ; Laser off at start"]
-    for y in range(height):
-        x = 0
-        while x < width:
-            while x < width and pixels[x, y] >= 128:
-                x += 1
-            if x >= width:
-                break
-            start_x = x
-            while x < width and pixels[x, y] < 128:
-                x += 1
-            end_x = x - 1
-            gx_start = round(start_x * scale, 3)
-            gy = round(y * scale, 3)
-            gx_end = round(end_x * scale, 3)
-            gcode_lines.append(f"G0 X{gx_start} Y{gy}")
-            gcode_lines.append(f"M3 S{laser_power}")
-            gcode_lines.append(f"G1 X{gx_end} Y{gy}")
-            gcode_lines.append("M3 S0")
-    gcode_lines.append("M5 ; Laser off at end")
-    gcode_lines.append("G0 X0 Y0 ; Return to origin")
-    return "\n".join(gcode_lines)
+    etag = qr_png_etag(qr_content)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(qr_png_bytes(qr_content), mimetype='image/png')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    if private:
+        response.cache_control.private = True
+    else:
+        response.cache_control.public = True
+    return response
 
 # === Send G-code to ESP32 over WebSocket ===
-async def send_gcode_websocket(gcode_text, command_delay=0.02):
-    try:
-        async with websockets.connect(ESP32_WS) as websocket:
-            # Optionally read an initial greeting from ESP32
-            try:
-                first_msg = await asyncio.wait_for(websocket.recv(), timeout=1.0)
-                print(f"ESP32 says: {first_msg}")
-            except Exception:
-                pass
-
-            lines = [line.strip() for line in gcode_text.splitlines() if line.strip() and not line.lstrip().startswith(';')]
-            total = len(lines)
-            success_count = 0
-
-            for i, line in enumerate(lines):
-                await websocket.send(line)
-                try:
-                    ack = await asyncio.wait_for(websocket.recv(), timeout=1.0)
-                    if "ok" in ack.lower() or "ready" in ack.lower():
-                        success_count += 1
-                    else:
-                        print(f"Unexpected ACK: {ack}")
-                except asyncio.TimeoutError:
-                    # no ack — we still proceed but log
-                    print(f"No ACK for: {line[:80]}")
-                if i % 100 == 0:
-                    print(f"Progress: {i}/{total} lines sent")
-                await asyncio.sleep(command_delay)
-
-            rate = (success_count / total) * 100 if total else 100.0
-            return rate > 90, f"Sent {success_count}/{total} ({rate:.1f}%)"
-    except Exception as e:
-        return False, f"WebSocket error: {e}"
-
-def send_gcode_to_esp32_enhanced(gcode_text):
+def send_gcode_to_esp32_enhanced(gcode, command_delay=0.0):
     """Wrapper so Flask can call the async WebSocket sender and returns (success_bool, message)."""
     try:
-        return asyncio.run(send_gcode_websocket(gcode_text))
+        return asyncio.run(send_gcode_websocket(ESP32_WS, gcode, command_delay))
     except Exception as e:
         print(f"[send_gcode_to_esp32_enhanced] Exception: {e}")
         return False, f"Async send failed: {e}"
 
-
-def vendor_qr_to_gcode_raster(img_path, laser_power=255, travel_speed=5000,
-                              engrave_speed=1500, target_size_mm=25.0):
-    """
-    Raster engraving for vendor QR codes: line-by-line (zig-zag) scan.
-    """
-    img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
-    if img is None:
-        raise ValueError(f"Cannot load image: {img_path}")
-
-    # Binarize (black=0, white=255)
-    _, bw = cv2.threshold(img, 127, 255, cv2.THRESH_BINARY)
-
-    h, w = bw.shape
-    px_per_mm = w / target_size_mm
-    if px_per_mm == 0:
-        raise ValueError("Invalid scale: px_per_mm == 0")
-    mm_per_px = 1.0 / px_per_mm
-
-    gcode = []
-    gcode.append("G21 ; mm mode")
-    gcode.append("G90 ; absolute positioning")
-    gcode.append("M5  ; laser off")
-    gcode.append(f"G0 F{travel_speed}")
-
-    # iterate rows, zigzag pattern
-    for row in range(h):
-        y_mm = round(row * mm_per_px, 3)
-        # choose forward/backwards scanning
-        if row % 2 == 0:
-            col_iter = range(w)
-        else:
-            col_iter = range(w-1, -1, -1)
-
-        laser_on = False
-        for col in col_iter:
-            pixel = bw[row, col]
-            x_mm = round(col * mm_per_px, 3)
-            if pixel == 0:  # black pixel to engrave
-                if not laser_on:
-                    gcode.append(f"G0 X{x_mm} Y{y_mm} F{travel_speed}")
-                    gcode.append(f"M3 S{laser_power}")
-                    laser_on = True
-                gcode.append(f"G1 X{x_mm} Y{y_mm} F{engrave_speed}")
-            else:
-                if laser_on:
-                    gcode.append("M5")
-                    laser_on = False
-
-        if laser_on:
-            gcode.append("M5")
-            laser_on = False
-
-    gcode.append("M5 ; ensure laser off")
-    gcode.append("G0 X0 Y0 ; go home")
-    return "\n".join(gcode)
-
-def vendor_qr_to_gcode_vector(image_path, laser_power=255, travel_speed=5000, 
-                              engrave_speed=1500, target_size_mm=25.0):
+def stream_gcode_to_esp32(first, lines, command_delay=0.0):
     """
-    Vector-like approach for vendor QR codes: contour-following.
+    Send first and then the rest of the lines generator to the ESP32, then
+    drain whatever the send left so a tee'd G-code file is completed.
+    Returns (success_bool, message) like send_gcode_to_esp32_enhanced; if
+    generating the lines fails, during the send or the drain, the error is
+    raised instead and lines is closed so no temp file is left behind.
     """
-    img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
-    if img is None:
-        return "G21\nG90\nM5\nG0 X0 Y0\n;(Error: Failed to load image)"
-    height, width = img.shape
-    scale_factor = target_size_mm / max(width, height)
-    _, thresh = cv2.threshold(img, 127, 255, cv2.THRESH_BINARY_INV)
-    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    min_contour_area = 5
-    significant_contours = [cnt for cnt in contours if cv2.contourArea(cnt) > min_contour_area]
-    gcode_lines = ["G21", "G90", f"G0 F{travel_speed}", f"G1 F{engrave_speed}", "M3 S0", "G0 X0 Y0"]
-    for contour in significant_contours:
-        epsilon = 0.002 * cv2.arcLength(contour, True)
-        approx = cv2.approxPolyDP(contour, epsilon, True)
-        if len(approx) < 2:
-            continue
-        first_point = approx[0][0]
-        x_start = round(first_point[0] * scale_factor, 3)
-        y_start = round(first_point[1] * scale_factor, 3)
-        gcode_lines.append(f"G0 X{x_start} Y{y_start}")
-        gcode_lines.append(f"M3 S{laser_power}")
-        for point in approx[1:]:
-            x = round(point[0][0] * scale_factor, 3)
-            y = round(point[0][1] * scale_factor, 3)
-            gcode_lines.append(f"G1 X{x} Y{y}")
-        gcode_lines.append(f"G1 X{x_start} Y{y_start}")
-        gcode_lines.append("M3 S0")
-    gcode_lines.append("G0 X0 Y0")
-    gcode_lines.append("M5")
-    return "\n".join(gcode_lines)
+    generation_error = []
+    def checked_lines():
+        # A plain loop, not `yield from`: the sender dropping this generator must not close lines
+        try:
+            yield first
+            for line in lines:
+                yield line
+        except Exception as e:
+            generation_error.append(e)
+            raise
+
+    try:
+        success, resp_text = send_gcode_to_esp32_enhanced(checked_lines(), command_delay)
+        if generation_error:
+            raise generation_error[0]
+        # Finish the file even if the send stopped early
+        for _ in lines:
+            pass
+    finally:
+        lines.close()
+    return success, resp_text
 
 @app.route('/vendor/login', methods=['GET', 'POST'])
 def vendor_login():
@@ -784,41 +351,69 @@ def vendor_dashboard():
     
     # Convert to dictionary properly
     vendor_dict = {key: vendor[key] for key in vendor.keys()}
+    # Live tier from the fittings aggregate (vendors.vendor_risk is never updated)
+    vendor_dict['vendor_risk'] = get_vendor_risk(vendor_id)
     
     # Get vendor's products from fittings database
     conn_fittings = get_db_connection()
     c_fittings = conn_fittings.cursor()
-    c_fittings.execute("SELECT * FROM fittings WHERE vendor_id=?", (vendor_id,))
+    c_fittings.execute("SELECT * FROM fittings_live WHERE vendor_id=?", (vendor_id,))
     products = [{key: row[key] for key in row.keys()} for row in c_fittings.fetchall()]
     conn_fittings.close()
     
-    # Generate vendor QR content
-    vendor_qr_content = generate_vendor_qr_content(vendor_dict)
-    vendor_qr_b64 = generate_qr_image_base64(vendor_qr_content)
-    
+    # The vendor QR itself is served (and browser-cached) by vendor_qr_png
     return render_template('vendor_dashboard.html', 
                           vendor=vendor_dict, 
-                          products=products,
-                          vendor_qr_code=vendor_qr_b64)
+                          products=products)
+
+@app.route('/vendor/qr_image/<int:vendor_id>.png')
+def vendor_qr_png(vendor_id):
+    if 'vendor_id' not in session or session['vendor_id'] != vendor_id:
+        return redirect(url_for('vendor_login'))
+
+    conn = get_vendor_db_connection()
+    c = conn.cursor()
+    c.execute("SELECT * FROM vendors WHERE id=?", (vendor_id,))
+    vendor = c.fetchone()
+    conn.close()
+    if not vendor:
+        return "Vendor not found", 404
+
+    vendor_dict = {key: vendor[key] for key in vendor.keys()}
+    return qr_png_response(live_vendor_qr_content(vendor_dict), private=True)
+
+@app.route('/vendor/qr_mode', methods=['POST'])
+def vendor_qr_mode():
+    """Set the default QR mode for the logged-in vendor's fittings."""
+    if 'vendor_id' not in session:
+        return redirect(url_for('vendor_login'))
+    qr_mode = request.form.get('qr_mode')
+    if qr_mode not in QR_MODES:
+        return "Invalid QR mode", 400
+    conn = get_vendor_db_connection()
+    conn.execute("UPDATE vendors SET qr_mode=? WHERE id=?", (qr_mode, session['vendor_id']))
+    conn.commit()
+    conn.close()
+    return redirect(url_for('vendor_dashboard'))
 
 @app.route('/vendor/qr/<vendor_id>')
 def download_vendor_qr(vendor_id):
     if 'vendor_id' not in session or session['vendor_id'] != int(vendor_id):
         return redirect(url_for('vendor_login'))
     
-    conn = sqlite3.connect(VENDOR_DB)
+    conn = get_vendor_db_connection()
     c = conn.cursor()
     c.execute("SELECT * FROM vendors WHERE id=?", (vendor_id,))
-    vendor = dict(c.fetchone())
+    vendor = c.fetchone()
     conn.close()
     
     if not vendor:
         return "Vendor not found", 404
     
-    vendor_qr_content = generate_vendor_qr_content(vendor)
+    vendor_qr_content = live_vendor_qr_content(dict(vendor))
     qr_path = save_vendor_qr_image(vendor_id, vendor_qr_content)
     
-    return send_file(qr_path, as_attachment=True, download_name=f"vendor_{vendor_id}_qr.png")
+    return send_file(os.path.abspath(qr_path), as_attachment=True, download_name=f"vendor_{vendor_id}_qr.png")
 
 @app.route('/vendor/<vendor_id>')
 def vendor_details(vendor_id):
@@ -837,12 +432,33 @@ def vendor_details(vendor_id):
     # Get vendor's products
     conn_fittings = get_db_connection()
     c_fittings = conn_fittings.cursor()
-    c_fittings.execute("SELECT * FROM fittings WHERE vendor_id=?", (vendor_id,))
+    c_fittings.execute("SELECT * FROM fittings_live WHERE vendor_id=?", (vendor_id,))
     products = [{key: row[key] for key in row.keys()} for row in c_fittings.fetchall()]
     conn_fittings.close()
     
     return render_template('vendor_details.html', vendor=vendor_dict, products=products)
 
+def live_vendor_qr_content(vendor_dict):
+    """
+    Vendor QR content with the live risk tier from vendor_stats
+    (vendors.vendor_risk is never updated). Every vendor QR, shown,
+    downloaded or engraved, is built from this.
+    """
+    vendor_dict = dict(vendor_dict, vendor_risk=get_vendor_risk(vendor_dict['id']))
+    return generate_vendor_qr_content(vendor_dict)
+
+def vendor_gcode_source(vendor_id, vendor_qr_content, method):
+    """
+    (cache key, line factory) for a vendor's G-code. The lines are traced from
+    the in-memory vendor raster; the factory also publishes the vendor QR PNG.
+    """
+    def make_lines():
+        qr_path = save_vendor_qr_image(vendor_id, vendor_qr_content)
+        print(f"[Vendor G-code] QR saved at {qr_path}")
+        return iter_vendor_gcode(vendor_qr_content, method)
+    vendor_risk = json.loads(vendor_qr_content).get('vendor_risk')
+    return vendor_gcode_key(vendor_qr_content, vendor_risk, method), make_lines
+
 @app.route('/vendor/gcode/<int:vendor_id>')
 def download_vendor_gcode(vendor_id):
     """Download vendor QR G-code file (no login required)"""
@@ -868,36 +484,24 @@ def download_vendor_gcode(vendor_id):
     print(f"[Vendor G-code] vendor raw = {vendor}")
     print(f"[Vendor G-code] vendor_dict = {vendor_dict}")
 
-    # Generate QR content + image
+    # Generate QR content
     try:
-        vendor_qr_content = generate_vendor_qr_content(vendor_dict)
-        qr_path = save_vendor_qr_image(vendor_id, vendor_qr_content)
-        print(f"[Vendor G-code] QR saved at {qr_path}")
+        vendor_qr_content = live_vendor_qr_content(vendor_dict)
     except Exception as e:
         print(f"[Vendor G-code] QR generation failed: {e}")
         return f"QR generation failed: {e}", 500
 
-    # Generate G-code
+    # G-code from the cache (QR image and G-code are only generated on a miss)
     try:
-        gcode_text = vendor_qr_to_gcode_raster(
-            qr_path,
-            laser_power=255,
-            travel_speed=5000,
-            engrave_speed=1500,
-            target_size_mm=25.0
-        )
-        print(f"[Vendor G-code] G-code length = {len(gcode_text)} chars")
+        gcode_path = gcode_cache.ensure(*vendor_gcode_source(vendor_id, vendor_qr_content, 'raster'))
+        print(f"[Vendor G-code] G-code length = {os.path.getsize(gcode_path)} bytes")
     except Exception as e:
         print(f"[Vendor G-code] Failed: {e}")
         return f"G-code generation failed: {e}", 500
 
     # Serve file
-    mem_file = io.BytesIO()
-    mem_file.write(gcode_text.encode('utf-8'))
-    mem_file.seek(0)
-
     return send_file(
-        mem_file,
+        os.path.abspath(gcode_path),
         as_attachment=True,
         download_name=f"vendor_{vendor_id}_engrave.gcode",
         mimetype='text/plain'
@@ -933,6 +537,8 @@ def index():
         manufactor_number = request.form.get('manufactor_number', '')
         notes = request.form.get('notes', '')
         vendor_email = request.form.get('vendor_email','')
+        # Empty = follow the vendor's QR mode
+        qr_mode = request.form.get('qr_mode') if request.form.get('qr_mode') in QR_MODES else None
 
         conn = get_db_connection()
         c = conn.cursor()
@@ -953,7 +559,7 @@ def index():
                 "supply_date": supply_date, "warranty_end": warranty_end, "notes": notes
             }
             risk_level = get_risk_level(payload)
-            vendor_risk = calculate_vendor_risk(vendor)
+            vendor_risk = get_vendor_risk(vendor_id) if vendor_id else "Low"
         except Exception as e:
             print(f"[Risk Calculation] Exception: {e}")
 
@@ -964,10 +570,13 @@ def index():
             inspection_date = supply_date or datetime.today().strftime("%Y-%m-%d")
             repair_date = warranty_end or datetime.today().strftime("%Y-%m-%d")
 
-        qr_content = generate_qr_content(
-            uid, item_type, vendor, lot, supply_date, warranty_end,
-            manufactor_date, manufactor_number, notes, risk_level, vendor_risk,vendor_email
-        )
+        if resolve_qr_mode({"qr_mode": qr_mode, "vendor_id": vendor_id}) == "ref":
+            qr_content = generate_reference_qr_content(uid)
+        else:
+            qr_content = generate_qr_content(
+                uid, item_type, vendor, lot, supply_date, warranty_end,
+                manufactor_date, manufactor_number, notes, risk_level, vendor_risk,vendor_email
+            )
 
         # returns (display_path, engrave_path)
         qr_display_path, qr_engrave_path = save_qr_image(uid, qr_content)
@@ -980,12 +589,12 @@ def index():
             c.execute("""INSERT INTO fittings 
                 (uid, item_type, vendor, vendor_id, lot, supply_date, warranty, warranty_end, 
                  manufactor_date, manufactor_number, notes, udm_synced, tms_synced, 
-                 risk_flag, risk, vendor_risk, vendor_email, inspection_date, repair_date)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, 0, ?, ?, ?, ?, ?, ?)""",
+                 risk_flag, risk, vendor_risk, vendor_email, inspection_date, repair_date, qr_mode)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, 0, ?, ?, ?, ?, ?, ?, ?)""",
                 (uid, item_type, vendor, vendor_id_db, lot, supply_date, supply_date, warranty_end,
                  manufactor_date, manufactor_number, notes,
                  1 if risk_level == "High" else 0, risk_level, vendor_risk, vendor_email,
-                 inspection_date, repair_date)
+                 inspection_date, repair_date, qr_mode)
             )
             conn.commit()
         except ValueError:
@@ -993,12 +602,12 @@ def index():
             c.execute("""INSERT INTO fittings 
                 (uid, item_type, vendor, vendor_id, lot, supply_date, warranty, warranty_end, 
                  manufactor_date, manufactor_number, notes, udm_synced, tms_synced, 
-                 risk_flag, risk, vendor_risk, vendor_email, inspection_date, repair_date)
-                VALUES (?, ?, ?, NULL, ?, ?, ?, ?, ?, ?, ?, 0, 0, ?, ?, ?, ?, ?, ?)""",
+                 risk_flag, risk, vendor_risk, vendor_email, inspection_date, repair_date, qr_mode)
+                VALUES (?, ?, ?, NULL, ?, ?, ?, ?, ?, ?, ?, 0, 0, ?, ?, ?, ?, ?, ?, ?)""",
                 (uid, item_type, vendor, lot, supply_date, supply_date, warranty_end,
                  manufactor_date, manufactor_number, notes,
                  1 if risk_level == "High" else 0, risk_level, vendor_risk, vendor_email,
-                 inspection_date, repair_date)
+                 inspection_date, repair_date, qr_mode)
             )
             conn.commit()
         except Exception as e:
@@ -1008,10 +617,8 @@ def index():
             return render_template('index.html', error=error, request=request, vendors=vendors)
         conn.close()
 
-        try:
-            update_all_risks()
-        except Exception as e:
-            print(f"[Global Risk Update] Exception: {e}")
+        # The scheduler rescores the new row (and any other pending changes)
+        risk_scheduler.notify()
 
         # push to remote systems (best-effort)
         try:
@@ -1059,7 +666,7 @@ def view_all():
     
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute(f"SELECT * FROM fittings ORDER BY {sort_by} ASC")
+    c.execute(f"SELECT * FROM fittings_live ORDER BY {sort_by} ASC")
     rows = c.fetchall()
     conn.close()
 
@@ -1067,15 +674,105 @@ def view_all():
     for row in rows:
         # Convert sqlite3.Row to dictionary properly
         row_dict = {key: row[key] for key in row.keys()}
-        row_dict['next_inspection'] = compute_next_inspection(
-            row_dict.get('inspection_date'), 
-            row_dict.get('repair_date'), 
-            row_dict.get('risk')
-        )
+        row_dict['next_inspection'] = compute_next_inspection(row_dict.get('next_inspection_day'))
         data.append(row_dict)
 
     return render_template('all.html', rows=data, sort_by=sort_by)
 
+@app.route('/api/due')
+def api_due():
+    """
+    Inspection due queue, earliest first, answered from the next_inspection_day indexes.
+    Query args: within_days (default 14), vendor_id, risk, limit (default 100, max 1000)
+    and cursor (the next_cursor of the previous page).
+    """
+    try:
+        within_days = int(request.args.get('within_days', 14))
+        limit = min(max(int(request.args.get('limit', 100)), 1), 1000)
+    except ValueError:
+        return jsonify({"error": "within_days and limit must be integers"}), 400
+
+    risk = request.args.get('risk') or None
+    if risk is not None and risk not in ('High', 'Medium', 'Low', 'Unknown'):
+        return jsonify({"error": f"Unknown risk level: {risk}"}), 400
+
+    try:
+        items, next_cursor = get_due_page(
+            within_days,
+            vendor_id=request.args.get('vendor_id') or None,
+            risk=risk,
+            limit=limit,
+            cursor=request.args.get('cursor') or None
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    return jsonify({"items": items, "next_cursor": next_cursor})
+
+@app.route('/api/bulk_generate', methods=['POST'])
+def api_bulk_generate():
+    """
+    Generate QR images and engrave G-code for a list of UIDs or a whole lot.
+    JSON body: {"uids": [...]} or {"lot": "..."}, optional "method" and "workers".
+    Streams one JSON line per finished fitting, then a summary line.
+    """
+    data = request.get_json(silent=True) or {}
+    uids = data.get('uids')
+    lot = data.get('lot')
+    method = data.get('method', 'raster')
+    if not uids and not lot:
+        return jsonify({"error": "uids or lot is required"}), 400
+    if uids is not None and not isinstance(uids, list):
+        return jsonify({"error": "uids must be a list"}), 400
+    if method not in GCODE_METHODS:
+        return jsonify({"error": f"method must be one of {', '.join(GCODE_METHODS)}"}), 400
+    try:
+        workers = int(data['workers']) if data.get('workers') else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "workers must be an integer"}), 400
+
+    items = load_bulk_items(uids=uids, lot=lot, db_path=DB)
+    if not items:
+        return jsonify({"error": "no matching fittings"}), 404
+
+    def stream():
+        t0 = time.perf_counter()
+        ok = 0
+        for result in iter_bulk_generate(items, method, workers):
+            ok += result["ok"]
+            yield json.dumps(result) + "\n"
+        elapsed = time.perf_counter() - t0
+        yield json.dumps({"summary": {"total": len(items), "ok": ok, "seconds": round(elapsed, 3),
+                                      "items_per_second": round(len(items) / elapsed, 2)}}) + "\n"
+
+    return Response(stream_with_context(stream()), mimetype='application/x-ndjson')
+
+@app.route('/api/metrics')
+def api_metrics():
+    """Counters from the background workers."""
+    return jsonify({
+        "risk_scheduler": risk_scheduler.stats(),
+        "qr_cache": qr_artifact_cache.stats(),
+        "qr_png_cache": qr_png_cache_stats(),
+        "gcode_cache": gcode_cache.stats(),
+        "qr_verification": bulk_module.last_verification
+    })
+
+@app.route('/api/simulate/<uid>')
+def api_simulate(uid):
+    """
+    Dry-run a fitting's G-code per method (all by default, or ?methods=raster,vector):
+    estimated job time and whether the simulated burn decodes.
+    """
+    methods = request.args.get('methods', ','.join(GCODE_METHODS)).split(',')
+    unknown = [m for m in methods if m not in GCODE_METHODS]
+    if unknown:
+        return jsonify({"error": f"unknown method(s): {', '.join(unknown)}"}), 400
+    qr_content = fitting_content(uid, DB)
+    if qr_content is None:
+        return jsonify({"error": f"Fitting {uid} not found"}), 404
+    return jsonify({"uid": uid, "results": compare_methods(qr_content, methods)})
+
 VENDOR_DB = 'vendors.db'
 
 @app.route('/vendor/<int:vendor_id>')
@@ -1097,7 +794,7 @@ def show_vendor_details(vendor_id):
 def view_record(uid):
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute("SELECT * FROM fittings WHERE uid=?", (uid,))
+    c.execute("SELECT * FROM fittings_live WHERE uid=?", (uid,))
     row = c.fetchone()
     conn.close()
     
@@ -1113,57 +810,46 @@ def view_record(uid):
 def send_gcode(uid):
     """
     send_gcode expects form data optionally containing:
-      - method: 'raster' | 'vector' | 'fallback'  (default 'raster')
-      - stream_delay: optional float seconds between lines (default 0.02)
+      - method: 'raster' | 'vector' | 'fallback' | 'modules'  (default 'raster')
+      - stream_delay: optional float seconds to pause after each line (default 0)
     """
     method = request.form.get('method', 'raster').lower()
     try:
-        command_delay = float(request.form.get('stream_delay', 0.02))
+        command_delay = max(0.0, float(request.form.get('stream_delay', 0)))
     except Exception:
-        command_delay = 0.02
+        command_delay = 0.0
 
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute("SELECT * FROM fittings WHERE uid=?", (uid,))
+    c.execute("SELECT * FROM fittings_live WHERE uid=?", (uid,))
     row = c.fetchone()
     conn.close()
     if not row:
         return f"Fitting with UID {uid} not found.", 404
 
     row_dict = dict(row)
-    qr_content = generate_qr_content(
-        row_dict.get('uid'), row_dict.get('item_type'), row_dict.get('vendor'), row_dict.get('lot'),
-        row_dict.get('supply_date'), row_dict.get('warranty_end'), row_dict.get('manufactor_date',''),
-        row_dict.get('manufactor_number',''), row_dict.get('notes',''),
-        row_dict.get('risk','Low'), row_dict.get('vendor_risk','Low'), row_dict.get('vendor_email','')
-    )
+    qr_content = fitting_qr_content(row_dict, resolve_qr_mode(row_dict))
 
-    # Generate both display + engrave QR; use the engrave one for g-code generation
-    _, qr_path_engrave = save_qr_image(uid, qr_content)
+    # Keep the published display + engrave PNGs current (a no-op when they
+    # already match); the g-code itself is generated from the in-memory
+    # engrave raster (no PNG read-back)
+    save_qr_image(uid, qr_content)
 
-    # Choose generator
+    # Choose generator (anything unknown falls back to raster)
+    if method not in GCODE_METHODS:
+        method = 'raster'
+    # Lines come from the G-code cache (generated on a miss) and go to the
+    # ESP32 as they arrive, written to the G-code file on the way
+    gcode_path = os.path.join(qr_dir, f"{uid}_engrave.gcode")
     try:
-        if method == 'vector':
-            gcode_text = qr_to_gcode_final(qr_path_engrave, laser_power=255, travel_speed=5000, engrave_speed=1500, target_size_mm=20.0)
-            print(f"[Vector] Generated {len(gcode_text.splitlines())} lines of G-code")
-        elif method == 'fallback':
-            gcode_text = qr_to_gcode_fallback(qr_path_engrave, laser_power=255, scale=0.5)
-            print(f"[Fallback] Generated {len(gcode_text.splitlines())} lines of G-code")
-        else:  # default raster
-            gcode_text = qr_to_gcode_raster(qr_path_engrave, laser_power=255, travel_speed=5000, engrave_speed=1500, target_size_mm=20.0)
-            print(f"[Raster] Generated {len(gcode_text.splitlines())} lines of G-code")
+        lines = tee_gcode_file(iter_cached_fitting_gcode(qr_content, method), gcode_path)
+        first = next(lines)
+        # Stream/send to ESP32 via websocket
+        success, resp_text = stream_gcode_to_esp32(first, lines, command_delay)
     except Exception as e:
         print(f"[G-code generation] Failed: {e}")
         return f"G-code generation failed: {e}", 500
-
-    # Save G-code file
-    gcode_path = os.path.join(qr_dir, f"{uid}_engrave.gcode")
-    with open(gcode_path, "w") as f:
-        f.write(gcode_text)
     print(f"[GCODE] Saved at {gcode_path}")
-
-    # Stream/send to ESP32 via websocket
-    success, resp_text = send_gcode_to_esp32_enhanced(gcode_text)
     msg = f"G-code sent successfully! {resp_text}" if success else f"Failed: {resp_text}"
     return redirect(url_for('view_record', uid=uid, msg=msg))
 
@@ -1171,18 +857,23 @@ def send_gcode(uid):
 def regenerate_qr(uid):
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute("SELECT * FROM fittings WHERE uid=?", (uid,))
+    c.execute("SELECT * FROM fittings_live WHERE uid=?", (uid,))
     row = c.fetchone()
     conn.close()
     if not row:
         return f"Fitting with UID {uid} not found.", 404
     row_dict = dict(row)
-    qr_content = generate_qr_content(
-        row_dict.get('uid'), row_dict.get('item_type'), row_dict.get('vendor'), row_dict.get('lot'),
-        row_dict.get('supply_date'), row_dict.get('warranty_end'), row_dict.get('manufactor_date',''),
-        row_dict.get('manufactor_number',''), row_dict.get('notes',''),
-        row_dict.get('risk','Low'), row_dict.get('vendor_risk','Low')
-    )
+
+    # Optional switch of this fitting's QR mode; 'vendor' clears the override
+    new_mode = request.form.get('qr_mode', '')
+    if new_mode in QR_MODES or new_mode == 'vendor':
+        row_dict['qr_mode'] = new_mode if new_mode in QR_MODES else None
+        conn = get_db_connection()
+        conn.execute("UPDATE fittings SET qr_mode=? WHERE uid=?", (row_dict['qr_mode'], uid))
+        conn.commit()
+        conn.close()
+
+    qr_content = fitting_qr_content(row_dict, resolve_qr_mode(row_dict))
     save_qr_image(uid, qr_content)
     msg = f"QR regenerated for UID {uid}."
     return redirect(url_for('view_record', uid=uid, msg=msg))
@@ -1197,9 +888,9 @@ def send_vendor_gcode(vendor_id):
     
     method = request.form.get('method', 'raster').lower()
     try:
-        command_delay = float(request.form.get('stream_delay', 0.02))
+        command_delay = max(0.0, float(request.form.get('stream_delay', 0)))
     except Exception:
-        command_delay = 0.02
+        command_delay = 0.0
 
     # Get vendor details
     conn = get_vendor_db_connection()
@@ -1214,32 +905,25 @@ def send_vendor_gcode(vendor_id):
     # Convert sqlite3.Row to dictionary properly
     vendor_dict = {key: vendor[key] for key in vendor.keys()}
     
-    # Generate vendor QR content and image
-    vendor_qr_content = generate_vendor_qr_content(vendor_dict)
-    qr_path = save_vendor_qr_image(vendor_id, vendor_qr_content)
+    # Generate vendor QR content
+    vendor_qr_content = live_vendor_qr_content(vendor_dict)
 
-    # Choose generator
+    # Choose generator ('vector', 'modules', anything else raster); lines come
+    # from the G-code cache or are generated, and are streamed to the ESP32
+    # and saved on the way
+    vendor_gcode_dir = os.path.join("static", "vendor_gcode")
+    os.makedirs(vendor_gcode_dir, exist_ok=True)
+    gcode_path = os.path.join(vendor_gcode_dir, f"vendor_{vendor_id}_engrave.gcode")
     try:
-        if method == 'vector':
-            gcode_text = vendor_qr_to_gcode_vector(qr_path, laser_power=255, travel_speed=5000, engrave_speed=1500, target_size_mm=25.0)
-            print(f"[Vector] Generated {len(gcode_text.splitlines())} lines of G-code for vendor QR")
-        else:  # default raster
-            gcode_text = vendor_qr_to_gcode_raster(qr_path, laser_power=255, travel_speed=5000, engrave_speed=1500, target_size_mm=25.0)
-            print(f"[Raster] Generated {len(gcode_text.splitlines())} lines of G-code for vendor QR")
+        lines = tee_gcode_file(gcode_cache.lines(*vendor_gcode_source(vendor_id, vendor_qr_content, method)),
+                               gcode_path)
+        first = next(lines)
+        # Stream/send to ESP32 via websocket
+        success, resp_text = stream_gcode_to_esp32(first, lines, command_delay)
     except Exception as e:
         print(f"[Vendor G-code generation] Failed: {e}")
         return f"Vendor G-code generation failed: {e}", 500
-
-    # Save G-code file
-    vendor_gcode_dir = os.path.join("static", "vendor_gcode")
-    os.makedirs(vendor_gcode_dir, exist_ok=True)
-    gcode_path = os.path.join(vendor_gcode_dir, f"vendor_{vendor_id}_engrave.gcode")
-    with open(gcode_path, "w") as f:
-        f.write(gcode_text)
     print(f"[Vendor GCODE] Saved at {gcode_path}")
-
-    # Stream/send to ESP32 via websocket
-    success, resp_text = send_gcode_to_esp32_enhanced(gcode_text)
     msg = f"Vendor G-code sent successfully! {resp_text}" if success else f"Failed: {resp_text}"
     return redirect(url_for('vendor_dashboard', msg=msg))
 
@@ -1247,105 +931,94 @@ def send_vendor_gcode(vendor_id):
 def scan(uid):
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute("SELECT * FROM fittings WHERE uid=?", (uid,))
+    c.execute("SELECT * FROM fittings_live WHERE uid=?", (uid,))
     row = c.fetchone()
     conn.close()
 
     if not row:
         return "UID not found", 404
 
+    # Reference-mode QRs carry a tag; a bad one means a forged or mistyped code
+    verified = False
+    if request.args.get('t'):
+        if not verify_reference_tag(uid, request.args.get('t'), request.args.get('v')):
+            return "QR signature check failed", 403
+        verified = True
+
     # Convert to dictionary
     row_dict = {key: row[key] for key in row.keys()}
     
     risk = row_dict.get('risk', 'Unknown')
     vendor_risk = row_dict.get('vendor_risk', 'Unknown')
-    inspection_date = row_dict.get('inspection_date') or compute_next_inspection(
-        row_dict.get('inspection_date'), 
-        row_dict.get('repair_date'), 
-        row_dict.get('risk')
-    )
-
-    # Build QR content; embed minimal info for scanning template
-    qr_content = generate_qr_content(
-        row_dict.get('uid'),
-        row_dict.get('item_type', ''),
-        row_dict.get('vendor', ''),
-        row_dict.get('lot', ''),
-        row_dict.get('supply_date', ''),
-        row_dict.get('warranty_end', ''),
-        row_dict.get('manufactor_date', ''),
-        row_dict.get('manufactor_number', ''),
-        row_dict.get('notes', ''),
-        row_dict.get('vendor_email',''),
-        risk,
-        vendor_risk
-    )
+    inspection_date = row_dict.get('inspection_date') or compute_next_inspection(row_dict.get('next_inspection_day'))
 
-    qr_b64 = generate_qr_image_base64(qr_content)
-    
+    # The QR image itself is served (and browser-cached) by scan_qr_png
     return render_template(
         'scan.html',
         uid=row_dict.get('uid'),
         risk=risk,
         vendor_risk=vendor_risk,
         inspection_date=inspection_date,
-        qr_code=qr_b64
+        verified=verified
     )
 
+@app.route('/scan/<uid>/qr.png')
+def scan_qr_png(uid):
+    """The fitting's QR as engraved, as a revalidated PNG."""
+    conn = get_db_connection()
+    c = conn.cursor()
+    c.execute("SELECT * FROM fittings_live WHERE uid=?", (uid,))
+    row = c.fetchone()
+    conn.close()
+    if not row:
+        return "UID not found", 404
+
+    row_dict = dict(row)
+    return qr_png_response(fitting_qr_content(row_dict, resolve_qr_mode(row_dict)))
+
+@app.route('/S/<uid>/<int:version>/<tag>')
+def scan_short(uid, version, tag):
+    """Short all-caps form of a reference QR link."""
+    return redirect(url_for('scan', uid=uid, v=version, t=tag))
+
 @app.route('/test_qr/<uid>')
 def test_qr(uid):
     """Return the display QR image for visual testing."""
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute("SELECT * FROM fittings WHERE uid=?", (uid,))
+    c.execute("SELECT * FROM fittings_live WHERE uid=?", (uid,))
     row = c.fetchone()
     conn.close()
     if not row:
         return "UID not found", 404
 
     row_dict = dict(row)
-    qr_content = generate_qr_content(
-        row_dict.get('uid'), row_dict.get('item_type'), row_dict.get('vendor'), row_dict.get('lot'),
-        row_dict.get('supply_date'), row_dict.get('warranty_end'), row_dict.get('manufactor_date',''),
-        row_dict.get('manufactor_number',''), row_dict.get('notes',''),
-        row_dict.get('risk','Low'), row_dict.get('vendor_risk','Low'), row_dict.get('vendor_email','')
-    )
+    qr_content = fitting_qr_content(row_dict, resolve_qr_mode(row_dict))
 
     display_path, _ = save_qr_image(uid, qr_content)
     return send_file(display_path, mimetype='image/png')
 
 # === Background threads ===
-def periodic_risk_update():
-    while True:
-        try:
-            update_all_risks()
-        except Exception as e:
-            print("[Risk Update] Exception:", e)
-        time.sleep(3600)
-
 def validate_all_qr_codes():
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM fittings")
-    rows = c.fetchall()
-    for row in rows:
-        row_dict = dict(row)
-        uid = row_dict.get('uid')
-        display, engrave = os.path.join(qr_dir, f"{uid}_display.png"), os.path.join(qr_dir, f"{uid}_engrave.png")
-        qr_content = generate_qr_content(
-            row_dict.get('uid'), row_dict.get('item_type'), row_dict.get('vendor'), row_dict.get('lot'),
-            row_dict.get('supply_date'), row_dict.get('warranty_end'), row_dict.get('manufactor_date',''),
-            row_dict.get('manufactor_number',''), row_dict.get('notes',''),
-            row_dict.get('risk','Low'), row_dict.get('vendor_risk','Low'), row_dict.get('vendor_email','')
-        )
+    """Decode-verify every stored QR image and re-publish any that are not valid."""
+    try:
+        summary, problems = verify_qr_images(DB)
+    except Exception as e:
+        print(f"[QR Validation] Verification failed: {e}")
+        return
+    print(f"[QR Validation] {summary['images']} images: {summary['valid']} valid, {summary['mismatch']} stale, "
+          f"{summary['unreadable']} unreadable, {summary['missing']} missing ({summary['seconds']}s)")
+
+    # Artifacts come from the content-addressed cache, so this is cheap for intact renders
+    stale = sorted({p['uid'] for p in problems})
+    if not stale:
+        return
+    for uid, qr_content in load_bulk_items(uids=stale, db_path=DB):
         try:
-            if not os.path.exists(display) or not os.path.exists(engrave):
-                save_qr_image(uid, qr_content)
-                print(f"[QR Validation] Generated QR for UID {uid}")
+            save_qr_image(uid, qr_content)
+            print(f"[QR Validation] Regenerated QR for UID {uid}")
         except Exception as e:
             print(f"[QR Validation] Error for UID {uid}: {e}")
-    conn.close()
-    print("[QR Validation] All QR codes checked.")
 
 def retry_pending_sync():
     while True:
@@ -1353,7 +1026,7 @@ def retry_pending_sync():
         c = conn.cursor()
 
         # --- Pending UDM Sync ---
-        c.execute("SELECT * FROM fittings WHERE udm_synced=0")
+        c.execute("SELECT * FROM fittings_live WHERE udm_synced=0")
         pending_udm = c.fetchall()
 
         for row in pending_udm:
@@ -1399,7 +1072,7 @@ def retry_pending_sync():
                 print(f"[UDM Retry] error pushing {r.get('uid')}: {e}")
 
         # --- Pending TMS Sync ---
-        c.execute("SELECT * FROM fittings WHERE tms_synced=0")
+        c.execute("SELECT * FROM fittings_live WHERE tms_synced=0")
         pending_tms = c.fetchall()
 
         for row in pending_tms:
@@ -1449,7 +1122,7 @@ def retry_pending_sync():
 
 # === Run app ===
 if __name__ == '__main__':
-    threading.Thread(target=periodic_risk_update, daemon=True).start()
+    threading.Thread(target=risk_scheduler.run, daemon=True).start()
     threading.Thread(target=validate_all_qr_codes, daemon=True).start()
     threading.Thread(target=retry_pending_sync, daemon=True).start()
 
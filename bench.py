@@ -0,0 +1,568 @@
+"""
+Benchmarks for the slow paths of the vendor site.
+
+Usage:
+    python bench.py risk [--rows 10000 100000 1000000] [--legacy-max 10000]
+    python bench.py anime [--versions 1 5 10 20 40] [--repeat 3]
+    python bench.py bulk [--items 32] [--workers 1 2 4 8] [--method raster]
+    python bench.py payload [--db fittings.db] [--rows 200] [--show 20]
+    python bench.py render [--lengths 20 100 300 1000] [--repeat 5]
+    python bench.py raster [--lengths 20 100 300 1000] [--repeat 3]
+    python bench.py modules [--lengths 20 100 300 1000] [--module-mm 0.4] [--repeat 50]
+    python bench.py travel [--plates 1 4 16 36] [--repeat 3]
+    python bench.py compact [--lengths 20 300] [--repeat 3]
+    python bench.py stream [--lengths 20 300 1000] [--methods raster modules]
+    python bench.py sender [--latency-ms 0 5 20] [--lines 300] [--window 127]
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+import qrcode
+import websockets
+
+import ai_module
+import bulk_module
+import esp32_module
+import gcode_module
+import qr_module
+from ai_module import get_risk_level, calculate_dates, get_failure_count, vendor_risk_from_failures
+# The per-pixel loops are kept only as the test suite's references
+from tests.test_anime_qr import reference_apply_anime_effects, qr_base_image
+from tests.test_raster_gcode import reference_qr_to_gcode_raster
+
+NOTES_SAMPLES = ["", "ok", "good condition", "minor wear", "loose bolt", "leak near joint",
+                 "corrosion spotted", "bad fit", "perfect fittings", "checked"]
+
+
+# === Risk recompute ===
+def legacy_update_all_risks(db_path):
+    """The row-by-row recompute that update_all_risks replaced, kept for comparison."""
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.execute("SELECT uid, warranty_end, notes, vendor_id, manufactor_date, supply_date FROM fittings")
+    rows = c.fetchall()
+
+    for uid, warranty_end, notes, vendor_id, manufactor_date, supply_date in rows:
+        failure_count = get_failure_count(uid, db_path)
+        payload = {
+            "uid": uid,
+            "warranty_end": warranty_end,
+            "notes": notes,
+            "failure_count": failure_count
+        }
+        risk = get_risk_level(payload)
+        risk_flag = 1 if risk == "High" else 0
+        inspection_date, repair_date = calculate_dates(manufactor_date, supply_date, warranty_end, risk)
+        c.execute("""
+            UPDATE fittings
+            SET risk=?, risk_flag=?, failure_count=?, inspection_date=?, repair_date=?
+            WHERE uid=?
+        """, (risk, risk_flag, failure_count, inspection_date, repair_date, uid))
+        c.execute("SELECT SUM(failure_count) FROM fittings WHERE vendor_id=?", (vendor_id,))
+        vendor_risk = vendor_risk_from_failures(c.fetchone()[0] or 0)
+        c.execute("UPDATE fittings SET vendor_risk=? WHERE vendor_id=?", (vendor_risk, vendor_id))
+
+    conn.commit()
+    conn.close()
+
+def make_fittings_db(path, rows, vendors=50, seed=1):
+    rng = random.Random(seed)
+    today = datetime.today().date()
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    c.execute("""
+        CREATE TABLE fittings (
+            uid TEXT PRIMARY KEY, item_type TEXT, vendor TEXT, vendor_id TEXT, lot TEXT,
+            supply_date TEXT, warranty TEXT, warranty_end TEXT, manufactor_date TEXT,
+            manufactor_number TEXT, notes TEXT, vendor_email TEXT,
+            udm_synced INTEGER DEFAULT 0, tms_synced INTEGER DEFAULT 0,
+            risk_flag INTEGER DEFAULT 0, risk TEXT DEFAULT 'Low', vendor_risk TEXT DEFAULT 'Low',
+            inspection_date TEXT, repair_date TEXT, failure_count INTEGER DEFAULT 0
+        )
+    """)
+    c.execute("CREATE INDEX idx_fittings_vendor_id ON fittings(vendor_id)")
+
+    def fitting(i):
+        supply = today - timedelta(days=rng.randint(0, 1500))
+        manufactor = supply - timedelta(days=rng.randint(0, 90)) if rng.random() < 0.7 else None
+        warranty_end = supply + timedelta(days=rng.randint(30, 2000))
+        return (f"UID{i:08d}", "clip", f"Vendor {i % vendors}", str(i % vendors), f"LOT{i // 100}",
+                supply.isoformat(), warranty_end.isoformat(),
+                manufactor.isoformat() if manufactor else "",
+                rng.choice(NOTES_SAMPLES), rng.choice([0, 0, 0, 1, 2, 3]))
+
+    batch = 50000
+    for start in range(0, rows, batch):
+        c.executemany("""
+            INSERT INTO fittings (uid, item_type, vendor, vendor_id, lot, supply_date, warranty_end,
+                                  manufactor_date, notes, failure_count)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [fitting(i) for i in range(start, min(rows, start + batch))])
+    conn.commit()
+    conn.close()
+
+def risk_snapshot(path):
+    conn = sqlite3.connect(path)
+    c = conn.cursor()
+    # The recompute no longer writes vendor_risk per row; read it through the view
+    c.execute("SELECT name FROM sqlite_master WHERE type='view' AND name='fittings_live'")
+    table = "fittings_live" if c.fetchone() else "fittings"
+    c.execute(f"""SELECT uid, risk, risk_flag, inspection_date, repair_date, vendor_risk
+                  FROM {table} ORDER BY uid""")
+    rows = c.fetchall()
+    conn.close()
+    return rows
+
+def bench_risk(sizes, legacy_max):
+    workdir = tempfile.mkdtemp(prefix="bench_risk_")
+    try:
+        print(f"{'rows':>10} {'legacy s':>10} {'bulk s':>10} {'speedup':>9}  match")
+        for rows in sizes:
+            seed_db = os.path.join(workdir, f"seed_{rows}.db")
+            make_fittings_db(seed_db, rows)
+
+            bulk_db = os.path.join(workdir, "bulk.db")
+            shutil.copy(seed_db, bulk_db)
+            t0 = time.perf_counter()
+            ai_module.update_all_risks(bulk_db)
+            bulk_s = time.perf_counter() - t0
+
+            if rows <= legacy_max:
+                legacy_db = os.path.join(workdir, "legacy.db")
+                shutil.copy(seed_db, legacy_db)
+                t0 = time.perf_counter()
+                legacy_update_all_risks(legacy_db)
+                legacy_s = time.perf_counter() - t0
+                match = "yes" if risk_snapshot(legacy_db) == risk_snapshot(bulk_db) else "NO"
+                print(f"{rows:>10} {legacy_s:>10.2f} {bulk_s:>10.2f} {legacy_s / bulk_s:>8.1f}x  {match}")
+            else:
+                print(f"{rows:>10} {'skipped':>10} {bulk_s:>10.2f} {'-':>9}  -")
+            os.remove(seed_db)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+# === Anime QR styling ===
+def best_of(repeat, fn, *args):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def bench_anime(versions, repeat):
+    print(f"{'version':>8} {'pixels':>10} {'loop ms':>10} {'numpy ms':>10} {'speedup':>9}  identical")
+    for version in versions:
+        img = qr_base_image(version)
+        loop_s, expected = best_of(repeat, reference_apply_anime_effects, img)
+        fast_s, actual = best_of(repeat, qr_module.apply_anime_effects, img)
+        identical = "yes" if np.array_equal(np.array(expected), np.array(actual)) else "NO"
+        print(f"{version:>8} {img.size[0] * img.size[1]:>10} {loop_s * 1000:>10.1f} {fast_s * 1000:>10.2f} "
+              f"{loop_s / fast_s:>8.0f}x  {identical}")
+
+# === Bulk generation ===
+def bench_bulk(items, worker_counts, method):
+    print(f"{os.cpu_count()} CPUs available")
+    print(f"{'workers':>8} {'items':>7} {'seconds':>9} {'items/s':>9} {'scaling':>8}")
+    cwd = os.getcwd()
+    base = None
+    for workers in worker_counts:
+        # Fresh output + artifact cache per run so no run benefits from another's renders
+        workdir = tempfile.mkdtemp(prefix="bench_bulk_")
+        try:
+            os.chdir(workdir)
+            os.makedirs(qr_module.qr_dir, exist_ok=True)
+            batch = [(f"BULK{i:05d}", json.dumps({"uid": f"BULK{i:05d}", "lot": "BENCH", "notes": "ok"}))
+                     for i in range(items)]
+            summary = bulk_module.bulk_generate(batch, method, workers, quiet=True)
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(workdir, ignore_errors=True)
+        rate = summary["items_per_second"]
+        base = base or rate
+        print(f"{workers:>8} {summary['ok']:>7} {summary['seconds']:>9.2f} {rate:>9.2f} {rate / base:>7.2f}x")
+
+# === QR payload size ===
+def payload_rows(db_path, rows):
+    """Fitting rows from db_path, or a synthetic table of the given size."""
+    workdir = None
+    if not db_path:
+        workdir = tempfile.mkdtemp(prefix="bench_payload_")
+        db_path = os.path.join(workdir, "fittings.db")
+        make_fittings_db(db_path, rows)
+    try:
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        result = [dict(r) for r in conn.execute("SELECT * FROM fittings ORDER BY uid")]
+        conn.close()
+        return result
+    finally:
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+def bench_payload(db_path, rows, show):
+    def modules(version):
+        return (17 + 4 * version) ** 2
+
+    print(f"{'uid':<20} {'json B':>7} {'cmp B':>7} {'json v':>7} {'cmp v':>6} {'modules saved':>14}")
+    totals = [0, 0, 0, 0]
+    fittings = payload_rows(db_path, rows)
+    for n, r in enumerate(fittings):
+        args = (r.get('uid'), r.get('item_type'), r.get('vendor'), r.get('lot'),
+                r.get('supply_date'), r.get('warranty_end'), r.get('manufactor_date',''),
+                r.get('manufactor_number',''), r.get('notes',''),
+                r.get('risk','Low'), r.get('vendor_risk','Low'), r.get('vendor_email',''))
+        as_json = qr_module.generate_qr_content(*args, fmt="json")
+        compact = qr_module.generate_qr_content(*args, fmt="compact")
+        assert qr_module.decode_qr_content(compact) == json.loads(as_json)
+        v_json, v_compact = qr_module.qr_version_for(as_json), qr_module.qr_version_for(compact)
+        saved = modules(v_json) - modules(v_compact)
+        for i, value in enumerate((len(as_json), len(compact), modules(v_json), modules(v_compact))):
+            totals[i] += value
+        if n < show:
+            print(f"{r['uid']:<20} {len(as_json):>7} {len(compact):>7} {v_json:>7} {v_compact:>6} {saved:>14}")
+    if fittings:
+        count = len(fittings)
+        print(f"{count} fittings: avg {totals[0] / count:.0f} -> {totals[1] / count:.0f} bytes, "
+              f"avg {totals[2] / count:.0f} -> {totals[3] / count:.0f} modules "
+              f"({1 - totals[3] / totals[2]:.0%} fewer)")
+
+# === Engrave raster for send_gcode ===
+def legacy_engrave_raster(qr_content, png_path):
+    """The old send_gcode input: encode, rasterize through PIL, save the PNG, read it back."""
+    qr = qrcode.QRCode(version=1, error_correction=qr_module.QR_ERROR_CORRECTION,
+                       box_size=qr_module.QR_BOX_SIZE, border=qr_module.QR_BORDER)
+    qr.add_data(qr_content)
+    qr.make(fit=True)
+    qr.make_image(fill_color="black", back_color="white").convert("RGB").save(png_path)
+    return cv2.imread(png_path, cv2.IMREAD_GRAYSCALE)
+
+def cold_engrave_array(qr_content):
+    qr_module._modules_cache.clear()
+    return qr_module.engrave_array(qr_content)
+
+def peak_kib(fn, *args):
+    """
+    Peak traced memory of one call, in KiB. Only Python/NumPy buffers are
+    traced; PIL's and libpng's own buffers are not, so the png row is a floor.
+    """
+    tracemalloc.start()
+    try:
+        fn(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 1024
+
+def bench_render(lengths, repeat):
+    workdir = tempfile.mkdtemp(prefix="bench_render_")
+    png_path = os.path.join(workdir, "engrave.png")
+    print(f"{'chars':>6} {'version':>8} {'path':<7} {'ms':>8} {'speedup':>8} {'peak KiB':>9}  identical")
+    try:
+        for length in lengths:
+            content = json.dumps({"uid": "BENCH", "notes": "x" * length})
+            version = qr_module.qr_version_for(content)
+            legacy_s, expected = best_of(repeat, legacy_engrave_raster, content, png_path)
+            rows = [("png", legacy_s, peak_kib(legacy_engrave_raster, content, png_path), expected)]
+            for label, fn in (("cold", cold_engrave_array), ("cached", qr_module.engrave_array)):
+                elapsed, actual = best_of(repeat, fn, content)
+                rows.append((label, elapsed, peak_kib(fn, content), actual))
+            for label, elapsed, peak, actual in rows:
+                identical = "yes" if np.array_equal(expected, actual) else "NO"
+                print(f"{length:>6} {version:>8} {label:<7} {elapsed * 1000:>8.2f} {legacy_s / elapsed:>7.1f}x "
+                      f"{peak:>9.0f}  {identical}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+# === Raster G-code ===
+def last_move_per_burn(gcode_text):
+    """Drop every G1 of a burn except its last: the per-pixel output reduced to run endpoints."""
+    lines = gcode_text.split("\n")
+    return "\n".join(line for line, nxt in zip(lines, lines[1:] + [""])
+                     if not (line.startswith("G1 ") and nxt.startswith("G1 ")))
+
+def bench_raster(lengths, repeat):
+    print(f"{'chars':>6} {'pixels':>8} {'old ms':>8} {'new ms':>8} {'speedup':>8} "
+          f"{'old lines':>10} {'new lines':>10} {'old KiB':>8} {'new KiB':>8}  same coverage")
+    for length in lengths:
+        img = qr_module.engrave_array(json.dumps({"uid": "BENCH", "notes": "x" * length}))
+        old_s, old = best_of(repeat, reference_qr_to_gcode_raster, img)
+        new_s, new = best_of(repeat, gcode_module.qr_to_gcode_raster, img)
+        same = "yes" if last_move_per_burn(old) == new else "NO"
+        print(f"{length:>6} {img.size:>8} {old_s * 1000:>8.0f} {new_s * 1000:>8.1f} {old_s / new_s:>7.1f}x "
+              f"{old.count(chr(10)) + 1:>10} {new.count(chr(10)) + 1:>10} "
+              f"{len(old) / 1024:>8.0f} {len(new) / 1024:>8.0f}  {same}")
+
+# === Module-grid toolpath ===
+def bench_modules(lengths, module_mm, repeat):
+    print(f"{'chars':>6} {'modules':>8} {'path':<9} {'ms':>8} {'lines':>8} {'KiB':>7}")
+    for length in lengths:
+        content = json.dumps({"uid": "BENCH", "notes": "x" * length})
+        modules = qr_module.qr_modules(content)
+        size_mm = module_mm * modules.shape[1]
+        img = qr_module.engrave_array(content)
+        runs = [("raster", gcode_module.qr_to_gcode_raster, (img, 255, 5000, 1500, size_mm)),
+                ("modules", gcode_module.qr_modules_to_gcode, (modules, module_mm)),
+                ("merged", lambda m, mm: gcode_module.qr_modules_to_gcode(m, mm, merge_rows=True),
+                 (modules, module_mm))]
+        for label, fn, args in runs:
+            elapsed, text = best_of(repeat if label != "raster" else 3, fn, *args)
+            print(f"{length:>6} {modules.size:>8} {label:<9} {elapsed * 1000:>8.3f} "
+                  f"{text.count(chr(10)) + 1:>8} {len(text) / 1024:>7.0f}")
+
+# === Vector travel ordering ===
+def plate_contours(count):
+    """Simplified contours of count fitting QRs tiled on a square plate, in pixels."""
+    side = int(np.ceil(np.sqrt(count)))
+    tiles = [qr_module.engrave_array(json.dumps({"uid": f"PLATE{i:03d}", "notes": "ok"})) for i in range(count)]
+    blank = np.full_like(tiles[0], 255)
+    tiles += [blank] * (side * side - count)
+    plate = np.vstack([np.hstack(tiles[r * side:(r + 1) * side]) for r in range(side)])
+    _, thresh = cv2.threshold(plate, 127, 255, cv2.THRESH_BINARY_INV)
+    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    paths = [cv2.approxPolyDP(c, 0.002 * cv2.arcLength(c, True), True)[:, 0, :]
+             for c in contours if cv2.contourArea(c) > 5]
+    return [p for p in paths if len(p) >= 2], 20.0 * side / plate.shape[1]
+
+def bench_travel(plates, repeat):
+    print(f"{'QRs':>5} {'contours':>9} {'before mm':>10} {'after mm':>9} {'saved':>6} {'order ms':>9}")
+    for count in plates:
+        paths, mm_per_px = plate_contours(count)
+        elapsed, (_, _, before, after) = best_of(repeat, gcode_module.order_closed_paths, paths)
+        print(f"{count:>5} {len(paths):>9} {before * mm_per_px:>10.0f} {after * mm_per_px:>9.0f} "
+              f"{1 - after / before:>6.0%} {elapsed * 1000:>9.1f}")
+
+# === G-code compaction ===
+def raw_fitting_gcode(content, method):
+    """fitting_gcode without the compaction step."""
+    if method == "modules":
+        modules = qr_module.qr_modules(content)
+        return gcode_module.qr_modules_to_gcode(modules, 20.0 / modules.shape[1],
+                                                keepout=qr_module.logo_keepout(modules))
+    return gcode_module.generate_gcode(qr_module.engrave_array(content), method)
+
+def bench_compact(lengths, repeat):
+    print(f"{'chars':>6} {'method':<9} {'lines':>8} {'->':>2} {'lines':>7} {'KiB':>7} {'->':>2} {'KiB':>6} "
+          f"{'saved':>6} {'ms':>7}")
+    for length in lengths:
+        content = json.dumps({"uid": "BENCH", "notes": "x" * length})
+        for method in gcode_module.GCODE_METHODS:
+            with contextlib.redirect_stdout(io.StringIO()):
+                raw = raw_fitting_gcode(content, method)
+                elapsed, compacted = best_of(repeat, gcode_module.compact_gcode, raw)
+            print(f"{length:>6} {method:<9} {raw.count(chr(10)) + 1:>8} {'':>2} {compacted.count(chr(10)) + 1:>7} "
+                  f"{len(raw) / 1024:>7.0f} {'':>2} {len(compacted) / 1024:>6.0f} "
+                  f"{1 - len(compacted) / len(raw):>6.0%} {elapsed * 1000:>7.1f}")
+
+
+# === Streaming G-code ===
+def string_send(content, method, gcode_path):
+    """The pre-streaming send path: whole text, then file, then the sender's line list. Returns seconds to first line."""
+    t0 = time.perf_counter()
+    gcode_text = gcode_module.fitting_gcode(content, method)
+    with open(gcode_path, "w") as f:
+        f.write(gcode_text)
+    lines = [line.strip() for line in gcode_text.splitlines() if line.strip() and not line.lstrip().startswith(';')]
+    first = time.perf_counter() - t0
+    for _ in lines:
+        pass
+    return first
+
+def streamed_send(content, method, gcode_path):
+    """tee_gcode_file over iter_fitting_gcode, as send_gcode runs it. Returns seconds to first line."""
+    t0 = time.perf_counter()
+    lines = gcode_module.tee_gcode_file(gcode_module.iter_fitting_gcode(content, method), gcode_path)
+    next(lines)
+    first = time.perf_counter() - t0
+    for _ in lines:
+        pass
+    return first
+
+def bench_stream(lengths, methods):
+    workdir = tempfile.mkdtemp(prefix="bench_stream_")
+    gcode_path = os.path.join(workdir, "engrave.gcode")
+    print(f"{'chars':>6} {'method':<9} {'path':<7} {'first ms':>9} {'total ms':>9} {'peak KiB':>9}")
+    try:
+        for length in lengths:
+            content = json.dumps({"uid": "BENCH", "notes": "x" * length})
+            for method in methods:
+                for label, fn in (("string", string_send), ("stream", streamed_send)):
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        fn(content, method, gcode_path)  # warm the module matrix cache
+                        t0 = time.perf_counter()
+                        first = fn(content, method, gcode_path)
+                        total = time.perf_counter() - t0
+                        peak = peak_kib(fn, content, method, gcode_path)
+                    print(f"{length:>6} {method:<9} {label:<7} {first * 1000:>9.1f} {total * 1000:>9.1f} {peak:>9.0f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# === ESP32 sender ===
+async def legacy_stream_gcode(websocket, gcode_text, command_delay=0.02):
+    """The stop-and-wait sender that stream_gcode replaced: send, wait for the ack, sleep command_delay."""
+    lines = [line.strip() for line in gcode_text.splitlines() if line.strip() and not line.lstrip().startswith(';')]
+    stats = {"lines": len(lines), "acked": 0, "bytes": sum(len(line) + 1 for line in lines)}
+    t0 = time.perf_counter()
+    for line in lines:
+        await websocket.send(line)
+        try:
+            ack = await asyncio.wait_for(websocket.recv(), timeout=1.0)
+            stats["acked"] += "ok" in ack.lower()
+        except asyncio.TimeoutError:
+            pass
+        await asyncio.sleep(command_delay)
+    stats["seconds"] = time.perf_counter() - t0
+    return stats
+
+class ControllerStandIn:
+    """
+    Local websocket server in place of the ESP32: acks each line latency
+    seconds after it arrives and tracks the bytes it holds unacknowledged
+    against an rx_buffer-byte receive buffer.
+    """
+    def __init__(self, latency, rx_buffer=esp32_module.ESP32_RX_BUFFER):
+        self.latency = latency
+        self.rx_buffer = rx_buffer
+        self.buffered = self.peak = self.overflows = 0
+
+    async def handler(self, websocket):
+        pending = set()
+        async for line in websocket:
+            size = len(line) + 1
+            self.buffered += size
+            self.peak = max(self.peak, self.buffered)
+            self.overflows += self.buffered > self.rx_buffer
+            task = asyncio.create_task(self._ack(websocket, size))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+
+    async def _ack(self, websocket, size):
+        await asyncio.sleep(self.latency)
+        self.buffered -= size
+        await websocket.send("ok")
+
+async def run_sender(latency, sender, gcode_text):
+    controller = ControllerStandIn(latency)
+    async with websockets.serve(controller.handler, "127.0.0.1", 0) as server:
+        port = server.sockets[0].getsockname()[1]
+        async with websockets.connect(f"ws://127.0.0.1:{port}") as websocket:
+            stats = await sender(websocket, gcode_text)
+    return stats, controller
+
+def bench_sender(latencies_ms, lines, window):
+    content = json.dumps({"uid": "BENCH", "notes": "x" * 100})
+    with contextlib.redirect_stdout(io.StringIO()):
+        gcode_text = "\n".join(gcode_module.fitting_gcode(content, "raster").splitlines()[:lines])
+    senders = (
+        ("legacy 20ms", lambda ws, text: legacy_stream_gcode(ws, text, 0.02)),
+        ("one line", lambda ws, text: esp32_module.stream_gcode(ws, text, window_bytes=0)),
+        (f"window {window}", lambda ws, text: esp32_module.stream_gcode(ws, text, window_bytes=window)),
+    )
+    print(f"{'RTT ms':>6} {'sender':<12} {'lines':>6} {'acked':>6} {'s':>7} {'lines/s':>8} {'B/s':>8} "
+          f"{'peak RX':>8} {'overflow':>8}")
+    for latency_ms in latencies_ms:
+        for label, sender in senders:
+            stats, controller = asyncio.run(run_sender(latency_ms / 1000, sender, gcode_text))
+            print(f"{latency_ms:>6} {label:<12} {stats['lines']:>6} {stats['acked']:>6} {stats['seconds']:>7.2f} "
+                  f"{stats['lines'] / stats['seconds']:>8.0f} {stats['bytes'] / stats['seconds']:>8.0f} "
+                  f"{controller.peak:>8} {controller.overflows:>8}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p_risk = sub.add_parser("risk", help="row-by-row vs bulk update_all_risks")
+    p_risk.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    p_risk.add_argument("--legacy-max", type=int, default=10000,
+                        help="largest table the legacy recompute is timed on (it is quadratic)")
+
+    p_anime = sub.add_parser("anime", help="per-pixel loop vs vectorized apply_anime_effects")
+    p_anime.add_argument("--versions", type=int, nargs="+", default=[1, 5, 10, 20, 40])
+    p_anime.add_argument("--repeat", type=int, default=3)
+
+    p_bulk = sub.add_parser("bulk", help="bulk QR + G-code generation at several pool sizes")
+    p_bulk.add_argument("--items", type=int, default=32)
+    p_bulk.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    p_bulk.add_argument("--method", choices=bulk_module.GCODE_METHODS, default="raster")
+
+    p_payload = sub.add_parser("payload", help="QR version/modules of JSON vs compact fitting payloads")
+    p_payload.add_argument("--db", help="fittings database to report on (default: synthetic fittings)")
+    p_payload.add_argument("--rows", type=int, default=200, help="synthetic fittings when --db is not given")
+    p_payload.add_argument("--show", type=int, default=20, help="per-fitting lines to print")
+
+    p_render = sub.add_parser("render", help="engrave raster via PNG round trip vs the module matrix")
+    p_render.add_argument("--lengths", type=int, nargs="+", default=[20, 100, 300, 1000],
+                          help="notes length of the synthetic payloads")
+    p_render.add_argument("--repeat", type=int, default=5)
+
+    p_raster = sub.add_parser("raster", help="per-pixel vs run-length raster G-code")
+    p_raster.add_argument("--lengths", type=int, nargs="+", default=[20, 100, 300, 1000],
+                          help="notes length of the synthetic payloads")
+    p_raster.add_argument("--repeat", type=int, default=3)
+
+    p_modules = sub.add_parser("modules", help="pixel raster vs module-grid toolpath G-code")
+    p_modules.add_argument("--lengths", type=int, nargs="+", default=[20, 100, 300, 1000],
+                           help="notes length of the synthetic payloads")
+    p_modules.add_argument("--module-mm", type=float, default=0.4)
+    p_modules.add_argument("--repeat", type=int, default=50)
+
+    p_travel = sub.add_parser("travel", help="vector contour travel before/after ordering, single QR and plates")
+    p_travel.add_argument("--plates", type=int, nargs="+", default=[1, 4, 16, 36],
+                          help="QRs per plate (20 mm each)")
+    p_travel.add_argument("--repeat", type=int, default=3)
+
+    p_compact = sub.add_parser("compact", help="G-code lines/bytes before and after compact_gcode, per method")
+    p_compact.add_argument("--lengths", type=int, nargs="+", default=[20, 300],
+                           help="notes length of the synthetic payloads")
+    p_compact.add_argument("--repeat", type=int, default=3)
+
+    p_stream = sub.add_parser("stream", help="time to first line and peak memory, whole-string vs streamed G-code")
+    p_stream.add_argument("--lengths", type=int, nargs="+", default=[20, 300, 1000],
+                          help="notes length of the synthetic payloads")
+    p_stream.add_argument("--methods", nargs="+", choices=gcode_module.GCODE_METHODS, default=["raster", "modules"])
+
+    p_sender = sub.add_parser("sender", help="legacy vs one-line vs windowed ESP32 sender against a local stand-in")
+    p_sender.add_argument("--latency-ms", type=float, nargs="+", default=[0, 5, 20],
+                          help="round trip the stand-in adds before each ack")
+    p_sender.add_argument("--lines", type=int, default=300, help="raster G-code lines to send")
+    p_sender.add_argument("--window", type=int, default=esp32_module.ESP32_RX_BUFFER,
+                          help="bytes in flight for the windowed sender")
+
+    args = parser.parse_args()
+    if args.bench == "risk":
+        bench_risk(args.rows, args.legacy_max)
+    elif args.bench == "anime":
+        bench_anime(args.versions, args.repeat)
+    elif args.bench == "bulk":
+        bench_bulk(args.items, args.workers, args.method)
+    elif args.bench == "payload":
+        bench_payload(args.db, args.rows, args.show)
+    elif args.bench == "render":
+        bench_render(args.lengths, args.repeat)
+    elif args.bench == "raster":
+        bench_raster(args.lengths, args.repeat)
+    elif args.bench == "modules":
+        bench_modules(args.lengths, args.module_mm, args.repeat)
+    elif args.bench == "travel":
+        bench_travel(args.plates, args.repeat)
+    elif args.bench == "compact":
+        bench_compact(args.lengths, args.repeat)
+    elif args.bench == "stream":
+        bench_stream(args.lengths, args.methods)
+    elif args.bench == "sender":
+        bench_sender(args.latency_ms, args.lines, args.window)
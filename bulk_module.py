@@ -0,0 +1,203 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+from qr_module import qr_dir, fitting_qr_content, resolve_qr_mode, save_qr_image
+from gcode_module import GCODE_METHODS, iter_fitting_gcode, tee_gcode_file
+from ai_module import QRAnomalyDetector
+
+DB = "fittings.db"
+QR_VERIFY_REPORT = os.path.join(qr_dir, "verification_report.json")
+
+# === Bulk QR + G-code generation for whole lots ===
+def load_bulk_items(uids=None, lot=None, db_path=DB):
+    """[(uid, qr_content)] for the given UIDs or every fitting in a lot."""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    c = conn.cursor()
+    if lot:
+        c.execute("SELECT * FROM fittings_live WHERE lot=? ORDER BY uid", (lot,))
+        rows = c.fetchall()
+    else:
+        rows = []
+        uids = list(dict.fromkeys(uids or []))
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(uids), 500):
+            chunk = uids[start:start + 500]
+            c.execute(f"SELECT * FROM fittings_live WHERE uid IN ({','.join('?' * len(chunk))})", chunk)
+            rows.extend(c.fetchall())
+    conn.close()
+
+    items = []
+    vendor_modes = {}
+    for row in rows:
+        row_dict = dict(row)
+        qr_content = fitting_qr_content(row_dict, resolve_qr_mode(row_dict, vendor_modes))
+        items.append((row_dict['uid'], qr_content))
+    return items
+
+def generate_item(uid, qr_content, method="raster"):
+    """
+    Worker: render the display/engrave QR and write <uid>_engrave.gcode.
+    Runs in a pool process, so it returns a small result dict rather than raising.
+    """
+    t0 = time.perf_counter()
+    result = {"uid": uid, "ok": False}
+    try:
+        display_path, engrave_path = save_qr_image(uid, qr_content)
+        gcode_path = os.path.join(qr_dir, f"{uid}_engrave.gcode")
+        lines = sum(1 for _ in tee_gcode_file(iter_fitting_gcode(qr_content, method), gcode_path))
+        result.update(ok=True, display=display_path, engrave=engrave_path,
+                      gcode=gcode_path, lines=lines)
+    except Exception as e:
+        result["error"] = str(e)
+    result["seconds"] = round(time.perf_counter() - t0, 4)
+    return result
+
+def _silence_worker():
+    sys.stdout = open(os.devnull, "w")
+
+def iter_bulk_generate(items, method="raster", workers=None, quiet=False):
+    """
+    Fan generate_item out over a process pool and yield each result as it
+    finishes, tagged with its position ('done') out of 'total'.
+    quiet drops the workers' own [QR] log lines.
+    """
+    if method not in GCODE_METHODS:
+        raise ValueError(f"method must be one of {', '.join(GCODE_METHODS)}")
+    workers = workers or os.cpu_count() or 1
+    total = len(items)
+    if not total:
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, total),
+                             initializer=_silence_worker if quiet else None) as pool:
+        futures = [pool.submit(generate_item, uid, qr_content, method) for uid, qr_content in items]
+        for done, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            result.update(done=done, total=total)
+            yield result
+
+def bulk_generate(items, method="raster", workers=None, progress=None, quiet=False):
+    """Run iter_bulk_generate to completion and return a summary dict."""
+    t0 = time.perf_counter()
+    ok = 0
+    failed = []
+    for result in iter_bulk_generate(items, method, workers, quiet):
+        if result["ok"]:
+            ok += 1
+        else:
+            failed.append({"uid": result["uid"], "error": result.get("error")})
+        if progress:
+            progress(result)
+    elapsed = time.perf_counter() - t0
+    return {
+        "total": len(items),
+        "ok": ok,
+        "failed": failed,
+        "seconds": round(elapsed, 3),
+        "items_per_second": round(len(items) / elapsed, 2) if elapsed > 0 else None,
+    }
+
+def print_progress(result):
+    status = f"{result['lines']} lines" if result["ok"] else f"FAILED: {result.get('error')}"
+    print(f"[Bulk] {result['done']}/{result['total']} {result['uid']} {status} ({result['seconds']:.2f}s)")
+
+# === Decode-verification of stored QR images ===
+# Summary of the most recent verify_qr_images run (served by /api/metrics)
+last_verification = None
+
+_worker_state = threading.local()
+
+def _worker_detector():
+    """One QRAnomalyDetector (and cv2.QRCodeDetector) per pool thread; they are not thread-safe."""
+    detector = getattr(_worker_state, "detector", None)
+    if detector is None:
+        detector = _worker_state.detector = QRAnomalyDetector()
+    return detector
+
+def verify_image(uid, kind, path, expected):
+    status, decoded = _worker_detector().check_image(path, expected)
+    result = {"uid": uid, "image": kind, "path": path, "status": status}
+    if status == "mismatch":
+        result["decoded"] = decoded
+    return result
+
+def verify_qr_images(db_path=DB, workers=None, report_path=QR_VERIFY_REPORT, progress=None):
+    """
+    Decode every fitting's display and engrave PNG across a thread pool
+    (OpenCV releases the GIL while decoding) and compare the text with the
+    QR content the fitting would get today. Writes a JSON report of every
+    image that is not "valid" and returns the summary.
+    """
+    global last_verification
+    t0 = time.perf_counter()
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    rows = [dict(r) for r in conn.execute("SELECT * FROM fittings_live")]
+    conn.close()
+
+    jobs = []
+    vendor_modes = {}
+    for row_dict in rows:
+        uid = row_dict['uid']
+        expected = fitting_qr_content(row_dict, resolve_qr_mode(row_dict, vendor_modes))
+        for kind in ("display", "engrave"):
+            jobs.append((uid, kind, os.path.join(qr_dir, f"{uid}_{kind}.png"), expected))
+
+    counts = {"valid": 0, "mismatch": 0, "unreadable": 0, "missing": 0}
+    problems = []
+    workers = workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(verify_image, *job) for job in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            counts[result["status"]] += 1
+            if result["status"] != "valid":
+                problems.append(result)
+            if progress:
+                progress(result)
+
+    elapsed = time.perf_counter() - t0
+    summary = dict(counts, fittings=len(rows), images=len(jobs), workers=workers,
+                   seconds=round(elapsed, 3),
+                   images_per_second=round(len(jobs) / elapsed, 2) if elapsed > 0 else None,
+                   finished_at=datetime.now().isoformat(timespec="seconds"),
+                   report=report_path)
+    problems.sort(key=lambda p: (p["uid"], p["image"]))
+    tmp = f"{report_path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump({"summary": summary, "problems": problems}, f, indent=2)
+    os.replace(tmp, report_path)
+    last_verification = summary
+    return summary, problems
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generate or verify QR images and engrave G-code for many fittings at once.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--lot", help="every fitting in this lot")
+    target.add_argument("--uids", nargs="+", help="explicit fitting UIDs")
+    target.add_argument("--verify", action="store_true", help="decode every stored QR image and report mismatches")
+    parser.add_argument("--method", choices=GCODE_METHODS, default="raster")
+    parser.add_argument("--workers", type=int, default=None, help="pool size (default: CPU count)")
+    parser.add_argument("--db", default=DB)
+    args = parser.parse_args()
+
+    if args.verify:
+        summary, problems = verify_qr_images(args.db, args.workers)
+        for p in problems:
+            print(f"[QR Verify] {p['uid']} {p['image']}: {p['status']}")
+        print(json.dumps(summary, indent=2))
+    else:
+        items = load_bulk_items(uids=args.uids, lot=args.lot, db_path=args.db)
+        if not items:
+            print("[Bulk] No matching fittings.")
+        else:
+            summary = bulk_generate(items, args.method, args.workers, progress=print_progress)
+            print(json.dumps(summary, indent=2))
@@ -0,0 +1,112 @@
+import asyncio
+import time
+from collections import deque
+
+import websockets
+
+# === Controller link ===
+# The ESP32 forwards each websocket message to a GRBL-style controller and
+# answers "ok" (or "error:N") once the line has left the controller's serial
+# receive buffer. Counting the characters of unacknowledged lines against
+# that buffer lets the sender keep it full without ever overflowing it.
+ESP32_RX_BUFFER = 127       # bytes in flight (GRBL's 128-byte RX buffer, one kept free)
+# A line is only acked once it leaves the RX buffer, which can wait behind a
+# full planner queue of slow burn moves, so this is generous; hitting it
+# aborts the job rather than guessing which line the controller still holds.
+ESP32_ACK_TIMEOUT_S = 30.0
+
+def _ack_kind(message):
+    """'ok', 'error' or None (not a line acknowledgement) for one controller message."""
+    text = message.lower() if isinstance(message, str) else ""
+    if "ok" in text or "ready" in text:
+        return "ok"
+    if "error" in text:
+        return "error"
+    return None
+
+async def stream_gcode(websocket, gcode, command_delay=0.0, window_bytes=ESP32_RX_BUFFER,
+                       ack_timeout=ESP32_ACK_TIMEOUT_S):
+    """
+    Send G-code (a string or any iterable of lines, e.g. a generator still
+    producing them) over an open websocket, skipping blank and comment
+    lines. Lines go out while their characters (plus newline) fit in
+    window_bytes of unacknowledged data; acks are matched to lines in
+    order. A window of 0 sends one line at a time. command_delay is an
+    optional pause after each line. If no ack arrives within ack_timeout
+    the job stops ('aborted' in the stats) instead of assuming the line
+    was consumed. Returns a stats dict.
+    """
+    if isinstance(gcode, str):
+        gcode = gcode.splitlines()
+    lines = (line.strip() for line in gcode if line.strip() and not line.lstrip().startswith(';'))
+    in_flight = deque()         # (line, size) awaiting an ack, oldest first
+    in_flight_bytes = 0
+    stats = {"lines": 0, "acked": 0, "errors": 0, "bytes": 0, "aborted": None}
+    t0 = time.perf_counter()
+
+    line = next(lines, None)
+    while line is not None or in_flight:
+        # Fill the window; the first line always goes so an over-long line cannot stall
+        while line is not None and (not in_flight or in_flight_bytes + len(line) + 1 <= window_bytes):
+            await websocket.send(line)
+            in_flight.append((line, len(line) + 1))
+            in_flight_bytes += len(line) + 1
+            stats["lines"] += 1
+            stats["bytes"] += len(line) + 1
+            if stats["lines"] % 1000 == 0:
+                print(f"Progress: {stats['lines']} lines sent")
+            if command_delay:
+                await asyncio.sleep(command_delay)
+            line = next(lines, None)
+        if not in_flight:
+            break
+
+        try:
+            message = await asyncio.wait_for(websocket.recv(), timeout=ack_timeout)
+        except asyncio.TimeoutError:
+            # Its bytes may still be in the controller's buffer: stop rather than overflow it
+            stats["aborted"] = f"no ACK within {ack_timeout:g}s for: {in_flight[0][0][:80]}"
+            print(f"Aborting: {stats['aborted']}")
+            break
+        kind = _ack_kind(message)
+        if kind is None:
+            print(f"Unexpected message: {message}")
+            continue
+        acked, size = in_flight.popleft()
+        in_flight_bytes -= size
+        if kind == "ok":
+            stats["acked"] += 1
+        else:
+            stats["errors"] += 1
+            print(f"Error for: {acked[:80]} -> {message}")
+
+    elapsed = time.perf_counter() - t0
+    stats["seconds"] = round(elapsed, 3)
+    stats["lines_per_second"] = round(stats["lines"] / elapsed, 1) if elapsed > 0 else None
+    stats["bytes_per_second"] = round(stats["bytes"] / elapsed) if elapsed > 0 else None
+    return stats
+
+async def send_gcode_websocket(url, gcode, command_delay=0.0, window_bytes=ESP32_RX_BUFFER,
+                               ack_timeout=ESP32_ACK_TIMEOUT_S):
+    """Connect to the ESP32 at url, stream the G-code and return (success_bool, message)."""
+    try:
+        async with websockets.connect(url) as websocket:
+            # Optionally read an initial greeting from ESP32
+            try:
+                first_msg = await asyncio.wait_for(websocket.recv(), timeout=1.0)
+                print(f"ESP32 says: {first_msg}")
+            except Exception:
+                pass
+
+            stats = await stream_gcode(websocket, gcode, command_delay, window_bytes, ack_timeout)
+    except Exception as e:
+        return False, f"WebSocket error: {e}"
+
+    total = stats["lines"]
+    rate = (stats["acked"] / total) * 100 if total else 100.0
+    message = (f"Sent {stats['acked']}/{total} ({rate:.1f}%) in {stats['seconds']:.1f}s, "
+               f"{stats['lines_per_second']} lines/s, {stats['bytes_per_second']} B/s")
+    if stats["aborted"]:
+        message = f"Job aborted, {stats['aborted']}. {message}"
+    print(f"[ESP32] {message}")
+    return rate > 90 and not stats["aborted"], message
@@ -0,0 +1,756 @@
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+from functools import lru_cache
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from qr_module import AI_QR_EMBED_IMAGE, QR_RENDER_VERSION, qr_modules, engrave_array, vendor_engrave_array, logo_keepout
+
+# === QR -> G-code functions ===
+# Every generator takes either an image path or an already rendered
+# grayscale uint8 array (see qr_module.engrave_array).
+def load_gray(image):
+    if isinstance(image, np.ndarray):
+        return image
+    return cv2.imread(image, cv2.IMREAD_GRAYSCALE)
+
+def iter_contour_gcode(img, laser_power, travel_speed, engrave_speed, target_size_mm, optimize_travel=True):
+    """
+    Outline every dark region (simplified contours), entered and left at the
+    same vertex. With optimize_travel the contours are reordered and their
+    entry vertices chosen by order_closed_paths to shorten the G0 jumps.
+    Yields G-code lines.
+    """
+    height, width = img.shape
+    scale_factor = target_size_mm / max(width, height)
+    _, thresh = cv2.threshold(img, 127, 255, cv2.THRESH_BINARY_INV)
+    contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_contour_area = 5
+    significant_contours = [cnt for cnt in contours if cv2.contourArea(cnt) > min_contour_area]
+    paths = []
+    for contour in significant_contours:
+        epsilon = 0.002 * cv2.arcLength(contour, True)
+        approx = cv2.approxPolyDP(contour, epsilon, True)
+        if len(approx) >= 2:
+            paths.append(approx[:, 0, :])
+
+    if optimize_travel:
+        order, entries, before, after = order_closed_paths(paths)
+        print(f"[Vector] {len(paths)} contours, travel {before * scale_factor:.1f} mm -> {after * scale_factor:.1f} mm")
+        paths = [np.roll(paths[k], -entry, axis=0) for k, entry in zip(order, entries)]
+
+    yield from ["G21", "G90", f"G0 F{travel_speed}", f"G1 F{engrave_speed}", "M3 S0", "G0 X0 Y0"]
+    for path in paths:
+        x_start = round(path[0][0] * scale_factor, 3)
+        y_start = round(path[0][1] * scale_factor, 3)
+        yield f"G0 X{x_start} Y{y_start}"
+        yield f"M3 S{laser_power}"
+        for point in path[1:]:
+            x = round(point[0] * scale_factor, 3)
+            y = round(point[1] * scale_factor, 3)
+            yield f"G1 X{x} Y{y}"
+        yield f"G1 X{x_start} Y{y_start}"
+        yield "M3 S0"
+    yield "G0 X0 Y0"
+    yield "M5"
+
+def qr_to_gcode_final(image_path, laser_power=255, travel_speed=5000, engrave_speed=1500, target_size_mm=25.0,
+                      optimize_travel=True):
+    """
+    Vector-like approach: contour-following. Good for fewer G-lines but may produce complex paths.
+    """
+    img = load_gray(image_path)
+    if img is None:
+        return "G21\nG90\nM5\nG0 X0 Y0\n;(Error: Failed to load image)"
+    return "\n".join(iter_contour_gcode(img, laser_power, travel_speed, engrave_speed, target_size_mm, optimize_travel))
+
+def raster_runs(burn):
+    """
+    Runs of True in each row of a boolean mask as three arrays: row, first
+    column and last column (inclusive), in row-major order.
+    """
+    h, w = burn.shape
+    padded = np.zeros((h, w + 2), dtype=np.int8)
+    padded[:, 1:-1] = burn
+    edges = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, stops = np.nonzero(edges == -1)
+    return rows, starts, stops - 1
+
+RASTER_BAND_ROWS = 64  # image rows turned into runs at a time
+
+def iter_raster_gcode(img, laser_power, travel_speed, engrave_speed, target_size_mm):
+    """
+    Zig-zag raster scan with one G0/M3/G1/M5 group per black run: same
+    burn coverage as stepping through every pixel, a fraction of the lines.
+    Yields G-code lines.
+    """
+    # Binarize (black=0, white=255)
+    _, bw = cv2.threshold(img, 127, 255, cv2.THRESH_BINARY)
+
+    h, w = bw.shape
+    px_per_mm = w / target_size_mm
+    if px_per_mm == 0:
+        raise ValueError("Invalid scale: px_per_mm == 0")
+    mm_per_px = 1.0 / px_per_mm
+
+    yield "G21 ; mm mode"
+    yield "G90 ; absolute positioning"
+    yield "M5  ; laser off"
+    yield f"G0 F{travel_speed}"
+
+    # A band of rows at a time keeps the run lists small however big the image
+    for band in range(0, h, RASTER_BAND_ROWS):
+        rows, starts, ends = raster_runs(bw[band:band + RASTER_BAND_ROWS] == 0)
+        rows += band
+        # Odd rows are scanned right-to-left: reverse their run order and direction
+        backward = (rows & 1).astype(bool)
+        order = np.lexsort((np.where(backward, -starts, starts), rows))
+        x_from = np.where(backward, ends, starts)[order]
+        x_to = np.where(backward, starts, ends)[order]
+        for row, col_from, col_to in zip(rows[order].tolist(), x_from.tolist(), x_to.tolist()):
+            y_mm = round(row * mm_per_px, 3)
+            yield f"G0 X{round(col_from * mm_per_px, 3)} Y{y_mm} F{travel_speed}"
+            yield f"M3 S{laser_power}"
+            yield f"G1 X{round(col_to * mm_per_px, 3)} Y{y_mm} F{engrave_speed}"
+            yield "M5"
+
+    yield "M5 ; ensure laser off"
+    yield "G0 X0 Y0 ; go home"
+
+def qr_to_gcode_raster(img_path, laser_power=255, travel_speed=5000,
+                       engrave_speed=1500, target_size_mm=20.0):
+    """
+    Raster engraving: line-by-line (zig-zag) scan, one burn move per black run.
+    Produces denser G-code appropriate for raster engravers.
+    """
+    img = load_gray(img_path)
+    if img is None:
+        raise ValueError(f"Cannot load image: {img_path}")
+    return "\n".join(iter_raster_gcode(img, laser_power, travel_speed, engrave_speed, target_size_mm))
+
+def iter_fallback_gcode(image_path, laser_power=255, scale=1.0):
+    """Simple horizontal-run fallback scanning; yields G-code lines."""
+    if isinstance(image_path, np.ndarray):
+        img = Image.fromarray(image_path)
+    else:
+        img = Image.open(image_path).convert("L")
+    width, height = img.size
+    pixels = img.load()
+    yield from ["G21 ; Set units to mm", "G90 ; Absolute positioning", "M3 S0 ; Laser off at start"]
+    for y in range(height):
+        x = 0
+        while x < width:
+            while x < width and pixels[x, y] >= 128:
+                x += 1
+            if x >= width:
+                break
+            start_x = x
+            while x < width and pixels[x, y] < 128:
+                x += 1
+            end_x = x - 1
+            gx_start = round(start_x * scale, 3)
+            gy = round(y * scale, 3)
+            gx_end = round(end_x * scale, 3)
+            yield f"G0 X{gx_start} Y{gy}"
+            yield f"M3 S{laser_power}"
+            yield f"G1 X{gx_end} Y{gy}"
+            yield "M3 S0"
+    yield "M5 ; Laser off at end"
+    yield "G0 X0 Y0 ; Return to origin"
+
+def qr_to_gcode_fallback(image_path, laser_power=255, scale=1.0):
+    return "\n".join(iter_fallback_gcode(image_path, laser_power, scale))
+
+# === Vendor QR -> G-code functions ===
+def vendor_qr_to_gcode_raster(img_path, laser_power=255, travel_speed=5000,
+                              engrave_speed=1500, target_size_mm=25.0):
+    """
+    Raster engraving for vendor QR codes: line-by-line (zig-zag) scan.
+    """
+    img = load_gray(img_path)
+    if img is None:
+        raise ValueError(f"Cannot load image: {img_path}")
+    return "\n".join(iter_raster_gcode(img, laser_power, travel_speed, engrave_speed, target_size_mm))
+
+def vendor_qr_to_gcode_vector(image_path, laser_power=255, travel_speed=5000,
+                              engrave_speed=1500, target_size_mm=25.0, optimize_travel=True):
+    """
+    Vector-like approach for vendor QR codes: contour-following.
+    """
+    img = load_gray(image_path)
+    if img is None:
+        return "G21\nG90\nM5\nG0 X0 Y0\n;(Error: Failed to load image)"
+    return "\n".join(iter_contour_gcode(img, laser_power, travel_speed, engrave_speed, target_size_mm, optimize_travel))
+
+# === Vector travel ordering ===
+def travel_length(points):
+    """Length of the polyline through points, an (N, 2) array."""
+    return float(np.hypot(*np.diff(points, axis=0).T).sum())
+
+def _two_opt(tour, order, entries):
+    """
+    Reverse stretches of the tour (fixed first/last point) while that
+    shortens it; order and entries are permuted alongside tour[1:-1].
+    """
+    n = len(order)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n):
+            a, b = tour[i - 1], tour[i]
+            c, d = tour[i + 1:n + 1], tour[i + 2:n + 2]
+            delta = (np.hypot(*(c - a).T) + np.hypot(*(d - b).T)
+                     - np.hypot(*(b - a)) - np.hypot(*(d - c).T))
+            j = int(np.argmin(delta))
+            if delta[j] < -1e-9:
+                j += i + 1
+                tour[i:j + 1] = tour[i:j + 1][::-1].copy()
+                order[i - 1:j] = order[i - 1:j][::-1].copy()
+                entries[i - 1:j] = entries[i - 1:j][::-1].copy()
+                improved = True
+
+def order_closed_paths(paths, start=(0, 0), max_rounds=4):
+    """
+    Visiting order and entry vertex for closed paths (each an (N, 2) array,
+    entered and left at the same vertex) that shorten the travel between
+    them: nearest-neighbour from start, then alternating 2-opt and per-path
+    entry re-selection until travel stops improving. The tour ends back at
+    start. Returns (order, entries, travel_before, travel_after), where
+    'before' is the given order entered at each path's first vertex; that
+    order is returned unchanged if the search does not beat it.
+    """
+    start = np.asarray(start, dtype=float)
+    n = len(paths)
+    if not n:
+        return [], [], 0.0, 0.0
+    before = travel_length(np.vstack([start] + [p[:1] for p in paths] + [start]).astype(float))
+
+    # Nearest neighbour over every vertex of every unvisited path
+    lengths = np.array([len(p) for p in paths])
+    offsets = np.cumsum(lengths) - lengths
+    verts = np.vstack(paths).astype(float)
+    owner = np.repeat(np.arange(n), lengths)
+    free = np.ones(len(verts), dtype=bool)
+    order = np.empty(n, dtype=int)
+    entries = np.empty(n, dtype=int)
+    here = start
+    for pos in range(n):
+        dist = np.einsum("ij,ij->i", verts - here, verts - here)
+        dist[~free] = np.inf
+        v = int(np.argmin(dist))
+        k = owner[v]
+        order[pos], entries[pos] = k, v - offsets[k]
+        free[offsets[k]:offsets[k] + lengths[k]] = False
+        here = verts[v]
+
+    tour = np.vstack([start, verts[offsets[order] + entries], start])
+    best = travel_length(tour)
+    for _ in range(max_rounds):
+        _two_opt(tour, order, entries)
+        # Each path's entry is also its exit: pick the vertex closest to both neighbours
+        for pos in range(1, n + 1):
+            candidates = paths[order[pos - 1]].astype(float)
+            cost = np.hypot(*(candidates - tour[pos - 1]).T) + np.hypot(*(candidates - tour[pos + 1]).T)
+            entries[pos - 1] = int(np.argmin(cost))
+            tour[pos] = candidates[entries[pos - 1]]
+        length = travel_length(tour)
+        if length >= best - 1e-9:
+            best = min(best, length)
+            break
+        best = length
+    if best > before:
+        # Nearest neighbour is only a heuristic: never return a longer tour than the given order
+        return list(range(n)), [0] * n, before, before
+    return order.tolist(), entries.tolist(), before, best
+
+# === Module-grid toolpaths ===
+# G-code straight from the QR module matrix (qr_module.qr_modules): the
+# toolpath depends on the code's modules, not on the size the PNG was drawn at.
+LASER_BEAM_MM = 0.1  # burned line width; module toolpaths hatch at this spacing
+
+def module_rects(modules, keepout=None, merge_rows=False):
+    """
+    Burn rectangles over the dark modules outside keepout, as four arrays:
+    first/last row and first/last column (inclusive, in modules). Each one is
+    a merged horizontal run; merge_rows also joins identical runs on
+    consecutive rows into one rectangle.
+    """
+    burn = np.asarray(modules, dtype=bool)
+    if keepout is not None:
+        burn = burn & ~keepout
+    rows, starts, ends = raster_runs(burn)
+    if not merge_rows:
+        return rows, rows, starts, ends
+    order = np.lexsort((rows, ends, starts))
+    rows, starts, ends = rows[order], starts[order], ends[order]
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = (starts[1:] != starts[:-1]) | (ends[1:] != ends[:-1]) | (rows[1:] != rows[:-1] + 1)
+    first = np.flatnonzero(first)
+    last = np.append(first[1:], len(rows)) - 1
+    order = np.lexsort((starts[first], rows[first]))
+    first, last = first[order], last[order]
+    return rows[first], rows[last], starts[first], ends[first]
+
+def _coord_strings(values):
+    return [str(round(v, 3)) for v in values.tolist()]
+
+@lru_cache(maxsize=64)
+def _pass_tables(n_rows, n_cols, module_mm, passes, laser_power):
+    """
+    String tables for qr_modules_to_gcode; one set per QR size and settings.
+      heads "G0 X<x> Y" per start column, then "G1 Y" (next pass)
+      mids  "<y>\nG1 X" per pass row, then "<y>\nM3 S<power>\nG1 X" (entering)
+      tails "<x>\n" per start then end column, then the same with "M5\n" (leaving)
+    """
+    pitch = module_mm / passes
+    inset = pitch / 2  # keep the beam's half-width inside the module edges
+    x_start = _coord_strings(np.arange(n_cols) * module_mm + inset)
+    x_end = _coord_strings(np.arange(1, n_cols + 1) * module_mm - inset)
+    y_pass = _coord_strings((np.arange(n_rows * passes) + 0.5) * pitch)
+    heads = np.array([f"G0 X{x} Y" for x in x_start] + ["G1 Y"], dtype=object)
+    mids = np.array([f"{y}\nG1 X" for y in y_pass] + [f"{y}\nM3 S{laser_power}\nG1 X" for y in y_pass], dtype=object)
+    tails = np.array([f"{x}{end}" for end in ("\n", "\nM5\n") for x in x_start + x_end], dtype=object)
+    return heads, mids, tails
+
+def iter_modules_gcode(modules, module_mm, laser_power=255, travel_speed=5000, engrave_speed=1500,
+                       line_mm=None, keepout=None, merge_rows=False, chunk=512):
+    """
+    Module-grid toolpath: each rectangle from module_rects is filled with
+    horizontal passes line_mm apart (default: one pass per module row),
+    zig-zagging with the laser on, so a run costs a few lines whatever the
+    module size. keepout (bool, same shape) marks modules never to burn.
+    Yields G-code lines, joining chunk passes at a time.
+    """
+    r0, r1, c0, c1 = module_rects(modules, keepout, merge_rows)
+    passes = max(1, round(module_mm / line_mm)) if line_mm else 1
+    n_rows, n_cols = np.shape(modules)
+    # Each pass is three table pieces (see _pass_tables)
+    heads, mids, tails = _pass_tables(n_rows, n_cols, module_mm, passes, laser_power)
+
+    seg_count = (r1 - r0 + 1) * passes
+    rect = np.repeat(np.arange(len(r0)), seg_count)
+    k = np.arange(len(rect)) - np.repeat(np.cumsum(seg_count) - seg_count, seg_count)
+    entering = k == 0
+    leaving = k == seg_count[rect] - 1
+    col_to = np.where(k & 1, c0[rect], c1[rect] + n_cols)  # odd passes run back to the start column
+    pieces = np.empty((len(rect), 3), dtype=object)
+    pieces[:, 0] = heads[np.where(entering, c0[rect], n_cols)]
+    pieces[:, 1] = mids[r0[rect] * passes + k + entering * n_rows * passes]
+    pieces[:, 2] = tails[col_to + leaving * 2 * n_cols]
+
+    yield from ["G21 ; mm mode", "G90 ; absolute positioning", "M5  ; laser off",
+                f"G0 F{travel_speed}", f"G1 F{engrave_speed}"]
+    for start in range(0, len(pieces), chunk):
+        yield from "".join(pieces[start:start + chunk].ravel().tolist()).splitlines()
+    yield "M5 ; ensure laser off"
+    yield "G0 X0 Y0 ; go home"
+
+def qr_modules_to_gcode(modules, module_mm, laser_power=255, travel_speed=5000, engrave_speed=1500,
+                        line_mm=None, keepout=None, merge_rows=False):
+    """iter_modules_gcode as one string."""
+    return "\n".join(iter_modules_gcode(modules, module_mm, laser_power, travel_speed, engrave_speed,
+                                         line_mm, keepout, merge_rows))
+
+def vendor_qr_to_gcode_modules(qr_content, laser_power=255, travel_speed=5000,
+                               engrave_speed=1500, target_size_mm=25.0):
+    """
+    Module-grid toolpath for vendor QR codes (same modules as save_vendor_qr_image).
+    """
+    modules = qr_modules(qr_content)
+    return qr_modules_to_gcode(modules, target_size_mm / modules.shape[1], laser_power,
+                               travel_speed, engrave_speed, line_mm=LASER_BEAM_MM)
+
+# === G-code compaction ===
+_COMMENT = re.compile(r"\(.*?\)|;.*")
+
+def gcode_words(line):
+    """Upper-cased words of one G-code line with comments removed ([] for blank/comment lines)."""
+    if ";" in line or "(" in line:
+        line = _COMMENT.sub("", line)
+    return line.upper().split()
+
+class _Move:
+    """A G0/G1 move in compact_gcode's output, kept open so the next move can extend it."""
+    __slots__ = ("kind", "start", "end", "words", "feed")
+
+    def __init__(self, kind, start, end, words, feed):
+        self.kind, self.start, self.end, self.words, self.feed = kind, start, end, words, feed
+
+    def __str__(self):
+        parts = [self.kind]
+        for axis in range(2):
+            if self.words[axis] is not None and self.end[axis] != self.start[axis]:
+                parts.append("XY"[axis] + self.words[axis])
+        if self.feed is not None:
+            parts.append(f"F{self.feed}")
+        return " ".join(parts)
+
+def _continues(move, end, tolerance=5e-4):
+    """
+    True if end lies straight ahead of move: same direction, and move's end
+    point within tolerance (mm) of the merged segment.
+    """
+    if None in move.start:
+        return False
+    ax, ay = move.end[0] - move.start[0], move.end[1] - move.start[1]
+    bx, by = end[0] - move.end[0], end[1] - move.end[1]
+    if ax * bx + ay * by <= 0:
+        return False
+    return abs(ax * by - ay * bx) <= tolerance * math.hypot(ax + bx, ay + by)
+
+def iter_compact_gcode(lines, label="G-code"):
+    """
+    Equivalent but shorter G-code for streaming: comments stripped, modal
+    words sent only when they change (F on the G1 that needs it, S, M3/M5,
+    axes that move), zero-length moves dropped, consecutive collinear G1
+    moves merged and back-to-back laser-off G0 moves collapsed into the
+    last one. Takes and yields lines, holding back only the last one (a
+    move the next may still extend); prints the saving once exhausted.
+    """
+    out = []                    # lines not yet yielded; only the last can still change
+    lines_in = bytes_in = lines_out = bytes_out = 0
+    pos = [None, None]          # machine position (floats) and the words it came from
+    pos_words = [None, None]
+    mode = None
+    want_feed = sent_feed = None
+    spindle = power = None
+    for line in lines:
+        for entry in out[:-1]:
+            text = str(entry)
+            lines_out += 1
+            bytes_out += len(text) + 1
+            yield text
+        del out[:-1]
+        lines_in += 1
+        bytes_in += len(line) + 1
+        words = gcode_words(line)
+        if not words:
+            if line.strip():
+                out.append(line.strip())  # comment-only lines (e.g. error markers) are kept
+            continue
+        letters = {w[0] for w in words}
+        codes = [w for w in words if w[0] in "GM"]
+        if not letters <= set("GMXYFS") or any(c not in ("G0", "G00", "G1", "G01", "M3", "M03", "M5", "M05")
+                                               for c in codes):
+            out.append(" ".join(words))  # G21, G90 and anything unrecognised pass through
+            continue
+        values = {w[0]: w[1:] for w in words if w[0] in "XYFS"}
+
+        if "M5" in codes or "M05" in codes:
+            if spindle != "M5":
+                out.append("M5")
+                spindle = "M5"
+        elif "M3" in codes or "M03" in codes:
+            new_power = values.get("S", power)
+            if spindle != "M3":
+                out.append("M3" if new_power == power or new_power is None else f"M3 S{new_power}")
+            elif new_power != power:
+                out.append(f"S{new_power}")  # already on: only the power changes
+            spindle, power = "M3", new_power
+        elif "S" in values and values["S"] != power:
+            out.append(f"S{values['S']}")
+            power = values["S"]
+
+        for c in codes:
+            if c[0] == "G":
+                mode = "G0" if c in ("G0", "G00") else "G1"
+        if "F" in values:
+            want_feed = values["F"]
+        if mode is None or not ("X" in values or "Y" in values):
+            continue
+
+        end_words = [values.get("X", pos_words[0]), values.get("Y", pos_words[1])]
+        end = [float(w) if w is not None else None for w in end_words]
+        if end == pos:
+            continue  # zero-length move
+        last = out[-1] if out and isinstance(out[-1], _Move) else None
+        laser_off = spindle == "M5" or (power is not None and float(power) == 0)
+        if mode == "G0" and laser_off and last is not None and last.kind == "G0":
+            last.end, last.words = end, end_words
+            if last.end == last.start:
+                out.pop()
+        elif (mode == "G1" and last is not None and last.kind == "G1" and want_feed == sent_feed
+              and None not in end and _continues(last, end)):
+            last.end, last.words = end, end_words
+        else:
+            feed = None
+            if mode == "G1" and want_feed is not None and want_feed != sent_feed:
+                feed = sent_feed = want_feed
+            out.append(_Move(mode, list(pos), end, end_words, feed))
+        pos, pos_words = end, end_words
+
+    for entry in out:
+        text = str(entry)
+        lines_out += 1
+        bytes_out += len(text) + 1
+        yield text
+    bytes_in, bytes_out = max(bytes_in - 1, 0), max(bytes_out - 1, 0)
+    print(f"[{label}] Compacted {lines_in} -> {lines_out} lines, {bytes_in} -> {bytes_out} bytes "
+          f"({1 - bytes_out / max(bytes_in, 1):.0%} smaller)")
+
+def compact_gcode(gcode_text, label="G-code"):
+    """iter_compact_gcode over a whole G-code string."""
+    return "\n".join(iter_compact_gcode(gcode_text.splitlines(), label))
+
+# === Per-fitting G-code (settings used by send_gcode and bulk generation) ===
+GCODE_METHODS = ("raster", "vector", "fallback", "modules")
+
+def iter_gcode(engrave_path, method="raster", laser_power=255, travel_speed=5000, engrave_speed=1500,
+               target_size_mm=20.0):
+    """G-code lines for a fitting's engrave image (path or array) using one of the raster/vector methods."""
+    if method == 'fallback':
+        return iter_fallback_gcode(engrave_path, laser_power=laser_power, scale=0.5)
+    img = load_gray(engrave_path)
+    if method == 'vector':
+        if img is None:
+            return iter(["G21", "G90", "M5", "G0 X0 Y0", ";(Error: Failed to load image)"])
+        return iter_contour_gcode(img, laser_power, travel_speed, engrave_speed, target_size_mm)
+    if img is None:
+        raise ValueError(f"Cannot load image: {engrave_path}")
+    return iter_raster_gcode(img, laser_power, travel_speed, engrave_speed, target_size_mm)
+
+def generate_gcode(engrave_path, method="raster"):
+    """G-code text for a fitting's engrave image (path or array) using one of the raster/vector methods."""
+    return "\n".join(iter_gcode(engrave_path, method))
+
+def iter_fitting_gcode(qr_content, method="raster", laser_power=255, travel_speed=5000, engrave_speed=1500,
+                       target_size_mm=20.0):
+    """
+    Compacted G-code lines for a fitting's QR content using one of
+    GCODE_METHODS. 'modules' works from the module matrix (logo area left
+    unburned); the rest from the in-memory engrave raster.
+    """
+    if method == 'modules':
+        modules = qr_modules(qr_content)
+        lines = iter_modules_gcode(modules, target_size_mm / modules.shape[1], laser_power, travel_speed,
+                                   engrave_speed, line_mm=LASER_BEAM_MM, keepout=logo_keepout(modules))
+    else:
+        lines = iter_gcode(engrave_array(qr_content), method, laser_power, travel_speed, engrave_speed,
+                           target_size_mm)
+    return iter_compact_gcode(lines)
+
+def fitting_gcode(qr_content, method="raster"):
+    """iter_fitting_gcode as one string."""
+    return "\n".join(iter_fitting_gcode(qr_content, method))
+
+def iter_vendor_gcode(qr_content, method="raster", laser_power=255, travel_speed=5000,
+                      engrave_speed=1500, target_size_mm=25.0):
+    """
+    Compacted G-code lines for a vendor QR: 'vector', 'modules' or raster
+    (anything else). 'modules' works from the module matrix, the rest from
+    the in-memory vendor engrave raster.
+    """
+    if method == 'modules':
+        modules = qr_modules(qr_content)
+        lines = iter_modules_gcode(modules, target_size_mm / modules.shape[1], laser_power, travel_speed,
+                                   engrave_speed, line_mm=LASER_BEAM_MM)
+    elif method == 'vector':
+        lines = iter_contour_gcode(vendor_engrave_array(qr_content), laser_power, travel_speed, engrave_speed,
+                                   target_size_mm)
+    else:
+        lines = iter_raster_gcode(vendor_engrave_array(qr_content), laser_power, travel_speed, engrave_speed,
+                                  target_size_mm)
+    return iter_compact_gcode(lines, "Vendor G-code")
+
+def tee_gcode_file(lines, path):
+    """
+    Pass lines through while writing them to path. The file is written to
+    a temp name and moved into place once the last line has gone through;
+    a run that is abandoned or fails leaves the old file untouched.
+    """
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp, "w") as f:
+            separator = ""
+            for line in lines:
+                f.write(separator + line)
+                separator = "\n"
+                yield line
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+# === Persistent G-code cache ===
+GCODE_CACHE_DIR = os.path.join("static", "gcode_cache")
+GCODE_CACHE_MAX_BYTES = 512 * 1024 * 1024
+GCODE_CACHE_MAX_AGE_S = 30 * 24 * 3600   # entries unused this long are dropped
+GCODE_CACHE_SWEEP_S = 3600               # how often a write also sweeps out aged entries
+# Bump whenever a generator's output for the same inputs changes
+GCODE_GENERATOR_VERSION = 1
+
+class GCodeCache:
+    """
+    Compacted G-code files stored under a hash of everything that affects
+    them: payload, method, laser power, speeds, size and generator version.
+    Files are written atomically (via tee_gcode_file), expire once unused
+    for max_age_s and are evicted least recently used first once they
+    exceed max_bytes.
+    """
+    def __init__(self, cache_dir=GCODE_CACHE_DIR, max_bytes=GCODE_CACHE_MAX_BYTES, max_age_s=GCODE_CACHE_MAX_AGE_S):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self._disk_bytes = None
+        self._next_sweep = 0.0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def key(self, kind, qr_content, method, laser_power, travel_speed, engrave_speed, target_size_mm, *extra):
+        h = hashlib.sha256()
+        for part in (GCODE_GENERATOR_VERSION, kind, method, laser_power, travel_speed, engrave_speed,
+                     target_size_mm, *extra, qr_content):
+            h.update(str(part).encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.gcode")
+
+    def get(self, key):
+        """Path of the cached file for key, or None if it is missing or expired."""
+        path = self.path(key)
+        try:
+            expired = time.time() - os.stat(path).st_mtime > self.max_age_s
+        except OSError:
+            expired = None
+        if expired is False:
+            # Bump mtime: it is the recency used for eviction
+            os.utime(path)
+            with self._lock:
+                self._counters["hits"] += 1
+            return path
+        if expired:
+            self._remove(path)
+        with self._lock:
+            self._counters["misses"] += 1
+        return None
+
+    def lines(self, key, make_lines):
+        """
+        G-code lines for key: read back from the cached file, or taken from
+        make_lines() and written to the cache as they pass.
+        """
+        path = self.get(key)
+        if path is not None:
+            print(f"[GCode Cache] Hit {key[:12]}")
+            return self._read(path)
+        return self._generate(key, make_lines)
+
+    def ensure(self, key, make_lines):
+        """Path of the cached file for key, generating it first if needed."""
+        path = self.get(key)
+        if path is None:
+            for _ in self._generate(key, make_lines):
+                pass
+            path = self.path(key)
+        return path
+
+    def _generate(self, key, make_lines):
+        print(f"[GCode Cache] Miss {key[:12]}, generating")
+        os.makedirs(os.path.dirname(self.path(key)), exist_ok=True)
+        return self._store(key, make_lines())
+
+    def _read(self, path):
+        with open(path) as f:
+            for line in f:
+                yield line.rstrip("\n")
+
+    def _store(self, key, lines):
+        path = self.path(key)
+        yield from tee_gcode_file(lines, path)
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += os.path.getsize(path)
+        if self._disk_usage() > self.max_bytes or time.time() >= self._next_sweep:
+            self._evict()
+
+    def _remove(self, path):
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes -= size
+            self._counters["evictions"] += 1
+
+    def _scan(self):
+        """[(last_used, size, path)] per cached file."""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".gcode"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def _disk_usage(self):
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, size, _ in self._scan())
+            return self._disk_bytes
+
+    def _evict(self):
+        """Delete expired files, then least recently used ones until the cache is back to 90% of max_bytes."""
+        now = time.time()
+        entries = sorted(self._scan())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        evicted = 0
+        for last_used, size, path in entries:
+            if total <= target and now - last_used <= self.max_age_s:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._disk_bytes = total
+            self._next_sweep = now + GCODE_CACHE_SWEEP_S
+            self._counters["evictions"] += evicted
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["disk_bytes"] = self._disk_bytes
+        return stats
+
+gcode_cache = GCodeCache()
+
+def _logo_stamp():
+    """Size and mtime of the logo thresholded into fitting engrave rasters (part of their cache key)."""
+    try:
+        st = os.stat(AI_QR_EMBED_IMAGE)
+    except (OSError, TypeError):
+        return "none"
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+def iter_cached_fitting_gcode(qr_content, method="raster", laser_power=255, travel_speed=5000,
+                              engrave_speed=1500, target_size_mm=20.0):
+    """iter_fitting_gcode through gcode_cache."""
+    settings = (method, laser_power, travel_speed, engrave_speed, target_size_mm)
+    key = gcode_cache.key("fitting", qr_content, *settings, QR_RENDER_VERSION, _logo_stamp())
+    return gcode_cache.lines(key, lambda: iter_fitting_gcode(qr_content, *settings))
+
+def vendor_gcode_key(qr_content, vendor_risk, method="raster", laser_power=255, travel_speed=5000,
+                     engrave_speed=1500, target_size_mm=25.0):
+    """gcode_cache key for iter_vendor_gcode with these settings and the vendor's current risk tier."""
+    if method not in ('vector', 'modules'):
+        method = 'raster'
+    return gcode_cache.key("vendor", qr_content, method, laser_power, travel_speed, engrave_speed, target_size_mm,
+                           vendor_risk)
@@ -0,0 +1,853 @@
+import base64
+import hashlib
+import hmac
+import io
+import json
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import date
+from urllib.parse import quote, urlsplit, urlunsplit
+
+import numpy as np
+import qrcode
+from PIL import Image, ImageDraw
+
+# QR code directory
+qr_dir = os.path.join("static", "qrcodes")
+os.makedirs(qr_dir, exist_ok=True)
+
+# === Configuration: enable/disable AI-stylized QR ===
+USE_AI_QR = True
+
+# Path for a logo/background to embed into QR (user insisted logo is mandatory)
+AI_QR_EMBED_IMAGE = "D:\\CityGrid\\my-project\\qr demo\\static\\image\\rail.png"
+
+QR_ERROR_CORRECTION = qrcode.constants.ERROR_CORRECT_H
+PINK = (255, 192, 203)
+
+# Rendered QR artifacts, keyed by payload + render settings
+QR_CACHE_DIR = os.path.join("static", "qr_cache")
+QR_CACHE_MAX_BYTES = 256 * 1024 * 1024
+QR_CACHE_MEMORY_BYTES = 32 * 1024 * 1024
+# Bump whenever rendering changes so stale artifacts are not reused
+QR_RENDER_VERSION = 1
+
+# Fitting QR payload format: "json" (readable by any scanner) or "compact"
+# (versioned binary, base45 text; read it back with decode_qr_content)
+QR_PAYLOAD_FORMAT = "json"
+
+# Fitting QR modes: "full" embeds the payload above, "ref" only a signed
+# link to /scan/<uid>. Chosen per fitting (fittings.qr_mode) or per vendor
+# (vendors.qr_mode); "full" when neither is set.
+QR_MODES = ("full", "ref")
+QR_REF_VERSION = 1
+# UIDs that may use the short upper-case /S/ link
+_SHORT_REF_UID = re.compile(r"[A-Z0-9-]+")
+QR_SCAN_BASE_URL = os.environ.get("RAIL_QR_SCAN_URL", "http://localhost:5000")
+QR_SIGNING_KEY_FILE = "qr_signing.key"
+VENDOR_DB = "vendors.db"
+
+# === QR Content Generation ===
+def generate_qr_content(uid, item_type, vendor, lot, supply_date, warranty_end, manufactor_date, manufactor_number, notes, risk, vendor_risk,vendor_email="", fmt=None):
+    qr_payload = {
+        "uid": uid,
+        "item_type": item_type,
+        "vendor": vendor,
+        "lot": lot,
+        "supply_date": supply_date,
+        "warranty_end": warranty_end,
+        "manufactor_date": manufactor_date,
+        "manufactor_number": manufactor_number,
+        "vendor_email": vendor_email,
+        "notes": notes,
+        "risk": risk,
+        "vendor_risk": vendor_risk,
+        
+    }
+    if (fmt or QR_PAYLOAD_FORMAT) == "compact":
+        return encode_compact_payload(qr_payload)
+    return json.dumps(qr_payload)
+
+# === Signed reference-only QR ===
+_signing_key = None
+
+def _qr_signing_key():
+    """HMAC key from RAIL_QR_SIGNING_KEY, else QR_SIGNING_KEY_FILE (created on first use)."""
+    global _signing_key
+    if _signing_key is None:
+        env_key = os.environ.get("RAIL_QR_SIGNING_KEY")
+        if env_key:
+            _signing_key = env_key.encode("utf-8")
+        else:
+            if not os.path.exists(QR_SIGNING_KEY_FILE):
+                # Written in full under a temp name, then linked into place: a
+                # process starting at the same time either wins the link or
+                # finds the complete key of the one that did
+                tmp = f"{QR_SIGNING_KEY_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+                fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+                try:
+                    with os.fdopen(fd, "w") as f:
+                        f.write(secrets.token_hex(32))
+                    os.link(tmp, QR_SIGNING_KEY_FILE)
+                    print(f"[QR] Created signing key {QR_SIGNING_KEY_FILE}")
+                except FileExistsError:
+                    pass
+                finally:
+                    os.remove(tmp)
+            with open(QR_SIGNING_KEY_FILE) as f:
+                key = f.read().strip()
+            if not key:
+                raise ValueError(f"QR signing key file {QR_SIGNING_KEY_FILE} is empty")
+            _signing_key = key.encode("utf-8")
+    return _signing_key
+
+def qr_reference_tag(uid, version=QR_REF_VERSION):
+    """Short HMAC tag (13 base32 chars, 64 bits) binding a UID to a reference format version."""
+    mac = hmac.new(_qr_signing_key(), f"{version}:{uid}".encode("utf-8"), hashlib.sha256).digest()
+    return base64.b32encode(mac[:8]).decode("ascii").rstrip("=")
+
+def verify_reference_tag(uid, tag, version=QR_REF_VERSION):
+    try:
+        version = int(version)
+    except (TypeError, ValueError):
+        return False
+    expected = qr_reference_tag(uid, version)
+    # compare_digest raises on non-ASCII str, so reject anything that cannot be a tag first
+    if version != QR_REF_VERSION or not isinstance(tag, str) or not tag.isascii() or len(tag) != len(expected):
+        return False
+    return hmac.compare_digest(expected, tag.upper())
+
+def generate_reference_qr_content(uid):
+    """
+    Scan URL carrying only the UID, format version and tag; the record is looked up live.
+    When the UID allows it the whole URL is upper-case so the QR can use
+    alphanumeric mode (/S/<uid>/<version>/<tag> redirects to /scan/<uid>).
+    """
+    tag = qr_reference_tag(uid)
+    # Scheme and host are case-insensitive; the path of the base URL is not
+    base = urlsplit(QR_SCAN_BASE_URL)
+    base_upper = urlunsplit(base._replace(scheme=base.scheme.upper(), netloc=base.netloc.upper()))
+    # Only UIDs that survive the path unchanged: Flask would decode "%41" and
+    # a client may collapse "." segments
+    if _SHORT_REF_UID.fullmatch(uid or ""):
+        short = f"{base_upper}/S/{uid}/{QR_REF_VERSION}/{tag}"
+        if all(ch in BASE45_CHARSET and ch != " " for ch in short):
+            return short
+    return f"{QR_SCAN_BASE_URL}/scan/{quote(uid, safe='')}?v={QR_REF_VERSION}&t={tag}"
+
+def get_vendor_qr_mode(vendor_id, vendor_db=VENDOR_DB):
+    if not vendor_id:
+        return None
+    try:
+        conn = sqlite3.connect(vendor_db)
+        row = conn.execute("SELECT qr_mode FROM vendors WHERE id=?", (vendor_id,)).fetchone()
+        conn.close()
+    except sqlite3.Error as e:
+        print(f"[QR] Vendor QR mode lookup failed: {e}")
+        return None
+    return row[0] if row and row[0] in QR_MODES else None
+
+def resolve_qr_mode(row_dict, vendor_modes=None):
+    """
+    QR mode for a fittings row: its own qr_mode, else its vendor's, else "full".
+    vendor_modes is an optional {vendor_id: mode} memo for batch callers.
+    """
+    mode = row_dict.get('qr_mode')
+    if mode in QR_MODES:
+        return mode
+    vendor_id = row_dict.get('vendor_id')
+    if vendor_modes is None:
+        mode = get_vendor_qr_mode(vendor_id)
+    else:
+        if vendor_id not in vendor_modes:
+            vendor_modes[vendor_id] = get_vendor_qr_mode(vendor_id)
+        mode = vendor_modes[vendor_id]
+    return mode or "full"
+
+def fitting_qr_content(row_dict, qr_mode="full"):
+    """QR text for a fittings row in one of QR_MODES."""
+    if qr_mode == "ref":
+        return generate_reference_qr_content(row_dict.get('uid'))
+    return generate_qr_content(
+        row_dict.get('uid'), row_dict.get('item_type'), row_dict.get('vendor'), row_dict.get('lot'),
+        row_dict.get('supply_date'), row_dict.get('warranty_end'), row_dict.get('manufactor_date',''),
+        row_dict.get('manufactor_number',''), row_dict.get('notes',''),
+        row_dict.get('risk','Low'), row_dict.get('vendor_risk','Low'), row_dict.get('vendor_email','')
+    )
+
+def generate_vendor_qr_content(vendor_data):
+    """Generate QR content for vendor details"""
+    qr_payload = {
+        "vendor_id": vendor_data['id'],
+        "company_name": vendor_data['company_name'],
+        "contact_person": vendor_data['contact_person'],
+        "email": vendor_data['email'],
+        "phone": vendor_data.get('phone', ''),
+        "address": vendor_data.get('address', ''),
+        "registration_date": vendor_data.get('registration_date', ''),
+        "vendor_risk": vendor_data.get('vendor_risk', 'Low')
+    }
+    return json.dumps(qr_payload)
+
+# === Compact payload format ===
+# "RQ:" + base45(header byte + body). The header holds the format version
+# (high nibble) and flags; the body is a run of (tag, value) fields, zlib
+# compressed when that makes it shorter. base45 keeps the whole string in
+# the QR alphanumeric charset, which packs 5.5 bits per character vs 8.
+COMPACT_PREFIX = "RQ:"
+COMPACT_VERSION = 1
+COMPACT_FLAG_ZLIB = 0x01
+
+# tag -> (field, kind); kinds: "text", "date" (days since COMPACT_EPOCH), "risk" (enum)
+COMPACT_FIELDS = {
+    1: ("uid", "text"),
+    2: ("item_type", "text"),
+    3: ("vendor", "text"),
+    4: ("lot", "text"),
+    5: ("supply_date", "date"),
+    6: ("warranty_end", "date"),
+    7: ("manufactor_date", "date"),
+    8: ("manufactor_number", "text"),
+    9: ("vendor_email", "text"),
+    10: ("notes", "text"),
+    11: ("risk", "risk"),
+    12: ("vendor_risk", "risk"),
+}
+COMPACT_TAGS = {field: tag for tag, (field, _) in COMPACT_FIELDS.items()}
+# Date/risk values that do not fit their packed form are stored as text under tag | COMPACT_RAW
+COMPACT_RAW = 0x80
+COMPACT_EPOCH = date(2000, 1, 1).toordinal()
+COMPACT_RISKS = ("Low", "Medium", "High")
+
+BASE45_CHARSET = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:"
+_BASE45_VALUES = {ch: i for i, ch in enumerate(BASE45_CHARSET)}
+
+def base45_encode(data):
+    """RFC 9285 base45."""
+    out = []
+    for i in range(0, len(data) - 1, 2):
+        n = data[i] * 256 + data[i + 1]
+        n, c = divmod(n, 45)
+        e, d = divmod(n, 45)
+        out += [BASE45_CHARSET[c], BASE45_CHARSET[d], BASE45_CHARSET[e]]
+    if len(data) % 2:
+        d, c = divmod(data[-1], 45)
+        out += [BASE45_CHARSET[c], BASE45_CHARSET[d]]
+    return "".join(out)
+
+def base45_decode(text):
+    try:
+        values = [_BASE45_VALUES[ch] for ch in text]
+    except KeyError as e:
+        raise ValueError(f"invalid base45 character {e}") from None
+    out = bytearray()
+    for i in range(0, len(values), 3):
+        chunk = values[i:i + 3]
+        if len(chunk) == 3:
+            n = chunk[0] + chunk[1] * 45 + chunk[2] * 45 * 45
+            if n > 0xFFFF:
+                raise ValueError("invalid base45 triplet")
+            out += bytes(divmod(n, 256))
+        elif len(chunk) == 2:
+            n = chunk[0] + chunk[1] * 45
+            if n > 0xFF:
+                raise ValueError("invalid base45 pair")
+            out.append(n)
+        else:
+            raise ValueError("truncated base45 input")
+    return bytes(out)
+
+def _put_varint(buf, n):
+    while n >= 0x80:
+        buf.append((n & 0x7F) | 0x80)
+        n >>= 7
+    buf.append(n)
+
+def _get_varint(data, pos):
+    n = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return n, pos
+        shift += 7
+
+def _pack_value(kind, value):
+    """(packed bytes, raw) for one field value; raw means stored as text."""
+    if kind == "date":
+        try:
+            days = date.fromisoformat(value).toordinal() - COMPACT_EPOCH
+            if 0 <= days <= 0xFFFF and date.fromordinal(days + COMPACT_EPOCH).isoformat() == value:
+                return days.to_bytes(2, "big"), False
+        except (TypeError, ValueError):
+            pass
+    elif kind == "risk" and value in COMPACT_RISKS:
+        return bytes([COMPACT_RISKS.index(value)]), False
+    elif kind == "text":
+        return str(value).encode("utf-8"), False
+    return str(value).encode("utf-8"), True
+
+def encode_compact_payload(qr_payload, compress=None):
+    """
+    Compact QR text for a fitting payload dict (the fields generate_qr_content
+    writes). None values are omitted; compress=None picks whichever of the
+    raw and zlib bodies is shorter.
+    """
+    body = bytearray()
+    for field, value in qr_payload.items():
+        tag = COMPACT_TAGS.get(field)
+        if tag is None:
+            raise ValueError(f"field {field!r} has no compact tag")
+        if value is None:
+            continue
+        kind = COMPACT_FIELDS[tag][1]
+        packed, raw = _pack_value(kind, value)
+        body.append(tag | COMPACT_RAW if raw else tag)
+        if kind == "text" or raw:
+            _put_varint(body, len(packed))
+        body += packed
+    body = bytes(body)
+
+    flags = 0
+    if compress is not False:
+        packed = zlib.compress(body, 9)[2:-4]  # raw deflate: zlib header/checksum cost 6 bytes
+        if compress or len(packed) < len(body):
+            body, flags = packed, COMPACT_FLAG_ZLIB
+    return COMPACT_PREFIX + base45_encode(bytes([COMPACT_VERSION << 4 | flags]) + body)
+
+def decode_compact_payload(text):
+    """Inverse of encode_compact_payload; raises ValueError on malformed input."""
+    if not text.startswith(COMPACT_PREFIX):
+        raise ValueError("not a compact QR payload")
+    data = base45_decode(text[len(COMPACT_PREFIX):])
+    if not data:
+        raise ValueError("empty compact QR payload")
+    version, flags = data[0] >> 4, data[0] & 0x0F
+    if version != COMPACT_VERSION:
+        raise ValueError(f"unsupported compact payload version {version}")
+    body = data[1:]
+    if flags & COMPACT_FLAG_ZLIB:
+        try:
+            body = zlib.decompress(body, -15)
+        except zlib.error as e:
+            raise ValueError(f"corrupt compact payload: {e}") from None
+
+    qr_payload = {field: None for field, _ in COMPACT_FIELDS.values()}
+    pos = 0
+    try:
+        while pos < len(body):
+            tag = body[pos]
+            pos += 1
+            raw = bool(tag & COMPACT_RAW)
+            field, kind = COMPACT_FIELDS[tag & ~COMPACT_RAW]
+            if kind == "text" or raw:
+                length, pos = _get_varint(body, pos)
+                value = body[pos:pos + length].decode("utf-8")
+                pos += length
+            elif kind == "date":
+                value = date.fromordinal(int.from_bytes(body[pos:pos + 2], "big") + COMPACT_EPOCH).isoformat()
+                pos += 2
+            else:
+                value = COMPACT_RISKS[body[pos]]
+                pos += 1
+            qr_payload[field] = value
+    except (IndexError, KeyError, UnicodeDecodeError) as e:
+        raise ValueError(f"corrupt compact payload: {e!r}") from None
+    return qr_payload
+
+def decode_qr_content(text):
+    """Fitting payload dict from scanned QR text in either the JSON or compact format."""
+    if text.startswith(COMPACT_PREFIX):
+        return decode_compact_payload(text)
+    return json.loads(text)
+
+def qr_version_for(qr_content, error_correction=QR_ERROR_CORRECTION):
+    """Smallest QR version (1-40) that holds qr_content; its side is 17 + 4 * version modules."""
+    qr = qrcode.QRCode(error_correction=error_correction)
+    qr.add_data(qr_content)
+    qr.make(fit=True)
+    return qr.version
+
+# === Module-matrix rendering core ===
+# Every raster below is an integer upscale of qr.modules, so the QR is
+# encoded once per payload and nothing is read back from disk.
+QR_MODULE_CACHE_ENTRIES = 256
+QR_BOX_SIZE = 10
+QR_BORDER = 4
+_modules_cache = OrderedDict()
+_modules_lock = threading.Lock()
+
+def qr_modules(qr_content, error_correction=QR_ERROR_CORRECTION, border=QR_BORDER):
+    """Boolean module matrix (True = dark) including the quiet zone; memoized per payload."""
+    key = (qr_content, error_correction, border)
+    with _modules_lock:
+        modules = _modules_cache.get(key)
+        if modules is not None:
+            _modules_cache.move_to_end(key)
+            return modules
+    qr = qrcode.QRCode(version=1, error_correction=error_correction, box_size=1, border=border)
+    qr.add_data(qr_content)
+    qr.make(fit=True)
+    modules = np.array(qr.get_matrix(), dtype=bool)
+    modules.setflags(write=False)
+    with _modules_lock:
+        _modules_cache[key] = modules
+        while len(_modules_cache) > QR_MODULE_CACHE_ENTRIES:
+            _modules_cache.popitem(last=False)
+    return modules
+
+def upscale_modules(values, box_size):
+    """Repeat each module (and any trailing channel axis) into a box_size x box_size block."""
+    return values.repeat(box_size, axis=0).repeat(box_size, axis=1)
+
+def modules_to_rgb(modules, box_size, dark=(0, 0, 0), light=(255, 255, 255)):
+    palette = np.array([light, dark], dtype=np.uint8)
+    return upscale_modules(palette[modules.view(np.uint8)], box_size)
+
+def modules_to_gray(modules, box_size):
+    """uint8 raster: 0 for dark modules, 255 for light ones."""
+    return upscale_modules(np.where(modules, np.uint8(0), np.uint8(255)), box_size)
+
+def _threshold_logo_region(gray, logo_path):
+    """Overlay the logo onto a B/W raster in place, re-thresholding only the tile area."""
+    h, w = gray.shape
+    tile, mask = _logo_tile(logo_path, (w, h))
+    x, y = (w - tile.size[0]) // 2, (h - tile.size[1]) // 2
+    region = Image.fromarray(gray[y:y + tile.size[1], x:x + tile.size[0]]).convert("RGB")
+    region.paste(tile, (0, 0), mask)
+    gray[y:y + tile.size[1], x:x + tile.size[0]] = np.where(np.asarray(region.convert("L")) < 128, 0, 255)
+    return gray
+
+def engrave_array(qr_content, box_size=QR_BOX_SIZE):
+    """
+    Engrave raster (uint8, 0 = burn) for qr_content: black modules on white
+    with the logo thresholded in. Same pixels as the saved *_engrave.png,
+    ready for the G-code generators without a PNG round trip.
+    """
+    gray = modules_to_gray(qr_modules(qr_content), box_size)
+    if AI_QR_EMBED_IMAGE and os.path.exists(AI_QR_EMBED_IMAGE):
+        try:
+            gray = _threshold_logo_region(gray, AI_QR_EMBED_IMAGE)
+        except Exception as e:
+            print(f"Logo addition failed: {e}")
+    return gray
+
+def logo_keepout(modules, logo_path=AI_QR_EMBED_IMAGE, box_size=QR_BOX_SIZE):
+    """
+    Boolean mask of the modules under the centred logo tile as drawn at
+    box_size, or None without a logo. Module toolpaths leave these unburned.
+    """
+    if not logo_path or not os.path.exists(logo_path):
+        return None
+    try:
+        h, w = modules.shape[0] * box_size, modules.shape[1] * box_size
+        tile, _ = _logo_tile(logo_path, (w, h))
+    except Exception as e:
+        print(f"Logo keep-out failed: {e}")
+        return None
+    x, y = (w - tile.size[0]) // 2, (h - tile.size[1]) // 2
+    keepout = np.zeros(modules.shape, dtype=bool)
+    keepout[y // box_size:-(-(y + tile.size[1]) // box_size),
+            x // box_size:-(-(x + tile.size[0]) // box_size)] = True
+    return keepout
+
+# === helper to generate base64 inline QR for templates ===
+# Plain inline QR PNGs (scan page, vendor dashboard), LRU keyed by qr_png_etag
+QR_PNG_CACHE_ENTRIES = 512
+_png_cache = OrderedDict()
+_png_lock = threading.Lock()
+_png_stats = {"hits": 0, "misses": 0}
+
+def qr_png_etag(qr_content):
+    """Strong ETag for the inline PNG of qr_content (changes with the payload or renderer)."""
+    return hashlib.sha256(f"{QR_RENDER_VERSION}:inline:{qr_content}".encode("utf-8")).hexdigest()
+
+def qr_png_bytes(qr_content):
+    key = qr_png_etag(qr_content)
+    with _png_lock:
+        png = _png_cache.get(key)
+        if png is not None:
+            _png_cache.move_to_end(key)
+            _png_stats["hits"] += 1
+            return png
+        _png_stats["misses"] += 1
+
+    modules = qr_modules(qr_content, qrcode.constants.ERROR_CORRECT_M, border=2)
+    img = Image.fromarray(modules_to_rgb(modules, 8))
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    png = buf.getvalue()
+
+    with _png_lock:
+        _png_cache[key] = png
+        while len(_png_cache) > QR_PNG_CACHE_ENTRIES:
+            _png_cache.popitem(last=False)
+    return png
+
+def qr_png_cache_stats():
+    with _png_lock:
+        return dict(_png_stats, entries=len(_png_cache))
+
+def generate_qr_image_base64(qr_content):
+    return base64.b64encode(qr_png_bytes(qr_content)).decode('ascii')
+
+# === Create anime-themed QR code with logo ===
+def create_anime_qr_with_logo(qr_content, logo_path=None):
+    """Create an anime-themed QR code with optional logo"""
+    try:
+        img = Image.fromarray(modules_to_rgb(qr_modules(qr_content), QR_BOX_SIZE))
+
+        # Apply anime-style effects if requested
+        img = apply_anime_effects(img)
+
+        # Add logo (logo is mandatory per your instruction)
+        if logo_path:
+            if os.path.exists(logo_path):
+                img = add_logo_to_qr(img, logo_path)
+            else:
+                print(f"[Logo] Logo file not found at {logo_path} (logo is required). Proceeding without visual logo overlay.")
+        return img
+    except Exception as e:
+        print(f"Anime QR creation failed: {e}")
+        return qrcode.make(qr_content).convert('RGB')
+
+# Anime palette: dark modules alternate along diagonals, light modules are tinted
+ANIME_DARK_COLORS = ((0, (50, 100, 200)), (1, (200, 100, 150)))
+ANIME_LIGHT_COLOR = (245, 230, 240)
+ANIME_BORDER_COLOR = (255, 150, 200)
+
+def apply_anime_effects(img):
+    """Apply anime-style visual effects to the QR code"""
+    try:
+        img_array = np.array(img)
+        h, w = img_array.shape[:2]
+        dark = img_array[:, :, 0] < 128
+        # (i + j) % 4 for every pixel
+        rows = (np.arange(h) & 3).astype(np.uint8)
+        cols = (np.arange(w) & 3).astype(np.uint8)
+        diagonal = (rows[:, None] + cols[None, :]) & 3
+        masks = [~dark] + [dark & (diagonal == phase) for phase, _ in ANIME_DARK_COLORS]
+        colors = [ANIME_LIGHT_COLOR] + [color for _, color in ANIME_DARK_COLORS]
+        # Dark pixels on the remaining diagonals keep their original color
+        for channel in range(3):
+            plane = img_array[:, :, channel]
+            for mask, color in zip(masks, colors):
+                np.copyto(plane, color[channel], where=mask)
+        return add_anime_border(Image.fromarray(img_array.astype('uint8')))
+    except Exception as e:
+        print(f"Anime effects failed: {e}")
+        return img
+
+def add_anime_border(img):
+    """Pink frame with rounded corner dots around a styled QR."""
+    draw = ImageDraw.Draw(img)
+    width, height = img.size
+    draw.rectangle([0, 0, width-1, height-1], outline=ANIME_BORDER_COLOR, width=3)
+    corner_size = 15
+    for x, y in [(0, 0), (width-corner_size, 0), (0, height-corner_size), (width-corner_size, height-corner_size)]:
+        draw.ellipse([x, y, x+corner_size, y+corner_size], fill=ANIME_BORDER_COLOR)
+    return img
+
+# === Logo overlay tiles ===
+# logo path -> ((size, mtime_ns), decoded logo, {qr size: (tile, mask)})
+_logo_tiles = {}
+_logo_lock = threading.Lock()
+
+def _logo_tile(logo_path, qr_size):
+    """
+    White-backed RGB logo tile and its paste mask for a QR of qr_size.
+    The logo is decoded once and each tile resized once per QR size;
+    both are dropped when the file's size or mtime changes.
+    """
+    st = os.stat(logo_path)
+    stamp = (st.st_size, st.st_mtime_ns)
+    with _logo_lock:
+        entry = _logo_tiles.get(logo_path)
+        if entry is None or entry[0] != stamp:
+            logo = Image.open(logo_path)
+            logo.load()
+            entry = (stamp, logo, {})
+            _logo_tiles[logo_path] = entry
+        _, logo, tiles = entry
+        if qr_size not in tiles:
+            base_width = min(qr_size[0] // 5, qr_size[1] // 5)
+            wpercent = (base_width / float(logo.size[0]))
+            hsize = int((float(logo.size[1]) * float(wpercent)))
+            resized = logo.resize((base_width, hsize), Image.LANCZOS)
+
+            if resized.mode != 'RGBA':
+                resized = resized.convert('RGBA')
+
+            white_bg = Image.new('RGBA', resized.size, (255, 255, 255, 255))
+            white_bg.paste(resized, (0, 0), resized)
+            tiles[qr_size] = (white_bg.convert('RGB'), white_bg.getchannel('A'))
+        return tiles[qr_size]
+
+def add_logo_to_qr(qr_img, logo_path):
+    """Add logo to the center of QR code"""
+    try:
+        tile, mask = _logo_tile(logo_path, qr_img.size)
+        pos = ((qr_img.size[0] - tile.size[0]) // 2,
+               (qr_img.size[1] - tile.size[1]) // 2)
+        qr_img = qr_img.convert('RGB')
+        qr_img.paste(tile, pos, mask)
+        return qr_img
+    except Exception as e:
+        print(f"Logo addition failed: {e}")
+        return qr_img
+
+# === Content-addressed QR artifact cache ===
+class QRArtifactCache:
+    """
+    Rendered display/engrave PNGs stored under a hash of everything that
+    affects the pixels. Files live in cache_dir and are evicted least
+    recently used first once they exceed max_bytes; an in-process LRU of up
+    to memory_bytes keeps the PNG bytes of hot entries so they skip the disk.
+    """
+    def __init__(self, cache_dir=QR_CACHE_DIR, max_bytes=QR_CACHE_MAX_BYTES, memory_bytes=QR_CACHE_MEMORY_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.memory_bytes = memory_bytes
+        self._memory = OrderedDict()    # key -> (display_png, engrave_png)
+        self._memory_size = 0
+        self._file_digests = {}
+        self._disk_bytes = None
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+    def key(self, qr_content, style, logo_path, error_correction):
+        h = hashlib.sha256()
+        for part in (QR_RENDER_VERSION, style, error_correction, self._file_digest(logo_path), qr_content):
+            h.update(str(part).encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _file_digest(self, path):
+        """Hash of a file's bytes, recomputed only when its size or mtime changes."""
+        if not path or not os.path.exists(path):
+            return "none"
+        st = os.stat(path)
+        stamp = (st.st_size, st.st_mtime_ns)
+        cached = self._file_digests.get(path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        with open(path, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        self._file_digests[path] = (stamp, digest)
+        return digest
+
+    def _paths(self, key):
+        shard = os.path.join(self.cache_dir, key[:2])
+        return os.path.join(shard, f"{key}_display.png"), os.path.join(shard, f"{key}_engrave.png")
+
+    def get(self, key):
+        """(display_png, engrave_png) bytes for a cached key, or None."""
+        with self._lock:
+            pngs = self._memory.get(key)
+            if pngs is not None:
+                self._memory.move_to_end(key)
+                self._counters["memory_hits"] += 1
+                return pngs
+        try:
+            pngs = []
+            for path in self._paths(key):
+                with open(path, "rb") as f:
+                    pngs.append(f.read())
+                # Bump mtime: it is the recency used for disk eviction
+                os.utime(path)
+        except OSError:
+            with self._lock:
+                self._counters["misses"] += 1
+            return None
+        pngs = tuple(pngs)
+        with self._lock:
+            self._remember(key, pngs)
+            self._counters["disk_hits"] += 1
+        return pngs
+
+    def put(self, key, display_img, engrave_img):
+        """Store rendered images atomically and return their (display_png, engrave_png) bytes."""
+        pngs = tuple(_png_bytes(img) for img in (display_img, engrave_img))
+        paths = self._paths(key)
+        os.makedirs(os.path.dirname(paths[0]), exist_ok=True)
+        for data, path in zip(pngs, paths):
+            _write_atomic(path, data)
+        with self._lock:
+            self._remember(key, pngs)
+            if self._disk_bytes is not None:
+                self._disk_bytes += sum(len(data) for data in pngs)
+        if self._disk_usage() > self.max_bytes:
+            self._evict()
+        return pngs
+
+    def _remember(self, key, pngs):
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= sum(len(data) for data in old)
+        self._memory[key] = pngs
+        self._memory_size += sum(len(data) for data in pngs)
+        while self._memory_size > self.memory_bytes and self._memory:
+            _, dropped = self._memory.popitem(last=False)
+            self._memory_size -= sum(len(data) for data in dropped)
+
+    def _scan(self):
+        """[(last_used, size, paths)] per cached key."""
+        entries = {}
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".png"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    entry = entries.setdefault(name.split("_")[0], [0, 0, []])
+                    entry[0] = max(entry[0], st.st_mtime)
+                    entry[1] += st.st_size
+                    entry[2].append(path)
+        return list(entries.values())
+
+    def _disk_usage(self):
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, size, _ in self._scan())
+            return self._disk_bytes
+
+    def _evict(self):
+        """Delete least recently used artifacts until the cache is back to 90% of max_bytes."""
+        entries = sorted(self._scan(), key=lambda e: e[0])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        evicted = 0
+        for _, size, paths in entries:
+            if total <= target:
+                break
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._disk_bytes = total
+            self._counters["evictions"] += evicted
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_size
+            stats["disk_bytes"] = self._disk_bytes
+        return stats
+
+qr_artifact_cache = QRArtifactCache()
+
+# === Centralized QR image saver (creates display + engrave) ===
+def render_qr_images(qr_content):
+    """
+    Render the display (pink background + logo) and engrave (white
+    background + logo, 1-bit B/W) images for qr_content.
+    Returns (display_image, engrave_image)
+    """
+    # Generate base QR
+    modules = qr_modules(qr_content)
+
+    # 1) Display QR (pink background)
+    try:
+        if USE_AI_QR:
+            # attempt an "artistic/anime" style first
+            img_disp = create_anime_qr_with_logo(qr_content, AI_QR_EMBED_IMAGE)
+        else:
+            img_disp = Image.fromarray(modules_to_rgb(modules, QR_BOX_SIZE, light=PINK))
+            if AI_QR_EMBED_IMAGE and os.path.exists(AI_QR_EMBED_IMAGE):
+                img_disp = add_logo_to_qr(img_disp, AI_QR_EMBED_IMAGE)
+    except Exception as e:
+        print(f"[save_qr_image] display generation failed: {e}")
+        img_disp = Image.fromarray(modules_to_rgb(modules, QR_BOX_SIZE, light=PINK))
+        if AI_QR_EMBED_IMAGE and os.path.exists(AI_QR_EMBED_IMAGE):
+            img_disp = add_logo_to_qr(img_disp, AI_QR_EMBED_IMAGE)
+
+    # 2) Engrave QR (strict black/white, with logo area white to keep scannable)
+    # 1-bit B/W helps reduce g-code size and ensures engraving clarity
+    img_eng = Image.fromarray(engrave_array(qr_content) > 127)
+
+    return img_disp, img_eng
+
+def save_qr_image(uid, qr_content):
+    """
+    Saves two QR images:
+    - <uid>_display.png (pink background + logo) for UI
+    - <uid>_engrave.png (white background + logo, 1-bit B/W) for laser engraving
+    The images come from qr_artifact_cache and are only rendered when no
+    artifact exists yet for this payload, render style, logo and error
+    correction level, and the published files are only rewritten when their
+    bytes differ.
+    Returns (display_path, engrave_path)
+    """
+    qr_path_display = os.path.join(qr_dir, f"{uid}_display.png")
+    qr_path_engrave = os.path.join(qr_dir, f"{uid}_engrave.png")
+
+    key = qr_artifact_cache.key(qr_content, "ai" if USE_AI_QR else "plain",
+                                AI_QR_EMBED_IMAGE, QR_ERROR_CORRECTION)
+    artifacts = qr_artifact_cache.get(key)
+    if artifacts is None:
+        img_disp, img_eng = render_qr_images(qr_content)
+        artifacts = qr_artifact_cache.put(key, img_disp, img_eng)
+        print(f"[QR] Rendered QR artifacts {key[:12]} for UID {uid}")
+
+    # Copies, not links: evicting the cache entry must free its disk space.
+    # Files that already hold these bytes are left alone (repeat sends).
+    _publish(qr_path_display, artifacts[0])
+    _publish(qr_path_engrave, artifacts[1])
+    return qr_path_display, qr_path_engrave
+
+def _png_bytes(img):
+    buf = io.BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+def _write_atomic(path, data):
+    """Write data to path via a temp file and rename, so readers never see a partial file."""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def _publish(path, data):
+    """Write data to path unless the file already holds exactly these bytes. Returns True if written."""
+    try:
+        if os.path.getsize(path) == len(data):
+            with open(path, "rb") as f:
+                if f.read() == data:
+                    return False
+    except OSError:
+        pass
+    _write_atomic(path, data)
+    return True
+
+def vendor_engrave_array(qr_content, box_size=QR_BOX_SIZE):
+    """
+    Vendor engrave raster (uint8, 0 = burn): plain black modules on white at
+    ECC level H, no logo. Same pixels as save_vendor_qr_image writes, for the
+    G-code generators without a PNG round trip.
+    """
+    return modules_to_gray(qr_modules(qr_content, qrcode.constants.ERROR_CORRECT_H, QR_BORDER), box_size)
+
+def save_vendor_qr_image(vendor_id, qr_content):
+    """Save vendor QR image for engraving"""
+    vendor_qr_dir = os.path.join("static", "vendor_qrcodes")
+    os.makedirs(vendor_qr_dir, exist_ok=True)
+    
+    qr_path_engrave = os.path.join(vendor_qr_dir, f"vendor_{vendor_id}_engrave.png")
+    
+    # 1-bit B/W for engraving
+    Image.fromarray(vendor_engrave_array(qr_content) > 127).save(qr_path_engrave)
+    
+    return qr_path_engrave
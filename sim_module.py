@@ -0,0 +1,209 @@
+import argparse
+import json
+import math
+import sqlite3
+
+import cv2
+import numpy as np
+
+from qr_module import fitting_qr_content, resolve_qr_mode
+from gcode_module import GCODE_METHODS, LASER_BEAM_MM, fitting_gcode, gcode_words
+from ai_module import QRAnomalyDetector
+from esp32_module import ESP32_RX_BUFFER
+
+DB = "fittings.db"
+
+# === Machine + link model ===
+# A GRBL-style controller behind the websocket sender in esp32_module: lines
+# go out while their characters fit in the controller's receive buffer (plus
+# the sender's command_delay after each), the controller acks once a line
+# fits in its planner queue, and moves run back to back.
+SIM_RAPID_MM_MIN = 5000     # G0 rate (the generators' travel_speed)
+SIM_ACK_LATENCY_S = 0.02    # websocket round trip per line
+SIM_STREAM_DELAY_S = 0.0    # sender's pause after each line
+SIM_WINDOW_BYTES = ESP32_RX_BUFFER  # unacknowledged bytes the sender allows
+SIM_PLANNER_BLOCKS = 15     # lines the controller queues ahead of the one running
+SIM_BEAM_MM = LASER_BEAM_MM  # burned line width
+SIM_PX_PER_MM = 50          # resolution of the simulated burn
+SIM_MAX_PX = 1600           # cap on the burn image side (very large jobs get coarser)
+
+# === G-code parsing ===
+def parse_gcode(gcode_text):
+    """
+    Our dialect (G0/G1 X Y F, M3 [S], M5, S, setup words) as one block per
+    command line. Returns a dict of arrays: start/end points (mm, from 0,0),
+    'rapid' and 'burn' flags and 'rate' (mm/min) for every block; non-motion
+    blocks are zero-length. 'bytes' is each line as sent, newline included.
+    """
+    x = y = 0.0
+    mode, feed = None, None
+    laser_on, power = False, 0.0
+    rows = []
+    for line in gcode_text.splitlines():
+        words = gcode_words(line)
+        if not words:
+            continue
+        values = {}
+        for w in words:
+            if w in ("G0", "G00"):
+                mode = "G0"
+            elif w in ("G1", "G01"):
+                mode = "G1"
+            elif w in ("M3", "M03", "M4", "M04"):
+                laser_on = True
+            elif w in ("M5", "M05"):
+                laser_on = False
+            elif w[0] in "XYFS":
+                values[w[0]] = float(w[1:])
+        power = values.get("S", power)
+        feed = values.get("F", feed)
+        nx, ny = values.get("X", x), values.get("Y", y)
+        moving = mode is not None and (nx, ny) != (x, y)
+        rapid = moving and mode == "G0"
+        rate = SIM_RAPID_MM_MIN if rapid or not feed else feed
+        rows.append((x, y, nx, ny, rapid, moving and not rapid and laser_on and power > 0, rate,
+                     len(line.strip()) + 1))
+        if moving:
+            x, y = nx, ny
+    table = np.array(rows, dtype=float).reshape(-1, 8)
+    return {"start": table[:, 0:2], "end": table[:, 2:4], "rapid": table[:, 4].astype(bool),
+            "burn": table[:, 5].astype(bool), "rate": table[:, 6], "bytes": table[:, 7].astype(int)}
+
+# === Job time ===
+def estimate_job_time(durations, ack_latency=SIM_ACK_LATENCY_S, stream_delay=SIM_STREAM_DELAY_S,
+                      planner_blocks=SIM_PLANNER_BLOCKS, sizes=None, window_bytes=SIM_WINDOW_BYTES):
+    """
+    Wall-clock seconds from the first line sent to the last move finished,
+    given each line's execution time and sent size in bytes (without sizes,
+    one line in flight at a time). Constant feed (no acceleration).
+    """
+    half = ack_latency / 2
+    finished = []               # when each block leaves the planner queue
+    in_flight = []              # (ack time, size) of unacknowledged lines, oldest first
+    in_flight_bytes = 0
+    send = ack = busy_until = 0.0
+    for i, duration in enumerate(durations):
+        size = sizes[i] if sizes is not None else window_bytes + 1
+        # Wait for acks until the line fits (the first in flight always goes)
+        while in_flight and in_flight_bytes + size > window_bytes:
+            acked, acked_size = in_flight.pop(0)
+            send = max(send, acked)
+            in_flight_bytes -= acked_size
+        accept = send + half
+        if i >= planner_blocks:
+            accept = max(accept, finished[i - planner_blocks])
+        busy_until = max(accept, busy_until) + duration
+        finished.append(busy_until)
+        ack = accept + half
+        in_flight.append((ack, size))
+        in_flight_bytes += size
+        send += stream_delay
+    return max(busy_until, ack)
+
+# === Burn rendering ===
+def render_burn(blocks, beam_mm=SIM_BEAM_MM, px_per_mm=SIM_PX_PER_MM, margin_mm=2.0):
+    """Grayscale image of the laser-on segments (0 = burned) with a white margin."""
+    segments = np.stack([blocks["start"][blocks["burn"]], blocks["end"][blocks["burn"]]], axis=1)
+    extent = float(segments.max()) if len(segments) else 0.0
+    px_per_mm = min(px_per_mm, SIM_MAX_PX / (extent + 2 * margin_mm))
+    side = int(math.ceil((extent + 2 * margin_mm) * px_per_mm))
+    img = np.full((side, side), 255, dtype=np.uint8)
+    if len(segments):
+        # 4 fractional bits keep sub-pixel endpoints
+        points = np.round((segments + margin_mm) * px_per_mm * 16).astype(np.int32)
+        thickness = max(1, round(beam_mm * px_per_mm))
+        cv2.polylines(img, list(points), False, 0, thickness, cv2.LINE_8, 4)
+    return img
+
+# === Simulation ===
+_detector = None
+
+def _qr_detector():
+    global _detector
+    if _detector is None:
+        _detector = QRAnomalyDetector()
+    return _detector
+
+def simulate_gcode(gcode_text, expected=None, ack_latency=SIM_ACK_LATENCY_S, stream_delay=SIM_STREAM_DELAY_S,
+                   beam_mm=SIM_BEAM_MM, window_bytes=SIM_WINDOW_BYTES):
+    """
+    Dry-run a G-code job. Returns (report, burn_image): line/byte counts,
+    motion-only and estimated wall-clock seconds, burn and travel distance,
+    and, when expected is given, whether the burned image decodes to it
+    ("valid", "mismatch" or "unreadable").
+    """
+    blocks = parse_gcode(gcode_text)
+    lengths = np.hypot(*(blocks["end"] - blocks["start"]).T)
+    durations = lengths / blocks["rate"] * 60.0
+    image = render_burn(blocks, beam_mm)
+    report = {
+        "lines": len(lengths),
+        "bytes": len(gcode_text),
+        "motion_seconds": round(float(durations.sum()), 2),
+        "estimated_seconds": round(estimate_job_time(durations.tolist(), ack_latency, stream_delay,
+                                                     sizes=blocks["bytes"].tolist(), window_bytes=window_bytes), 2),
+        "burn_mm": round(float(lengths[blocks["burn"]].sum()), 1),
+        "travel_mm": round(float(lengths[~blocks["burn"]].sum()), 1),
+    }
+    if expected is not None:
+        report["decode"], _ = _qr_detector().check_array(image, expected)
+    return report, image
+
+def compare_methods(qr_content, methods=GCODE_METHODS, ack_latency=SIM_ACK_LATENCY_S,
+                    stream_delay=SIM_STREAM_DELAY_S, beam_mm=SIM_BEAM_MM, window_bytes=SIM_WINDOW_BYTES):
+    """simulate_gcode report for each G-code method of a fitting, as sent by send_gcode."""
+    results = []
+    for method in methods:
+        report, _ = simulate_gcode(fitting_gcode(qr_content, method), qr_content,
+                                   ack_latency, stream_delay, beam_mm, window_bytes)
+        results.append(dict(report, method=method))
+    return results
+
+def fitting_content(uid, db_path=DB):
+    """The QR content send_gcode would engrave for uid, or None."""
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    row = conn.execute("SELECT * FROM fittings_live WHERE uid=?", (uid,)).fetchone()
+    conn.close()
+    if row is None:
+        return None
+    row_dict = dict(row)
+    return fitting_qr_content(row_dict, resolve_qr_mode(row_dict))
+
+def print_comparison(results):
+    print(f"{'method':<9} {'lines':>7} {'KiB':>6} {'motion s':>9} {'est. s':>8} {'burn mm':>9} {'travel mm':>10}  decode")
+    for r in results:
+        print(f"{r['method']:<9} {r['lines']:>7} {r['bytes'] / 1024:>6.0f} {r['motion_seconds']:>9.1f} "
+              f"{r['estimated_seconds']:>8.1f} {r['burn_mm']:>9.0f} {r['travel_mm']:>10.0f}  {r.get('decode', '-')}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Simulate engrave G-code offline: job time and a decode check of the burn.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--uid", help="compare every G-code method for this fitting")
+    target.add_argument("--gcode", help="simulate an existing G-code file")
+    parser.add_argument("--expect", help="QR text the --gcode burn should decode to")
+    parser.add_argument("--methods", nargs="+", choices=GCODE_METHODS, default=list(GCODE_METHODS))
+    parser.add_argument("--ack-latency", type=float, default=SIM_ACK_LATENCY_S, help="seconds per line round trip")
+    parser.add_argument("--stream-delay", type=float, default=SIM_STREAM_DELAY_S, help="sender pause after each line")
+    parser.add_argument("--window", type=int, default=SIM_WINDOW_BYTES,
+                        help="unacknowledged bytes the sender allows (0: one line at a time)")
+    parser.add_argument("--beam", type=float, default=SIM_BEAM_MM, help="burned line width in mm")
+    parser.add_argument("--save", help="write the simulated burn image here (--gcode only)")
+    parser.add_argument("--db", default=DB)
+    args = parser.parse_args()
+
+    if args.gcode:
+        with open(args.gcode) as f:
+            report, image = simulate_gcode(f.read(), args.expect, args.ack_latency, args.stream_delay, args.beam,
+                                           args.window)
+        if args.save:
+            cv2.imwrite(args.save, image)
+        print(json.dumps(report, indent=2))
+    else:
+        qr_content = fitting_content(args.uid, args.db)
+        if qr_content is None:
+            print(f"[Sim] Fitting {args.uid} not found.")
+        else:
+            print_comparison(compare_methods(qr_content, args.methods, args.ack_latency,
+                                             args.stream_delay, args.beam, args.window))
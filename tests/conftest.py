@@ -0,0 +1,76 @@
+import os
+import random
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+
+import jinja2
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+NOTES_SAMPLES = ["", "ok", "good condition", "minor wear", "loose bolt", "leak near joint",
+                 "corrosion spotted", "bad fit", "perfect fittings", "checked"]
+
+FITTINGS_SCHEMA = """
+    CREATE TABLE fittings (
+        uid TEXT PRIMARY KEY, item_type TEXT, vendor TEXT, vendor_id TEXT, lot TEXT,
+        supply_date TEXT, warranty TEXT, warranty_end TEXT, manufactor_date TEXT,
+        manufactor_number TEXT, notes TEXT, vendor_email TEXT,
+        udm_synced INTEGER DEFAULT 0, tms_synced INTEGER DEFAULT 0,
+        risk_flag INTEGER DEFAULT 0, risk TEXT DEFAULT 'Low', vendor_risk TEXT DEFAULT 'Low',
+        inspection_date TEXT, repair_date TEXT, failure_count INTEGER DEFAULT 0
+    )
+"""
+
+def _format_date(day, rng, unpadded):
+    """ISO date, or (when unpadded) sometimes without zero padding, as strptime also accepts."""
+    if unpadded and rng.random() < 0.5:
+        return f"{day.year}-{day.month}-{day.day}"
+    return day.isoformat()
+
+@pytest.fixture
+def make_fittings_db(tmp_path):
+    """Factory: a fittings.db (baseline schema) with rows random fittings; returns its path."""
+    def make(rows=500, vendors=10, seed=1, unpadded_dates=False, name="fittings.db"):
+        rng = random.Random(seed)
+        today = datetime.today().date()
+        path = str(tmp_path / name)
+        conn = sqlite3.connect(path)
+        conn.execute(FITTINGS_SCHEMA)
+        conn.execute("CREATE INDEX idx_fittings_vendor_id ON fittings(vendor_id)")
+        values = []
+        for i in range(rows):
+            supply = today - timedelta(days=rng.randint(0, 1500))
+            manufactor = supply - timedelta(days=rng.randint(0, 90)) if rng.random() < 0.7 else None
+            warranty_end = supply + timedelta(days=rng.randint(30, 2000))
+            values.append((f"UID{i:08d}", "clip", f"Vendor {i % vendors}", str(i % vendors), f"LOT{i // 100}",
+                           _format_date(supply, rng, unpadded_dates),
+                           _format_date(warranty_end, rng, unpadded_dates),
+                           _format_date(manufactor, rng, unpadded_dates) if manufactor else "",
+                           rng.choice(NOTES_SAMPLES), rng.choice([0, 0, 0, 1, 2, 3])))
+        conn.executemany("""
+            INSERT INTO fittings (uid, item_type, vendor, vendor_id, lot, supply_date, warranty_end,
+                                  manufactor_date, notes, failure_count)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, values)
+        conn.commit()
+        conn.close()
+        return path
+    return make
+
+@pytest.fixture
+def app_client(tmp_path, monkeypatch):
+    """Flask test client for app.py, with its databases and static files under tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("RAIL_QR_SIGNING_KEY", "test-signing-key")
+    import qr_module
+    monkeypatch.setattr(qr_module, "_signing_key", None)
+    os.makedirs(qr_module.qr_dir, exist_ok=True)
+    import app
+    app.init_vendor_db()
+    app.ensure_table_columns()
+    # The templates sit next to app.py rather than in templates/
+    app.app.jinja_loader = jinja2.FileSystemLoader(REPO_ROOT)
+    return app.app.test_client()
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+import qrcode
+from PIL import Image
+
+import qr_module
+
+
+def reference_apply_anime_effects(img):
+    """The per-pixel loop that apply_anime_effects replaced; output must match it exactly."""
+    img_array = np.array(img)
+    h, w = img_array.shape[:2]
+    for i in range(h):
+        for j in range(w):
+            if img_array[i, j, 0] < 128:  # Dark pixels
+                if (i + j) % 4 == 0:
+                    img_array[i, j] = [50, 100, 200]
+                elif (i + j) % 4 == 1:
+                    img_array[i, j] = [200, 100, 150]
+            else:
+                img_array[i, j] = [245, 230, 240]
+    return qr_module.add_anime_border(Image.fromarray(img_array.astype('uint8')))
+
+def qr_base_image(version, box_size=10, data=None):
+    qr = qrcode.QRCode(version=version, error_correction=qr_module.QR_ERROR_CORRECTION,
+                       box_size=box_size, border=4)
+    qr.add_data(data or f"B{version}")
+    qr.make(fit=False)
+    return qr.make_image(fill_color="black", back_color="white").convert("RGB")
+
+# Box sizes that are and are not multiples of the 4-pixel diagonal period
+@pytest.mark.parametrize("version,box_size", [(1, 10), (2, 3), (5, 7), (10, 4), (25, 2)])
+def test_apply_anime_effects_matches_pixel_loop(version, box_size):
+    img = qr_base_image(version, box_size)
+    expected = reference_apply_anime_effects(img)
+    actual = qr_module.apply_anime_effects(img)
+    assert actual.size == expected.size
+    assert np.array_equal(np.array(actual), np.array(expected))
+
+def test_apply_anime_effects_matches_pixel_loop_on_grey_pixels():
+    # Anti-aliased or logo pixels are neither pure black nor white
+    rng = np.random.default_rng(3)
+    img = Image.fromarray(rng.integers(0, 256, size=(61, 67, 3), dtype=np.uint8))
+    assert np.array_equal(np.array(qr_module.apply_anime_effects(img)),
+                          np.array(reference_apply_anime_effects(img)))
@@ -0,0 +1,65 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+import gcode_module
+import qr_module
+from gcode_module import order_closed_paths, travel_length
+
+
+def random_paths(seed):
+    rng = np.random.default_rng(seed)
+    paths = [rng.integers(0, 100, size=(rng.integers(2, 7), 2)) for _ in range(rng.integers(1, 15))]
+    if seed % 2:
+        paths.sort(key=lambda p: p[0, 0])  # an input order that is already fairly good
+    return paths
+
+def tour_of(paths, order, entries, start=(0, 0)):
+    return np.vstack([start] + [paths[k][e:e + 1] for k, e in zip(order, entries)] + [start]).astype(float)
+
+# 821, 898, 1423, 1748: nearest neighbour + 2-opt ends up longer than the given order
+@pytest.mark.parametrize("seed", [*range(100), 821, 898, 1423, 1748])
+def test_optimized_travel_never_longer_and_visits_each_path_once(seed):
+    paths = random_paths(seed)
+    order, entries, before, after = order_closed_paths(paths)
+    assert sorted(order) == list(range(len(paths)))
+    assert all(0 <= e < len(paths[k]) for k, e in zip(order, entries))
+    assert before == pytest.approx(travel_length(tour_of(paths, range(len(paths)), [0] * len(paths))))
+    assert after == pytest.approx(travel_length(tour_of(paths, order, entries)))
+    assert after <= before + 1e-9
+
+def test_no_paths():
+    assert order_closed_paths([]) == ([], [], 0.0, 0.0)
+
+def emitted_contours(gcode_lines):
+    """Each laser-on stretch as its list of points; checks it ends where it started."""
+    contours, current, pos = [], None, None
+    for line in gcode_lines:
+        words = line.split()
+        if words[0] in ("G0", "G1") and len(words) > 1 and words[1][0] == "X":
+            pos = (float(words[1][1:]), float(words[2][1:]))
+            if current is not None and words[0] == "G1":
+                current.append(pos)
+        elif line == f"M3 S{255}":
+            current = [pos]
+        elif line == "M3 S0" and current is not None:
+            assert current[-1] == current[0], "contour does not close"
+            contours.append(current[:-1])
+            current = None
+    return contours
+
+def canonical(points):
+    """A closed contour independent of its entry vertex."""
+    i = min(range(len(points)), key=lambda k: points[k])
+    return tuple(points[i:] + points[:i])
+
+def test_contours_emitted_once_and_closed_from_any_entry():
+    img = qr_module.engrave_array("contour order check " * 3, box_size=4)
+    kwargs = dict(laser_power=255, travel_speed=5000, engrave_speed=1500, target_size_mm=20.0)
+    plain = emitted_contours(gcode_module.iter_contour_gcode(img, optimize_travel=False, **kwargs))
+    optimized = emitted_contours(gcode_module.iter_contour_gcode(img, optimize_travel=True, **kwargs))
+    assert len(plain) > 10
+    assert Counter(map(canonical, optimized)) == Counter(map(canonical, plain))
+    # Some contours really are entered at a vertex other than their first
+    assert sum(a != b for a, b in zip(sorted(map(tuple, plain)), sorted(map(tuple, optimized)))) > 0
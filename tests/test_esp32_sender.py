@@ -0,0 +1,84 @@
+import asyncio
+
+from esp32_module import ESP32_RX_BUFFER, stream_gcode
+
+
+class FakeController:
+    """
+    In-process stand-in for the websocket to the ESP32: each recv() acks the
+    oldest line still held, which frees its bytes from an rx_buffer-byte
+    receive buffer. replies maps a line to the message acking it; after
+    ack_limit acks it goes silent.
+    """
+    def __init__(self, rx_buffer=ESP32_RX_BUFFER, replies=None, ack_limit=None, chatter=()):
+        self.rx_buffer = rx_buffer
+        self.replies = replies or {}
+        self.ack_limit = ack_limit
+        self.chatter = list(chatter)   # non-ack messages delivered before the first ack
+        self.held = []
+        self.sent = []
+        self.buffered = self.peak_bytes = self.peak_lines = self.overflows = 0
+
+    async def send(self, line):
+        self.sent.append(line)
+        self.held.append(line)
+        self.buffered += len(line) + 1
+        self.peak_bytes = max(self.peak_bytes, self.buffered)
+        self.peak_lines = max(self.peak_lines, len(self.held))
+        self.overflows += self.buffered > self.rx_buffer
+
+    async def recv(self):
+        if self.chatter:
+            return self.chatter.pop(0)
+        if not self.held or (self.ack_limit is not None and len(self.sent) - len(self.held) >= self.ack_limit):
+            await asyncio.Event().wait()   # never answers
+        line = self.held.pop(0)
+        self.buffered -= len(line) + 1
+        return self.replies.get(line, "ok")
+
+GCODE = "\n".join(["G21", "G90", "; comment", "", "M3 S255"] +
+                  [f"G1 X{i * 0.1:.3f} Y{(i % 7) * 0.1:.3f} F1500" for i in range(300)] + ["M5", "G0 X0 Y0"])
+EXPECTED = [line for line in GCODE.splitlines() if line and not line.startswith(";")]
+
+def run(controller, gcode=GCODE, **kwargs):
+    return asyncio.run(stream_gcode(controller, gcode, **kwargs))
+
+def test_window_keeps_rx_buffer_full_without_overflow():
+    controller = FakeController()
+    stats = run(controller)
+    assert controller.sent == EXPECTED
+    assert controller.overflows == 0 and controller.peak_bytes <= ESP32_RX_BUFFER
+    assert controller.peak_lines > 1
+    assert stats["lines"] == stats["acked"] == len(EXPECTED) and stats["errors"] == 0
+    assert stats["bytes"] == sum(len(line) + 1 for line in EXPECTED)
+    assert stats["aborted"] is None
+
+def test_window_zero_sends_one_line_at_a_time():
+    controller = FakeController()
+    stats = run(controller, window_bytes=0)
+    assert controller.peak_lines == 1
+    assert stats["acked"] == len(EXPECTED)
+
+def test_over_long_line_goes_out_alone():
+    long_line = "G1 " + " ".join(f"X{i}" for i in range(60))
+    controller = FakeController()
+    stats = run(controller, gcode="\n".join(["G21", long_line, "G90"]))
+    assert controller.sent == ["G21", long_line, "G90"]
+    assert controller.overflows == 1 and controller.peak_lines == 1
+    assert stats["acked"] == 3
+
+def test_acks_are_matched_to_lines_in_order():
+    bad = EXPECTED[10]
+    controller = FakeController(replies={bad: "error:20"}, chatter=["ESP32 connected", "[MSG:laser]"])
+    stats = run(controller)
+    assert stats["errors"] == 1 and stats["acked"] == len(EXPECTED) - 1
+    assert controller.sent == EXPECTED
+
+def test_missing_ack_aborts_without_sending_past_the_window():
+    controller = FakeController(ack_limit=20)
+    stats = run(controller, ack_timeout=0.05)
+    assert stats["aborted"] and EXPECTED[20][:40] in stats["aborted"]
+    assert stats["acked"] == 20 and stats["lines"] < len(EXPECTED)
+    # The stalled lines stay counted against the buffer: nothing more was sent
+    assert controller.overflows == 0 and controller.buffered <= ESP32_RX_BUFFER
+    assert controller.sent == EXPECTED[:stats["lines"]]
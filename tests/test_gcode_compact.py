@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+import gcode_module
+import qr_module
+from gcode_module import GCODE_METHODS, LASER_BEAM_MM, iter_compact_gcode, compact_gcode
+from sim_module import parse_gcode, render_burn
+
+QR_CONTENT = "UID00001234 compaction check"
+
+def burn_length(blocks):
+    burn = blocks["burn"]
+    return np.linalg.norm(blocks["end"][burn] - blocks["start"][burn], axis=1).sum()
+
+def assert_same_burn(raw_text, compact_text):
+    raw, compact = parse_gcode(raw_text), parse_gcode(compact_text)
+    assert burn_length(compact) == pytest.approx(burn_length(raw))
+    assert np.array_equal(render_burn(compact), render_burn(raw))
+
+def raw_gcode_lines(method):
+    """A method's G-code as generated, before compaction."""
+    if method == "modules":
+        modules = qr_module.qr_modules(QR_CONTENT)
+        return gcode_module.iter_modules_gcode(modules, 20.0 / modules.shape[1], line_mm=LASER_BEAM_MM,
+                                               keepout=qr_module.logo_keepout(modules))
+    return gcode_module.iter_gcode(qr_module.engrave_array(QR_CONTENT), method, target_size_mm=20.0)
+
+@pytest.mark.parametrize("method", GCODE_METHODS)
+def test_compaction_keeps_burn_coverage(method):
+    raw = list(raw_gcode_lines(method))
+    compact = list(iter_compact_gcode(raw))
+    assert sum(len(line) + 1 for line in compact) < sum(len(line) + 1 for line in raw)
+    assert_same_burn("\n".join(raw), "\n".join(compact))
+
+def test_compaction_merges_moves_without_changing_the_burn():
+    raw = "\n".join([
+        "G21", "G90", "M5", "G0 X0 Y0 F5000", "; start",
+        "G0 X1 Y1", "G0 X2 Y2",                         # rapid chain
+        "M3 S255", "G1 X3 Y2 F1500", "G1 X4 Y2 F1500",  # collinear burns
+        "G1 X4 Y2", "G1 X5.000 Y2",                     # zero-length, then a continuation
+        "S128", "G1 X5 Y3", "M5",
+        "G0 X0 Y0",
+    ])
+    compact = compact_gcode(raw)
+    assert len(compact.splitlines()) < len(raw.splitlines())
+    assert_same_burn(raw, compact)
@@ -0,0 +1,81 @@
+import json
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+import gcode_module
+import qr_module
+from sim_module import parse_gcode
+
+CONTENT = json.dumps({"uid": "MODULES", "notes": "x" * 120})
+MODULE_MM = 0.4
+
+@pytest.fixture
+def logo_path(tmp_path):
+    """A wide logo with transparent corners, so the tile is not square."""
+    logo = Image.new("RGBA", (300, 180), (0, 0, 0, 0))
+    ImageDraw.Draw(logo).ellipse([10, 10, 290, 170], fill=(20, 40, 160, 255))
+    path = tmp_path / "logo.png"
+    logo.save(path)
+    return str(path)
+
+def rect_cover(modules_shape, rects):
+    """How many rectangles cover each module."""
+    counts = np.zeros(modules_shape, dtype=int)
+    for r0, r1, c0, c1 in zip(*(part.tolist() for part in rects)):
+        counts[r0:r1 + 1, c0:c1 + 1] += 1
+    return counts
+
+@pytest.mark.parametrize("merge_rows", [False, True])
+@pytest.mark.parametrize("source", ["qr", "random"])
+def test_module_rects_cover_dark_modules_minus_keepout_once(logo_path, merge_rows, source):
+    if source == "qr":
+        modules = qr_module.qr_modules(CONTENT)
+    else:
+        modules = np.random.default_rng(5).random((41, 41)) < 0.5
+    for keepout in (None, qr_module.logo_keepout(modules, logo_path)):
+        wanted = modules if keepout is None else modules & ~keepout
+        counts = rect_cover(modules.shape, gcode_module.module_rects(modules, keepout, merge_rows))
+        assert counts.max() <= 1
+        assert np.array_equal(counts == 1, wanted)
+
+def test_merge_rows_joins_stacked_runs():
+    modules = np.zeros((6, 6), dtype=bool)
+    modules[1:4, 2:5] = True
+    modules[4, 2:4] = True
+    r0, r1, c0, c1 = gcode_module.module_rects(modules, merge_rows=True)
+    assert sorted(zip(r0.tolist(), r1.tolist(), c0.tolist(), c1.tolist())) == [(1, 3, 2, 4), (4, 4, 2, 3)]
+
+def test_logo_keepout_contains_every_module_the_logo_changes(logo_path, monkeypatch):
+    modules = qr_module.qr_modules(CONTENT)
+    keepout = qr_module.logo_keepout(modules, logo_path)
+    plain = qr_module.modules_to_gray(modules, qr_module.QR_BOX_SIZE)
+    monkeypatch.setattr(qr_module, "AI_QR_EMBED_IMAGE", logo_path)
+    with_logo = qr_module.engrave_array(CONTENT)
+    changed = (with_logo != plain).reshape(modules.shape[0], qr_module.QR_BOX_SIZE,
+                                           modules.shape[1], qr_module.QR_BOX_SIZE).any(axis=(1, 3))
+    assert changed.any()
+    assert not (changed & ~keepout).any()
+    # A centred block, well inside the quiet zone
+    rows, cols = np.nonzero(keepout)
+    assert keepout[rows.min():rows.max() + 1, cols.min():cols.max() + 1].all()
+    assert rows.min() + rows.max() in (modules.shape[0] - 1, modules.shape[0] - 2, modules.shape[0])
+    assert qr_module.logo_keepout(modules, None) is None
+
+@pytest.mark.parametrize("line_mm", [None, gcode_module.LASER_BEAM_MM])
+def test_no_burn_move_enters_the_keepout(logo_path, line_mm):
+    modules = qr_module.qr_modules(CONTENT)
+    keepout = qr_module.logo_keepout(modules, logo_path)
+    gcode = "\n".join(gcode_module.iter_modules_gcode(modules, MODULE_MM, line_mm=line_mm, keepout=keepout))
+    blocks = parse_gcode(gcode)
+    burned = np.zeros(modules.shape, dtype=bool)
+    for start, end in zip(blocks["start"][blocks["burn"]], blocks["end"][blocks["burn"]]):
+        points = start + np.linspace(0, 1, 50)[:, None] * (end - start)
+        cells = np.floor(points / MODULE_MM).astype(int)
+        burned[cells[:, 1], cells[:, 0]] = True
+    assert not (burned & keepout).any()
+    assert not (burned & ~modules).any()
+    if line_mm:
+        # With one pass per module a lone module is a zero-length dot, which parse_gcode does not count
+        assert np.array_equal(burned, modules & ~keepout)
@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+from qr_module import (generate_qr_content, encode_compact_payload, decode_compact_payload, decode_qr_content,
+                       COMPACT_PREFIX, BASE45_CHARSET)
+
+PAYLOAD = {
+    "uid": "UID00001234", "item_type": "elastic rail clip", "vendor": "Acme Rail Works", "lot": "LOT-7",
+    "supply_date": "2024-03-05", "warranty_end": "2029-03-05", "manufactor_date": "2024-01-31",
+    "manufactor_number": "MN-0042", "vendor_email": "qa@acme.example", "notes": "minor wear, re-torqued",
+    "risk": "Medium", "vendor_risk": "Low",
+}
+
+@pytest.mark.parametrize("compress", [None, True, False])
+def test_compact_payload_round_trip(compress):
+    text = encode_compact_payload(PAYLOAD, compress=compress)
+    assert text.startswith(COMPACT_PREFIX)
+    assert all(ch in BASE45_CHARSET for ch in text[len(COMPACT_PREFIX):])
+    assert decode_compact_payload(text) == PAYLOAD
+
+def test_compact_payload_keeps_values_that_do_not_pack():
+    # Unpadded or out-of-range dates and unknown risks fall back to raw text
+    payload = dict(PAYLOAD, supply_date="2024-3-5", warranty_end="1999-12-31", manufactor_date="",
+                   risk="Critical", notes="Gleisbefestigung geprüft ✓ " * 20, vendor_email=None)
+    assert decode_compact_payload(encode_compact_payload(payload)) == payload
+
+def test_decode_qr_content_reads_both_formats():
+    args = [PAYLOAD[field] for field in ("uid", "item_type", "vendor", "lot", "supply_date", "warranty_end",
+                                         "manufactor_date", "manufactor_number", "notes", "risk", "vendor_risk",
+                                         "vendor_email")]
+    full = generate_qr_content(*args, fmt="json")
+    compact = generate_qr_content(*args, fmt="compact")
+    assert len(compact) < len(full)
+    assert decode_qr_content(compact) == decode_qr_content(full) == json.loads(full)
+
+@pytest.mark.parametrize("text", ["RQ:", "RQ:A", "RQ:abc", "RQ:" + "Z" * 9, "XX:00"])
+def test_decode_compact_payload_rejects_malformed_input(text):
+    with pytest.raises(ValueError):
+        decode_compact_payload(text)
@@ -0,0 +1,54 @@
+import os
+import sqlite3
+
+import qr_module
+from qr_module import save_qr_image
+
+
+def add_fitting(uid):
+    conn = sqlite3.connect("fittings.db")
+    conn.execute("INSERT INTO fittings (uid, item_type, vendor, lot, qr_mode) VALUES (?, 'clip', 'Acme', 'L1', 'ref')",
+                 (uid,))
+    conn.commit()
+    conn.close()
+
+def stamps(paths):
+    return [(os.stat(p).st_ino, os.stat(p).st_mtime_ns) for p in paths]
+
+def count_writes(monkeypatch):
+    writes = []
+    write_atomic = qr_module._write_atomic
+    monkeypatch.setattr(qr_module, "_write_atomic", lambda path, data: (writes.append(path), write_atomic(path, data)))
+    return writes
+
+def test_unchanged_images_are_not_republished(app_client, monkeypatch):
+    paths = save_qr_image("PUB-1", "publish check")
+    before = stamps(paths)
+    writes = count_writes(monkeypatch)
+    assert save_qr_image("PUB-1", "publish check") == paths
+    assert writes == []
+    assert stamps(paths) == before
+
+def test_stale_or_missing_images_are_rewritten(app_client, monkeypatch):
+    display, engrave = save_qr_image("PUB-2", "publish check")
+    expected = [open(p, "rb").read() for p in (display, engrave)]
+    with open(display, "r+b") as f:   # same size, different bytes
+        f.seek(100)
+        f.write(b"\0" * 8)
+    os.remove(engrave)
+    writes = count_writes(monkeypatch)
+    save_qr_image("PUB-2", "publish check")
+    assert sorted(writes) == sorted([display, engrave])
+    assert [open(p, "rb").read() for p in (display, engrave)] == expected
+
+def test_repeat_send_leaves_published_images_alone(app_client, monkeypatch):
+    import app
+    monkeypatch.setattr(app, "stream_gcode_to_esp32", lambda first, lines, delay: (list(lines), (True, "ok"))[1])
+    add_fitting("PUB-3")
+    assert app_client.post("/send_gcode/PUB-3", data={"method": "raster"}).status_code == 302
+    paths = [os.path.join(qr_module.qr_dir, f"PUB-3_{kind}.png") for kind in ("display", "engrave")]
+    before = stamps(paths)
+    writes = count_writes(monkeypatch)
+    assert app_client.post("/send_gcode/PUB-3", data={"method": "raster"}).status_code == 302
+    assert not any(path.endswith(".png") for path in writes)
+    assert stamps(paths) == before
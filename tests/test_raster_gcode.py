@@ -0,0 +1,85 @@
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+import gcode_module
+import qr_module
+from sim_module import parse_gcode, render_burn
+
+
+def reference_qr_to_gcode_raster(img, laser_power=255, travel_speed=5000,
+                                 engrave_speed=1500, target_size_mm=20.0):
+    """The per-pixel generator that iter_raster_gcode replaced: one G1 per black pixel."""
+    _, bw = cv2.threshold(img, 127, 255, cv2.THRESH_BINARY)
+    h, w = bw.shape
+    mm_per_px = target_size_mm / w
+    gcode = ["G21 ; mm mode", "G90 ; absolute positioning", "M5  ; laser off", f"G0 F{travel_speed}"]
+    for row in range(h):
+        y_mm = round(row * mm_per_px, 3)
+        col_iter = range(w) if row % 2 == 0 else range(w - 1, -1, -1)
+        laser_on = False
+        for col in col_iter:
+            x_mm = round(col * mm_per_px, 3)
+            if bw[row, col] == 0:
+                if not laser_on:
+                    gcode.append(f"G0 X{x_mm} Y{y_mm} F{travel_speed}")
+                    gcode.append(f"M3 S{laser_power}")
+                    laser_on = True
+                gcode.append(f"G1 X{x_mm} Y{y_mm} F{engrave_speed}")
+            elif laser_on:
+                gcode.append("M5")
+                laser_on = False
+        if laser_on:
+            gcode.append("M5")
+    gcode.append("M5 ; ensure laser off")
+    gcode.append("G0 X0 Y0 ; go home")
+    return "\n".join(gcode)
+
+def burned_pixels(gcode_text, shape, target_size_mm=20.0):
+    """Pixels a raster job burns: every pixel the head covers, endpoints included, while the laser is on."""
+    mm_per_px = target_size_mm / shape[1]
+    burned = np.zeros(shape, dtype=bool)
+    col = row = 0
+    laser_on = False
+    for line in gcode_text.splitlines():
+        words = gcode_module.gcode_words(line)
+        values = {w[0]: float(w[1:]) for w in words if w[0] in "XY"}
+        if "M3" in words:
+            laser_on = True
+            burned[row, col] = True
+        elif "M5" in words:
+            laser_on = False
+        new_col = round(values.get("X", col * mm_per_px) / mm_per_px)
+        new_row = round(values.get("Y", row * mm_per_px) / mm_per_px)
+        if laser_on and "G1" in words:
+            assert new_row == row
+            burned[row, min(col, new_col):max(col, new_col) + 1] = True
+        col, row = new_col, new_row
+    return burned
+
+def assert_same_burn(img):
+    old = reference_qr_to_gcode_raster(img)
+    new = gcode_module.qr_to_gcode_raster(img)
+    dark = img <= 127
+    assert np.array_equal(burned_pixels(new, img.shape), dark)
+    assert np.array_equal(burned_pixels(old, img.shape), dark)
+    assert np.array_equal(render_burn(parse_gcode(new)), render_burn(parse_gcode(old)))
+
+@pytest.mark.parametrize("length,box_size", [(0, 10), (20, 4), (300, 2), (1000, 1)])
+def test_run_raster_burns_the_same_pixels_as_per_pixel_raster(length, box_size):
+    content = json.dumps({"uid": "RASTER", "notes": "x" * length})
+    assert_same_burn(qr_module.engrave_array(content, box_size=box_size))
+
+def test_runs_touching_the_image_edges():
+    # Taller than a band, with runs ending on the last column in even and odd
+    # rows, single-pixel runs on both edges and fully dark rows
+    h, w = gcode_module.RASTER_BAND_ROWS + 7, 37
+    img = np.full((h, w), 255, dtype=np.uint8)
+    img[::3, w - 5:] = 0
+    img[1::4, w - 1] = 0
+    img[2::5, 0] = 0
+    img[gcode_module.RASTER_BAND_ROWS - 1:gcode_module.RASTER_BAND_ROWS + 1] = 0
+    img[h - 1, 10:20] = 0
+    assert_same_burn(img)
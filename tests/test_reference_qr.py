@@ -0,0 +1,90 @@
+import sqlite3
+from urllib.parse import urlsplit
+
+import pytest
+from markupsafe import escape
+
+import qr_module
+from qr_module import generate_reference_qr_content
+
+
+def add_fitting(uid):
+    conn = sqlite3.connect("fittings.db")
+    conn.execute("INSERT INTO fittings (uid, item_type, vendor, lot, qr_mode) VALUES (?, 'clip', 'Acme', 'L1', 'ref')",
+                 (uid,))
+    conn.commit()
+    conn.close()
+
+def scan(client, qr_content):
+    """Follow a reference QR link the way a phone would, through the test client."""
+    url = urlsplit(qr_content)
+    return client.get(url.path, query_string=url.query, follow_redirects=True)
+
+@pytest.mark.parametrize("uid", ["RAIL-0042", "A%41B", "100%", "A.B", "..", "A+B", "rail-0042", "Ab 1"])
+def test_reference_qr_scans_back_to_its_fitting(app_client, uid):
+    add_fitting(uid)
+    qr_content = generate_reference_qr_content(uid)
+    response = scan(app_client, qr_content)
+    assert response.status_code == 200
+    assert str(escape(uid)).encode() in response.data
+
+def test_short_form_only_for_path_safe_uids(app_client):
+    assert "/S/RAIL-0042/" in generate_reference_qr_content("RAIL-0042")
+    for uid in ("A%41B", "A.B", "A+B", "rail-0042"):
+        assert "/scan/" in generate_reference_qr_content(uid)
+
+@pytest.fixture
+def key_file_dir(tmp_path, monkeypatch):
+    """No RAIL_QR_SIGNING_KEY and no cached key: the key comes from QR_SIGNING_KEY_FILE in tmp_path."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("RAIL_QR_SIGNING_KEY", raising=False)
+    monkeypatch.setattr(qr_module, "_signing_key", None)
+    return tmp_path
+
+def test_signing_key_file_created_once(key_file_dir, monkeypatch):
+    key = qr_module._qr_signing_key()
+    path = key_file_dir / qr_module.QR_SIGNING_KEY_FILE
+    assert len(key) == 64 and path.read_text() == key.decode()
+    assert path.stat().st_mode & 0o777 == 0o600
+    assert [p.name for p in key_file_dir.iterdir()] == [qr_module.QR_SIGNING_KEY_FILE]
+    monkeypatch.setattr(qr_module, "_signing_key", None)
+    assert qr_module._qr_signing_key() == key
+
+def test_signing_key_creation_race_uses_the_winners_key(key_file_dir, monkeypatch):
+    real_link = qr_module.os.link
+    def link_after_other_process(src, dst):
+        # Another worker finished creating the key between our exists() check and link
+        (key_file_dir / dst).write_text("other-workers-key")
+        real_link(src, dst)
+    monkeypatch.setattr(qr_module.os, "link", link_after_other_process)
+    assert qr_module._qr_signing_key() == b"other-workers-key"
+    assert [p.name for p in key_file_dir.iterdir()] == [qr_module.QR_SIGNING_KEY_FILE]
+
+def test_empty_signing_key_file_is_rejected(key_file_dir):
+    (key_file_dir / qr_module.QR_SIGNING_KEY_FILE).write_text("\n")
+    with pytest.raises(ValueError):
+        qr_module._qr_signing_key()
+    assert qr_module._signing_key is None
+
+def test_reference_tag_issue_and_verify(app_client):
+    tag = qr_module.qr_reference_tag("RAIL-0042")
+    assert len(tag) == 13 and tag == qr_module.qr_reference_tag("RAIL-0042")
+    assert qr_module.verify_reference_tag("RAIL-0042", tag)
+    assert qr_module.verify_reference_tag("RAIL-0042", tag.lower(), "1")
+    tampered = ("A" if tag[0] != "A" else "B") + tag[1:]
+    for uid, t, version in [("RAIL-0043", tag, 1), ("RAIL-0042", tampered, 1), ("RAIL-0042", tag, 2),
+                            ("RAIL-0042", tag, "x"), ("RAIL-0042", tag[:-1], 1), ("RAIL-0042", "É" * 13, 1),
+                            ("RAIL-0042", None, 1)]:
+        assert not qr_module.verify_reference_tag(uid, t, version)
+
+def test_scan_rejects_tampered_links(app_client):
+    add_fitting("RAIL-0042")
+    add_fitting("RAIL-0043")
+    tag = qr_module.qr_reference_tag("RAIL-0042")
+    tampered = ("A" if tag[0] != "A" else "B") + tag[1:]
+    assert app_client.get(f"/scan/RAIL-0042?v=1&t={tag}").status_code == 200
+    assert app_client.get(f"/scan/RAIL-0043?v=1&t={tag}").status_code == 403           # other UID
+    assert app_client.get(f"/scan/RAIL-0042?v=1&t={tampered}").status_code == 403      # altered tag
+    assert app_client.get(f"/scan/RAIL-0042?v=2&t={tag}").status_code == 403           # other version
+    assert app_client.get("/scan/RAIL-0042?v=1&t=%C3%89").status_code == 403
+    assert app_client.get(f"/S/RAIL-0043/1/{tag}", follow_redirects=True).status_code == 403
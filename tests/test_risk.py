@@ -0,0 +1,96 @@
+import shutil
+import sqlite3
+
+import ai_module
+from ai_module import get_risk_level, calculate_dates, get_failure_count, vendor_risk_from_failures
+
+
+def row_by_row_update_all_risks(db_path):
+    """The original per-fitting recompute, the reference update_all_risks must match."""
+    conn = sqlite3.connect(db_path)
+    c = conn.cursor()
+    c.execute("SELECT uid, warranty_end, notes, vendor_id, manufactor_date, supply_date FROM fittings")
+    for uid, warranty_end, notes, vendor_id, manufactor_date, supply_date in c.fetchall():
+        failure_count = get_failure_count(uid, db_path)
+        risk = get_risk_level({"uid": uid, "warranty_end": warranty_end, "notes": notes,
+                               "failure_count": failure_count})
+        inspection_date, repair_date = calculate_dates(manufactor_date, supply_date, warranty_end, risk)
+        c.execute("UPDATE fittings SET risk=?, risk_flag=?, failure_count=?, inspection_date=?, repair_date=? "
+                  "WHERE uid=?", (risk, 1 if risk == "High" else 0, failure_count, inspection_date, repair_date, uid))
+        c.execute("SELECT SUM(failure_count) FROM fittings WHERE vendor_id=?", (vendor_id,))
+        vendor_risk = vendor_risk_from_failures(c.fetchone()[0] or 0)
+        c.execute("UPDATE fittings SET vendor_risk=? WHERE vendor_id=?", (vendor_risk, vendor_id))
+    conn.commit()
+    conn.close()
+
+def risk_snapshot(db_path, table):
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute(f"SELECT uid, risk, risk_flag, inspection_date, repair_date, vendor_risk "
+                        f"FROM {table} ORDER BY uid").fetchall()
+    conn.close()
+    return rows
+
+def assert_matches_row_by_row(seed_db):
+    reference = seed_db.replace(".db", "_reference.db")
+    shutil.copy(seed_db, reference)
+    row_by_row_update_all_risks(reference)
+    ai_module.update_all_risks(seed_db, chunk_size=97)
+    assert risk_snapshot(seed_db, "fittings_live") == risk_snapshot(reference, "fittings")
+
+def test_update_all_risks_matches_row_by_row(make_fittings_db):
+    assert_matches_row_by_row(make_fittings_db(rows=600))
+
+def test_update_dirty_risks_matches_after_edits(make_fittings_db):
+    db = make_fittings_db(rows=300)
+    ai_module.update_all_risks(db)
+    conn = sqlite3.connect(db)
+    conn.execute("UPDATE fittings SET failure_count = 3 WHERE uid IN ('UID00000001', 'UID00000002')")
+    conn.execute("UPDATE fittings SET notes = 'corrosion spotted' WHERE uid = 'UID00000010'")
+    conn.commit()
+    conn.close()
+    assert ai_module.update_dirty_risks(db) == 3
+
+    reference = db.replace(".db", "_reference.db")
+    shutil.copy(db, reference)
+    row_by_row_update_all_risks(reference)
+    assert risk_snapshot(db, "fittings_live") == risk_snapshot(reference, "fittings_live")
+
+def test_update_all_risks_matches_row_by_row_unpadded_dates(make_fittings_db):
+    # strptime("%Y-%m-%d") also accepts "2024-3-5"; the SQL day columns must too
+    assert_matches_row_by_row(make_fittings_db(rows=600, unpadded_dates=True))
+
+def test_day_number_sql_matches_date_ordinals():
+    values = [None, "", " ", "2024-03-05", "2024-3-5", "2024-3-05", "2024-03- 5", "2024-3-  5",
+              "2024-10-1", "2024-1-10", "2024-13-1", "2024-0-1", "2024-00-10", "2024-1-0", "2024-1-32",
+              "2024-02-29", "2023-02-29", "2023-2-29", "2024-02-30", "2024-04-31", "2024-4-31",
+              "0000-01-01", "0001-01-01", "9999-12-31", "202-01-01", "20241-01-01", " 2024-01-01",
+              "2024-01-01 ", "2024-01-01T00:00", "2024/01/01", "2024-001-01", "2024-01-011", "2024--1-1",
+              "2024-1-3x", "2024-1", "2024-", "garbage"]
+    conn = sqlite3.connect(":memory:")
+    query = f"SELECT {ai_module._day_number_sql('v')} FROM (SELECT ? AS v)"
+    sql_days = [conn.execute(query, (value,)).fetchone()[0] for value in values]
+    conn.close()
+    assert sql_days == ai_module.date_ordinals(values).tolist()
+
+def test_ensure_risk_schema_rebuilds_stale_day_columns(make_fittings_db):
+    db = make_fittings_db(rows=200, unpadded_dates=True)
+    ai_module.update_all_risks(db)
+    conn = sqlite3.connect(db)
+    # A day column as an older parser generated it (canonical YYYY-MM-DD only)
+    conn.execute("DROP VIEW fittings_live")
+    conn.execute("DROP INDEX idx_fittings_warranty_end_day")
+    conn.execute("DROP INDEX idx_fittings_due")
+    conn.execute("DROP INDEX idx_fittings_vendor_due")
+    conn.execute("DROP INDEX idx_fittings_risk_due")
+    conn.execute("ALTER TABLE fittings DROP COLUMN next_inspection_day")
+    conn.execute("ALTER TABLE fittings DROP COLUMN warranty_end_day")
+    conn.execute("ALTER TABLE fittings ADD COLUMN warranty_end_day INTEGER GENERATED ALWAYS AS "
+                 "(CASE WHEN date(julianday(warranty_end)) IS warranty_end "
+                 "THEN CAST(julianday(warranty_end) - 1721424.5 AS INTEGER) ELSE -1 END) VIRTUAL")
+    conn.commit()
+    ai_module.ensure_risk_schema(conn)
+    warranty_ends, days = zip(*conn.execute("SELECT warranty_end, warranty_end_day FROM fittings"))
+    assert conn.execute("SELECT COUNT(*) FROM fittings WHERE risk_dirty = 0").fetchone()[0] == 0
+    conn.close()
+    assert list(days) == ai_module.date_ordinals(list(warranty_ends)).tolist()
+    assert ai_module.update_dirty_risks(db) == 200
@@ -0,0 +1,23 @@
+import json
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import gcode_module
+import qr_module
+
+VENDOR_CONTENT = json.dumps({"vendor_id": 7, "company_name": "Acme Rail", "vendor_risk": "High"})
+
+def test_vendor_engrave_array_matches_published_png(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = qr_module.save_vendor_qr_image(7, VENDOR_CONTENT)
+    published = np.array(Image.open(path).convert("L"))
+    assert np.array_equal(published, qr_module.vendor_engrave_array(VENDOR_CONTENT))
+
+@pytest.mark.parametrize("method", ["raster", "vector", "modules"])
+def test_vendor_gcode_needs_no_png(tmp_path, monkeypatch, method):
+    monkeypatch.chdir(tmp_path)
+    lines = list(gcode_module.iter_vendor_gcode(VENDOR_CONTENT, method))
+    assert any(line.startswith("G1") for line in lines)
+    assert list(tmp_path.iterdir()) == []
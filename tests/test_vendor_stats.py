@@ -0,0 +1,53 @@
+import sqlite3
+
+import ai_module
+
+
+def aggregate_from_fittings(conn):
+    """vendor_stats as a full GROUP BY over fittings would compute it."""
+    rows = conn.execute("""
+        SELECT vendor_id, COALESCE(SUM(failure_count), 0), SUM(COALESCE(risk_flag, 0) = 1), COUNT(*)
+        FROM fittings WHERE vendor_id IS NOT NULL GROUP BY vendor_id
+    """).fetchall()
+    return {vendor_id: (failures, high, count, ai_module.vendor_risk_from_failures(failures))
+            for vendor_id, failures, high, count in rows}
+
+def vendor_stats(conn):
+    # Vendors whose last fitting went away keep an all-zero row
+    rows = conn.execute("SELECT vendor_id, failure_sum, high_risk_count, fitting_count, tier FROM vendor_stats "
+                        "WHERE fitting_count > 0").fetchall()
+    return {vendor_id: tuple(values) for vendor_id, *values in rows}
+
+def test_vendor_stats_follow_updates_and_deletes(make_fittings_db):
+    db = make_fittings_db(rows=400, vendors=8)
+    ai_module.update_all_risks(db)
+    conn = sqlite3.connect(db)
+    assert vendor_stats(conn) == aggregate_from_fittings(conn)
+
+    conn.execute("UPDATE fittings SET failure_count = failure_count + 2 WHERE vendor_id = '3'")
+    conn.execute("UPDATE fittings SET failure_count = NULL WHERE uid = 'UID00000010'")
+    conn.execute("UPDATE fittings SET risk_flag = 1 - risk_flag WHERE uid LIKE 'UID000001%'")
+    conn.execute("UPDATE fittings SET vendor_id = '5' WHERE vendor_id = '4' AND uid < 'UID00000200'")
+    conn.execute("UPDATE fittings SET vendor_id = NULL WHERE uid = 'UID00000011'")
+    conn.execute("UPDATE fittings SET notes = 'checked' WHERE vendor_id = '1'")  # not a stats input
+    conn.commit()
+    assert vendor_stats(conn) == aggregate_from_fittings(conn)
+
+    conn.execute("DELETE FROM fittings WHERE vendor_id = '2'")
+    conn.execute("DELETE FROM fittings WHERE uid LIKE 'UID0000030%'")
+    conn.execute("INSERT INTO fittings (uid, vendor_id, failure_count, risk_flag) VALUES ('NEW1', '7', 4, 1)")
+    conn.commit()
+    assert vendor_stats(conn) == aggregate_from_fittings(conn)
+    assert ai_module.get_vendor_risk("2", db) == "Low"
+    conn.close()
+
+def test_fittings_live_reads_current_vendor_tier(make_fittings_db):
+    db = make_fittings_db(rows=50, vendors=2)
+    ai_module.update_all_risks(db)
+    conn = sqlite3.connect(db)
+    conn.execute("UPDATE fittings SET failure_count = 1 WHERE vendor_id = '0'")
+    conn.commit()
+    tiers = {vendor_risk for (vendor_risk,) in
+             conn.execute("SELECT vendor_risk FROM fittings_live WHERE vendor_id = '0'")}
+    conn.close()
+    assert tiers == {"High"}